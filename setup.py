@@ -17,10 +17,14 @@ setup(
         'test': [
             'pylint',
             'requests==2.20.0',
-            'nose'
+            'nose',
+            'aiohttp'
         ],
         'dev': [
             'ipdb'
+        ],
+        'async': [
+            'aiohttp'
         ]
     },
     entry_points="""
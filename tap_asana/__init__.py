@@ -5,14 +5,22 @@ import json
 import time
 import math
 import functools
-import asana
+import multiprocessing
+import queue
+import traceback
 import singer
 from singer import utils
 from singer import metadata
-from singer import Transformer
 from tap_asana.asana import Asana
-from tap_asana.context import Context
-import tap_asana.streams  # Load stream objects into Context
+from tap_asana.context import Context, ResourceDirectory
+from tap_asana.profiler import Profiler
+from tap_asana.rate_limit import RateLimiter
+from tap_asana.request_metrics import RequestMetrics
+from tap_asana.response_cache import ResponseCache
+from tap_asana.transform import StreamTransformer, ExtractionClock
+from tap_asana.writer import Writer, QueueWriter
+from tap_asana.streams import STREAM_NAMES
+from tap_asana.streams.base import Stream
 
 REQUIRED_CONFIG_KEYS = [
     "start_date",
@@ -25,28 +33,19 @@ REQUIRED_CONFIG_KEYS = [
 
 LOGGER = singer.get_logger()
 
+# Maximum number of messages buffered between stream worker processes and
+# the writer when `parallel_streams` is used
+PROCESS_QUEUE_SIZE = 10000
+
 
 def get_abs_path(path):
     return os.path.join(os.path.dirname(os.path.realpath(__file__)), path)
 
 
-# Load schemas from schemas folder
-def load_schemas():
-    """Load schemas for catalog"""
-    schemas = {}
-
-    # This schema represents many of the currency values as JSON schema
-    # 'number's, which may result in lost precision.
-    for filename in os.listdir(get_abs_path("schemas")):
-        path = get_abs_path("schemas") + "/" + filename
-        schema_name = filename.replace(".json", "")
-        with open(path) as file:  # pylint: disable=unspecified-encoding
-            try:
-                schemas[schema_name] = json.load(file)
-            except ValueError:
-                pass
-
-    return schemas
+def load_schema(schema_name):
+    """Load the schema of one stream"""
+    with open(get_abs_path(f"schemas/{schema_name}.json")) as file:  # pylint: disable=unspecified-encoding
+        return json.load(file)
 
 
 def get_discovery_metadata(stream, schema):
@@ -78,15 +77,13 @@ def get_discovery_metadata(stream, schema):
 def discover():
     """Discover logic for tap"""
     LOGGER.info("Starting discover")
-    raw_schemas = load_schemas()
 
     streams = []
 
     refs = {}
-    for schema_name, schema in raw_schemas.items():
-        if schema_name not in Context.stream_objects:
-            continue
-
+    # Only the schemas of the tap's streams are read
+    for schema_name in STREAM_NAMES:
+        schema = load_schema(schema_name)
         stream = Context.stream_objects[schema_name]()
 
         # Create and add catalog entry
@@ -120,42 +117,203 @@ def shuffle_streams(stream_name):
     Context.catalog["streams"] = top_half + bottom_half
 
 
+def get_asana_client(config):
+    """Create the Asana client from the credentials in the config"""
+    creds = {
+        "client_id": config["client_id"],
+        "client_secret": config["client_secret"],
+        "redirect_uri": config["redirect_uri"],
+        "refresh_token": config["refresh_token"],
+    }
+    return Asana(base_url=config.get("base_url"), **creds)
+
+
+def sync_stream(catalog_entry):
+    """Sync one stream, writing its records through Context.writer"""
+    stream_id = catalog_entry["tap_stream_id"]
+    stream = Context.stream_objects[stream_id]()
+    Context.request_metrics.stream = stream_id
+    started = time.monotonic()
+
+    record_schema = catalog_entry["schema"]
+    record_metadata = metadata.to_map(catalog_entry["metadata"])
+    clock = ExtractionClock()
+    with StreamTransformer(record_schema, record_metadata) as transformer:
+        transform_record = transformer.transform_record
+        write_record = Context.writer.write_record
+        profiler = Context.profiler
+        if profiler is not None:
+            profiler.stream = stream_id
+            transform_record = profiler.timed("transform", transform_record)
+            # The records of a worker process are emitted, and timed, by the parent
+            if not isinstance(Context.writer, QueueWriter):
+                write_record = profiler.timed("emit", write_record)
+        for rec in stream.sync():
+            rec = transform_record(rec)
+            write_record(stream_id, rec, time_extracted=clock.now())
+            Context.counts[stream_id] += 1
+    if profiler is not None:
+        profiler.add("wall", time.monotonic() - started)
+
+
+class WorkerError(Exception):
+    """A stream's worker process failed"""
+
+
+def sync_stream_worker(catalog_entry, parent, messages):
+    """
+    Sync one stream in a worker process, forwarding its messages to the parent's
+    writer. `parent` holds the config, state, catalog and resource directory
+    listings of the parent process.
+    """
+    stream_id = catalog_entry["tap_stream_id"]
+    config = parent["config"]
+    try:
+        Context.config = config
+        Context.state = parent["state"]
+        Context.catalog = parent["catalog"]
+        Context.tap_start = parent["tap_start"]
+        Context.stream_map = {}
+        # Each worker process gets its share of the request budget
+        Context.rate_limiter = RateLimiter.from_config(config, share=int(config["parallel_streams"]))
+        Context.response_cache = ResponseCache.from_config(config)
+        Context.request_metrics = RequestMetrics()
+        Context.profiler = Profiler.from_config(config)
+        if Context.profiler is not None:
+            Context.profiler.start()
+        Context.asana = get_asana_client(config)
+        Context.directory = ResourceDirectory(Context.asana, *parent["directory"])
+        Context.writer = QueueWriter.from_config(config, messages, stream_id)
+        Context.counts[stream_id] = 0
+        sync_stream(catalog_entry)
+        Context.writer.flush()
+        Context.asana.transport.log_stats()
+        messages.put(("metrics", stream_id, Context.request_metrics.endpoints))
+        if Context.profiler is not None:
+            path = Context.profiler.stop(stream_id)
+            messages.put(("profile", stream_id, (dict(Context.profiler.phases), path)))
+        messages.put(("done", stream_id, None))
+    except Exception:  # pylint: disable=broad-except
+        messages.put(("error", stream_id, traceback.format_exc()))
+
+
+def sync_in_processes(catalog_entries, processes):
+    """
+    Sync the streams in up to `processes` worker processes at a time. The workers
+    send their records and bookmarks to this process, the only one writing to
+    stdout. A stream's bookmark arrives after the records it covers, so the
+    merged state never runs ahead of the records already written.
+    """
+    # List the shared workspaces and projects once for all workers
+    stream = Stream()
+    workspaces = stream.get_workspaces()
+    project_ids = None
+    if any(Context.stream_objects[entry["tap_stream_id"]].uses_project_ids for entry in catalog_entries):
+        project_ids = stream.get_project_ids()
+    parent = {"config": Context.config, "state": Context.state, "catalog": Context.catalog,
+              "tap_start": Context.tap_start, "directory": (workspaces, project_ids)}
+
+    context = multiprocessing.get_context()
+    messages = context.Queue(maxsize=PROCESS_QUEUE_SIZE)
+    waiting = list(catalog_entries)
+    running = {}
+    try:
+        while waiting or running:
+            while waiting and len(running) < processes:
+                catalog_entry = waiting.pop(0)
+                LOGGER.info("Syncing stream: %s", catalog_entry["tap_stream_id"])
+                process = context.Process(target=sync_stream_worker, args=(catalog_entry, parent, messages),
+                                          daemon=True)
+                process.start()
+                running[catalog_entry["tap_stream_id"]] = process
+
+            try:
+                message = messages.get(timeout=1)
+            except queue.Empty:
+                for stream_id, process in running.items():
+                    if process.exitcode not in (None, 0):
+                        raise WorkerError(
+                            f"Worker process of stream {stream_id} exited with code {process.exitcode}") from None
+                continue
+            handle_worker_message(message, running)
+    finally:
+        for process in running.values():
+            process.terminate()
+
+
+def handle_worker_message(message, running):
+    """Write or merge a message of a worker process, `running` holds the running workers by stream"""
+    kind, stream_id, value = message
+    if kind == "record":
+        record, extraction_time = value
+        if Context.profiler is not None:
+            with Context.profiler.phase("emit", stream_id):
+                Context.writer.write_record(stream_id, record, time_extracted=extraction_time)
+        else:
+            Context.writer.write_record(stream_id, record, time_extracted=extraction_time)
+        Context.counts[stream_id] += 1
+    elif kind == "state":
+        Context.state["bookmarks"][stream_id] = value
+        Context.writer.update_state(Context.state)
+    elif kind == "metrics":
+        Context.request_metrics.merge(value)
+    elif kind == "profile":
+        Context.profiler.merge(*value)
+    elif kind == "done":
+        running.pop(stream_id).join()
+        Context.writer.write_state(Context.state)
+    else:
+        raise WorkerError(f"Stream {stream_id} failed in its worker process:\n{value}")
+
+
 def sync():
     """Sync logic for tap"""
     # Emit all schemas first so we have them for child streams
     for stream in Context.catalog["streams"]:
         if Context.is_selected(stream["tap_stream_id"]):
-            singer.write_schema(stream["tap_stream_id"],
-                                stream["schema"],
-                                stream["key_properties"])
+            Context.writer.write_schema(stream["tap_stream_id"],
+                                        stream["schema"],
+                                        stream["key_properties"])
             Context.counts[stream["tap_stream_id"]] = 0
 
-    # Loop over streams in catalog
-    for catalog_entry in Context.catalog["streams"]:
-        stream_id = catalog_entry["tap_stream_id"]
-        stream = Context.stream_objects[stream_id]()
+    if not Context.state.get('bookmarks'):
+        Context.state['bookmarks'] = {}
+
+    # Sync independent streams in worker processes if configured
+    parallel_streams = int(Context.config.get("parallel_streams") or 1)
+    if parallel_streams > 1:
+        catalog_entries = []
+        for catalog_entry in Context.catalog["streams"]:
+            if Context.is_selected(catalog_entry["tap_stream_id"]):
+                catalog_entries.append(catalog_entry)
+            else:
+                LOGGER.info("Skipping stream: %s", catalog_entry["tap_stream_id"])
+        sync_in_processes(catalog_entries, parallel_streams)
+        Context.state["bookmarks"].pop("currently_sync_stream", None)
+        Context.writer.write_state(Context.state)
+    else:
+        # Resume an interrupted sync from the stream it was syncing
+        currently_sync_stream = Context.state["bookmarks"].get("currently_sync_stream")
+        if currently_sync_stream:
+            LOGGER.info("Resuming sync from stream: %s", currently_sync_stream)
+            shuffle_streams(currently_sync_stream)
+
+        # Loop over streams in catalog
+        for catalog_entry in Context.catalog["streams"]:
+            stream_id = catalog_entry["tap_stream_id"]
 
-        if not Context.is_selected(stream_id):
-            LOGGER.info("Skipping stream: %s", stream_id)
-            continue
+            if not Context.is_selected(stream_id):
+                LOGGER.info("Skipping stream: %s", stream_id)
+                continue
 
-        LOGGER.info("Syncing stream: %s", stream_id)
+            LOGGER.info("Syncing stream: %s", stream_id)
 
-        if not Context.state.get('bookmarks'):
-            Context.state['bookmarks'] = {}
-        Context.state['bookmarks']['currently_sync_stream'] = stream_id
+            Context.state['bookmarks']['currently_sync_stream'] = stream_id
 
-        with Transformer() as transformer:
-            for rec in stream.sync():
-                extraction_time = singer.utils.now()
-                record_schema = catalog_entry["schema"]
-                record_metadata = metadata.to_map(catalog_entry["metadata"])
-                rec = transformer.transform(rec, record_schema, record_metadata)
-                singer.write_record(stream_id, rec, time_extracted=extraction_time)
-                Context.counts[stream_id] += 1
+            sync_stream(catalog_entry)
 
-        Context.state["bookmarks"].pop("currently_sync_stream")
-        singer.write_state(Context.state)
+            Context.state["bookmarks"].pop("currently_sync_stream")
+            Context.writer.write_state(Context.state)
 
     LOGGER.info("----------------------")
     for stream_id, stream_count in Context.counts.items():
@@ -172,30 +330,41 @@ def main():
     args = utils.parse_args(REQUIRED_CONFIG_KEYS)
 
     # Set context.
-    creds = {
-        "client_id": args.config["client_id"],
-        "client_secret": args.config["client_secret"],
-        "redirect_uri": args.config["redirect_uri"],
-        "refresh_token": args.config["refresh_token"],
-    }
-
     # As we passed 'request_timeout', we need to add a whole 'args.config' rather than adding 'creds'
     Context.config = args.config
     Context.state = args.state
-    Context.asana = Asana(**creds)
+    Context.rate_limiter = RateLimiter.from_config(args.config)
+    Context.response_cache = ResponseCache.from_config(args.config)
+    Context.writer = Writer.from_config(args.config)
 
     # If discover flag was passed, run discovery mode and dump output to stdout
     if args.discover:
+        # Discovery reads the schemas only, without creating the client (and refreshing its token)
         catalog = discover()
         print(json.dumps(catalog, indent=2))
     # Otherwise run in sync mode
     else:
+        Context.asana = get_asana_client(args.config)
         Context.tap_start = utils.now()
         if args.catalog:
             Context.catalog = args.catalog.to_dict()
         else:
             Context.catalog = discover()
-        sync()
+        Context.profiler = Profiler.from_config(args.config)
+        if Context.profiler is not None:
+            Context.profiler.start()
+        try:
+            sync()
+        finally:
+            # Write the records buffered since the last state
+            Context.writer.flush()
+            Context.asana.transport.log_stats()
+            Context.request_metrics.log()
+            if args.config.get("request_metrics_path"):
+                Context.request_metrics.write_summary(args.config["request_metrics_path"])
+            if Context.profiler is not None:
+                Context.profiler.stop()
+                Context.profiler.report()
 
 
 if __name__ == "__main__":
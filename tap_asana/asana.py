@@ -1,5 +1,9 @@
+from urllib.parse import urljoin
+
 import asana
 import singer
+from tap_asana.context import Context
+from tap_asana.transport import TransportAdapter, ACCEPT_ENCODING
 
 LOGGER = singer.get_logger()
 
@@ -11,7 +15,7 @@ class Asana():
     """Base class for tap-asana"""
 
     def __init__(
-        self, client_id, client_secret, redirect_uri, refresh_token, access_token=None
+        self, client_id, client_secret, redirect_uri, refresh_token, access_token=None, base_url=None
     ):  # pylint: disable=too-many-arguments
         self.client_id = client_id
         self.client_secret = client_secret
@@ -19,6 +23,20 @@ class Asana():
         self.refresh_token = refresh_token
         self.access_token = access_token
         self._client = self._oauth_auth() or self._access_token_auth()
+        if base_url:
+            # The OAuth token endpoint is on the same host as the API
+            self._client.options["base_url"] = base_url
+            self._client.session.token_url = urljoin(base_url, "/-/oauth_token")
+        # Send every request, including token refreshes, through the shared rate limiter
+        # and one pool of kept-alive connections used by all streams
+        self.transport = TransportAdapter(lambda: Context.rate_limiter, lambda: Context.response_cache,
+                                          lambda: Context.request_metrics, lambda: Context.profiler)
+        self._client.session.mount("https://", self.transport)
+        self._client.session.mount("http://", self.transport)
+        self._client.session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        # No SDK retries: `asana_error_handling` retries every request, so the
+        # retries share one budget and their waits are counted in the request metrics
+        self._client.options["max_retries"] = 0
         self.refresh_access_token()
 
     def _oauth_auth(self):
@@ -0,0 +1,277 @@
+import asyncio
+import collections
+import time
+
+import backoff
+import requests
+import simplejson
+import singer
+from asana.client import STATUS_MAP
+from asana.error import (
+    NoAuthorizationError,
+    RetryableAsanaError,
+    InvalidTokenError,
+    RateLimitEnforcedError,
+    ServerError,
+)
+from oauthlib.oauth2 import TokenExpiredError
+from tap_asana.concurrency import WorkItems
+from tap_asana.context import Context
+from tap_asana.rate_limit import MAX_CONCURRENT_REQUESTS
+from tap_asana.streams.base import (
+    FACTOR,
+    MAX_RETRIES,
+    invalid_token_handler,
+    leaky_bucket_handler,
+    retry_after_wait_gen,
+    retry_handler,
+)
+from tap_asana.transport import ACCEPT_ENCODING
+
+try:
+    import aiohttp
+except ImportError:
+    # Optional dependency, installed with `pip install tap-asana[async]`
+    aiohttp = None
+
+LOGGER = singer.get_logger()
+
+# Seconds between checks for a free request slot, which requests of other threads may free
+SLOT_POLL_INTERVAL = 0.1
+
+_PAGE = "page"
+_DONE = "done"
+_ERROR = "error"
+
+
+def get_backoff(tries, kind, factor=1):
+    """
+    Count a failed try of `kind` and return the wait before the next one, a
+    jittered exponential backoff like backoff.expo's, or None after MAX_RETRIES tries
+    """
+    tries[kind] += 1
+    if tries[kind] >= MAX_RETRIES:
+        return None
+    return backoff.full_jitter(factor * 2 ** (tries[kind] - 1))
+
+
+class AsyncResponse():  # pylint: disable=too-few-public-methods
+    """The parts of a requests Response read by the SDK's errors and the tap's error handling"""
+
+    def __init__(self, status_code, headers, body):
+        self.status_code = status_code
+        # `ServerError` reads `status`
+        self.status = status_code
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return simplejson.loads(self.body)
+
+
+class AsyncEngine():
+    """
+    Fetches collections of the Asana API with aiohttp, running every
+    pagination as a coroutine of one event loop in the calling thread.
+
+    Requests are sent to the base URL of the SDK client in `Context.asana`,
+    with its access token, and retried like `asana_error_handling` retries
+    the SDK's requests, refreshing the token on a 401. They take a slot of
+    the shared rate limiter's adaptive concurrency limit, whose outcome
+    adjusts the limit, and one of its tokens. Without a rate limiter at most
+    MAX_CONCURRENT_REQUESTS are in flight.
+    """
+    # Settings of the SDK client and the objects living on the event loop
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, request_timeout):
+        if aiohttp is None:
+            raise ImportError("The async engine requires aiohttp, install it with `pip install tap-asana[async]`")
+        client = Context.asana.client
+        self.base_url = client.options["base_url"]
+        self.page_size = client.options["page_size"]
+        self.headers = dict(client.headers, **{"Accept-Encoding": ACCEPT_ENCODING})
+        self.request_timeout = request_timeout
+        self.limiter = Context.rate_limiter
+        if self.limiter is not None:
+            self.max_concurrent = self.limiter.concurrency.max_limit
+        else:
+            self.max_concurrent = MAX_CONCURRENT_REQUESTS
+        self.session = None
+        self.semaphore = None
+        self.slot_freed = None
+        self.results = None
+
+    async def open(self):
+        # Created here, on the running loop: before Python 3.10, asyncio
+        # primitives bind to the loop current when they are created
+        connector = aiohttp.TCPConnector(limit=self.max_concurrent)
+        self.session = aiohttp.ClientSession(connector=connector, auto_decompress=True)
+        self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        self.slot_freed = asyncio.Event()
+        self.results = asyncio.Queue()
+
+    async def stop(self, tasks):
+        """Cancel the paginations still running and close the session"""
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.session is not None:
+            await self.session.close()
+
+    async def get(self, path, params):
+        """
+        Return the full payload of a GET request. Like the decorators of
+        `asana_error_handling`, a 429 is retried after its Retry-After delay
+        and timeouts, token errors and 5xx errors are retried with an
+        exponential backoff up to MAX_RETRIES tries each.
+        """
+        tries = collections.Counter()
+        while True:
+            try:
+                return await self.send(path, params)
+            except RateLimitEnforcedError:
+                wait = next(retry_after_wait_gen())
+                leaky_bucket_handler({"wait": wait})
+            except requests.Timeout:
+                wait = get_backoff(tries, "timeout", FACTOR)
+                if wait is None:
+                    raise
+            except (InvalidTokenError, NoAuthorizationError, TokenExpiredError):
+                wait = get_backoff(tries, "token")
+                if wait is None:
+                    raise
+                invalid_token_handler({"tries": tries["token"]})
+            except (simplejson.scanner.JSONDecodeError, RetryableAsanaError):
+                wait = get_backoff(tries, "server")
+                if wait is None:
+                    raise
+                retry_handler({"tries": tries["server"]})
+            Context.request_metrics.add_backoff(wait, path)
+            await asyncio.sleep(wait)
+
+    async def acquire(self):
+        """Wait for a request slot and a token of the rate limiter, like `RateLimiter.acquire`"""
+        if self.limiter is None:
+            await self.semaphore.acquire()
+            return
+        while True:
+            # Cleared first, so a slot freed after the check wakes this request up
+            self.slot_freed.clear()
+            if self.limiter.concurrency.try_acquire():
+                break
+            try:
+                await asyncio.wait_for(self.slot_freed.wait(), SLOT_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+        wait = self.limiter.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def release(self, sent_at, status_code):
+        """Free the request slot, adjusting the concurrency limit to the request's outcome"""
+        if self.limiter is None:
+            self.semaphore.release()
+            return
+        self.limiter.release(sent_at, status_code)
+        self.slot_freed.set()
+
+    async def send(self, path, params):
+        """Send a GET request and return its full payload, raising the SDK's error for a failed request"""
+        queued_at = time.monotonic()
+        await self.acquire()
+        # Read at every try, as a retried 401 refreshes it
+        headers = dict(self.headers, Authorization=f"Bearer {Context.asana.client.session.access_token}")
+        sent_at = time.monotonic()
+        status_code = None
+        bytes_received = 0
+        try:
+            async with self.session.get(self.base_url + path,
+                                        params={key: str(value) for key, value in params.items()},
+                                        headers=headers,
+                                        timeout=aiohttp.ClientTimeout(total=self.request_timeout)) as resp:
+                response = AsyncResponse(resp.status, resp.headers, await resp.read())
+                status_code = response.status_code
+                # Bytes before decompression, where this aiohttp version counts them
+                bytes_received = getattr(resp.content, "total_raw_bytes", resp.content.total_bytes)
+        except asyncio.TimeoutError as exc:
+            raise requests.Timeout(f"Timed out requesting {path}") from exc
+        except aiohttp.ClientError as exc:
+            raise requests.ConnectionError(str(exc)) from exc
+        finally:
+            self.release(sent_at, status_code)
+            Context.request_metrics.add_request(path, time.monotonic() - sent_at, sent_at - queued_at,
+                                                status_code, bytes_received)
+            if Context.profiler is not None:
+                Context.profiler.add("api_wait", time.monotonic() - queued_at)
+
+        if response.status_code == 429 and self.limiter is not None and response.headers.get("Retry-After"):
+            self.limiter.pause(float(response.headers["Retry-After"]))
+        if response.status_code in STATUS_MAP:
+            raise STATUS_MAP[response.status_code](response)
+        if 500 <= response.status_code < 600:
+            raise ServerError(response)
+        if Context.profiler is not None:
+            with Context.profiler.phase("json_decode"):
+                return response.json()
+        return response.json()
+
+    async def get_pages(self, path, params):
+        """Yield the data of every page of the collection at `path`"""
+        params = dict(params, limit=self.page_size)
+        while True:
+            payload = await self.get(path, params)
+            yield payload["data"]
+            if not payload.get("next_page"):
+                return
+            params["offset"] = payload["next_page"]["offset"]
+
+    def fan_out(self, get_request, items, max_paginations):
+        """
+        Yield `(item, record)` for every record of the collection whose path and
+        query params `get_request(item)` returns, for each item, paginating up to
+        `max_paginations` collections at a time. `items` is an iterable or
+        WorkItems, whose `expand` and `on_done` are called as with
+        `concurrency.fan_out`: `expand` with every `(item, record)`.
+
+        Records of one item keep their order and records of different items
+        interleave. The event loop runs only while the caller waits for the next
+        page, so the pages fetched ahead stay bounded by the paginations running.
+        """
+        work_items = items if isinstance(items, WorkItems) else WorkItems(items)
+        loop = asyncio.new_event_loop()
+        running = set()
+
+        async def paginate(item):
+            try:
+                path, params = get_request(item)
+                async for page in self.get_pages(path, params):
+                    self.results.put_nowait((_PAGE, item, page))
+                self.results.put_nowait((_DONE, item, None))
+            except Exception as exc:  # pylint: disable=broad-except
+                self.results.put_nowait((_ERROR, item, exc))
+
+        try:
+            loop.run_until_complete(self.open())
+            while True:
+                while len(running) < max_paginations:
+                    item = work_items.take()
+                    if item is None:
+                        break
+                    task = loop.create_task(paginate(item))
+                    running.add(task)
+                    task.add_done_callback(running.discard)
+                if not running and self.results.empty():
+                    break
+                kind, item, value = loop.run_until_complete(self.results.get())
+                if kind == _ERROR:
+                    raise value
+                if kind == _DONE:
+                    work_items.done(item)
+                    continue
+                for record in value:
+                    work_items.add_record((item, record))
+                    yield item, record
+        finally:
+            loop.run_until_complete(self.stop(running))
+            loop.close()
@@ -0,0 +1,92 @@
+import collections
+
+import singer
+from singer import utils
+from tap_asana.context import Context
+
+LOGGER = singer.get_logger()
+
+
+class ProjectCheckpoint():
+    """
+    Progress of a stream's sync over the projects, kept in the stream's
+    bookmark under "checkpoint".
+
+    A project is completed once its listing is done and every unit of work
+    added for it (e.g. a task whose stories are fetched) is done. Callers
+    report this from the thread consuming the records, after the project's
+    records were written, so a checkpoint never runs ahead of the records.
+    The completed projects are saved with the bookmark the sync started from,
+    and a restarted sync from the same bookmark skips them.
+
+    The skipped projects are not listed again, so their changes made after
+    the interrupted sync started are not seen. The start time of the first
+    interrupted sync is saved too, and the bookmark of a resumed sync is
+    capped at it (see `cap`).
+    """
+
+    def __init__(self, stream_name, bookmark):
+        self.stream_name = stream_name
+        self.bookmark = bookmark
+        saved = singer.get_bookmark(Context.state, stream_name, "checkpoint") or {}
+        if saved.get("bookmark") == bookmark:
+            self.completed = list(saved.get("completed_projects", []))
+            # A checkpoint saved without its start time is only safe to resume up to its bookmark
+            self.started_at = saved.get("started_at") or bookmark
+        else:
+            self.completed = []
+            self.started_at = utils.strftime(Context.tap_start or utils.now())
+        # The projects completed by the interrupted sync, skipped by this one
+        self.skipped = set(self.completed)
+        self.outstanding = collections.Counter()
+        self.listed_projects = set()
+
+    def get_remaining(self, project_ids):
+        """Return the projects not completed by an interrupted sync from the same bookmark"""
+        remaining = [project_id for project_id in project_ids if project_id not in self.skipped]
+        if len(remaining) < len(project_ids):
+            LOGGER.info("Resuming %s: skipping %s projects completed by the interrupted sync",
+                        self.stream_name, len(project_ids) - len(remaining))
+        return remaining
+
+    def add(self, project_id):
+        """Count one more unit of work of the project"""
+        self.outstanding[project_id] += 1
+
+    def done(self, project_id):
+        """Count one unit of work of the project as done"""
+        self.outstanding[project_id] -= 1
+        self.check(project_id)
+
+    def listed(self, project_id):
+        """Mark the listing of the project's work as done"""
+        self.listed_projects.add(project_id)
+        self.check(project_id)
+
+    def check(self, project_id):
+        if project_id in self.listed_projects and self.outstanding[project_id] <= 0:
+            self.listed_projects.discard(project_id)
+            del self.outstanding[project_id]
+            self.complete(project_id)
+
+    def complete(self, project_id):
+        self.completed.append(project_id)
+        singer.write_bookmark(Context.state, self.stream_name, "checkpoint", {
+            "bookmark": self.bookmark,
+            "started_at": self.started_at,
+            "completed_projects": self.completed,
+        })
+        Context.writer.update_state(Context.state)
+
+    def cap(self, session_bookmark):
+        """
+        Return the bookmark to save at the end of the sync: `session_bookmark`,
+        or the start of the interrupted sync if earlier and projects were skipped
+        """
+        if not self.skipped:
+            return session_bookmark
+        return min(session_bookmark, utils.strptime_to_utc(self.started_at))
+
+    def finish(self):
+        """Drop the checkpoint once every project is synced"""
+        Context.state.get("bookmarks", {}).get(self.stream_name, {}).pop("checkpoint", None)
@@ -0,0 +1,195 @@
+import collections
+import functools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import singer
+
+LOGGER = singer.get_logger()
+
+# Seconds a worker waits on a full result queue before re-checking whether
+# the consumer has gone away
+PUT_TIMEOUT = 0.5
+
+_RECORD = "record"
+_DONE = "done"
+_ERROR = "error"
+
+
+def _wait_until_stopped(stopped, attempt):
+    """
+    Call `attempt` until it returns without timing out, unless `stopped` is set
+    first. Return whether the attempt succeeded.
+    """
+    while not stopped.is_set():
+        try:
+            result = attempt()
+        except queue.Full:
+            continue
+        if result is not False:
+            return True
+    return False
+
+
+class WorkItems():
+    """
+    The items of a fan-out, taken one at a time or in lists of up to
+    `batch_size` items.
+
+    When `expand` is given it is called with every record and the items it
+    returns are taken next, before any further input item. This walks trees
+    breadth-first without recursion.
+
+    When `on_done` is given it is called with every item (or batch) once all
+    of its records have been yielded.
+    """
+
+    def __init__(self, items, expand=None, batch_size=None, on_done=None):
+        self.items = iter(items)
+        self.pending = collections.deque()
+        self.expand = expand
+        self.batch_size = batch_size
+        self.on_done = on_done
+
+    def take(self):
+        """Return the next item or batch of items, or None when none is left"""
+        batch = []
+        while len(batch) < (self.batch_size or 1):
+            if self.pending:
+                batch.append(self.pending.popleft())
+                continue
+            try:
+                batch.append(next(self.items))
+            except StopIteration:
+                break
+        if not batch:
+            return None
+        return batch if self.batch_size else batch[0]
+
+    def add_record(self, record):
+        """Queue the items the record expands to"""
+        if self.expand:
+            self.pending.extend(self.expand(record))
+
+    def done(self, work_item):
+        if self.on_done:
+            self.on_done(work_item)
+
+
+def fan_out(fetch, items, max_workers, get_limit=None):
+    """
+    Yield every record produced by `fetch(item)` for each item, running at most
+    `max_workers` fetches at a time. `items` is an iterable or WorkItems.
+    `get_limit`, if given, returns how many fetches may run at the moment, up to
+    `max_workers`, e.g. an adaptive concurrency limit.
+
+    Records are yielded in the calling thread as soon as a worker produces them.
+    Records of one item keep their order, records of different items interleave.
+    With `max_workers` of 1 the items are fetched serially in the calling thread.
+    The `on_done` of WorkItems is called in the calling thread.
+    """
+    work_items = items if isinstance(items, WorkItems) else WorkItems(items)
+    if max_workers <= 1:
+        return _fan_out_serially(fetch, work_items)
+    return _fan_out_in_threads(fetch, work_items, max_workers, get_limit)
+
+
+def _fan_out_serially(fetch, work_items):
+    while True:
+        work_item = work_items.take()
+        if work_item is None:
+            return
+        for record in fetch(work_item):
+            work_items.add_record(record)
+            yield record
+        work_items.done(work_item)
+
+
+def _fan_out_in_threads(fetch, work_items, max_workers, get_limit):
+    # Bound the buffered records so fast workers can't outrun the consumer
+    results = queue.Queue(maxsize=max_workers * 100)
+    stopped = threading.Event()
+
+    def put(message):
+        return _wait_until_stopped(stopped, functools.partial(results.put, message, timeout=PUT_TIMEOUT))
+
+    def work(item):
+        try:
+            for record in fetch(item):
+                if not put((_RECORD, record)):
+                    return
+            put((_DONE, item))
+        except Exception as exc:  # pylint: disable=broad-except
+            put((_ERROR, exc))
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    in_flight = 0
+    try:
+        while True:
+            limit = max_workers if get_limit is None else max(1, min(max_workers, get_limit()))
+            while in_flight < limit:
+                work_item = work_items.take()
+                if work_item is None:
+                    break
+                executor.submit(work, work_item)
+                in_flight += 1
+
+            if in_flight == 0:
+                return
+
+            kind, value = results.get()
+            if kind == _RECORD:
+                work_items.add_record(value)
+                yield value
+            elif kind == _DONE:
+                in_flight -= 1
+                work_items.done(value)
+            else:
+                raise value
+    finally:
+        stopped.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def prefetch(iterable, depth):
+    """
+    Yield the values of `iterable`, computing up to `depth` values ahead of the
+    one being consumed in a background thread.
+
+    Exceptions raised by `iterable` are re-raised in the calling thread when
+    the value they replace is reached. Closing the generator stops the thread
+    before it computes any further value.
+    """
+    results = queue.Queue()
+    slots = threading.Semaphore(depth)
+    stopped = threading.Event()
+
+    def work():
+        try:
+            iterator = iter(iterable)
+            while _wait_until_stopped(stopped, functools.partial(slots.acquire, timeout=PUT_TIMEOUT)):
+                try:
+                    value = next(iterator)
+                except StopIteration:
+                    results.put((_DONE, None))
+                    return
+                results.put((_RECORD, value))
+        except Exception as exc:  # pylint: disable=broad-except
+            results.put((_ERROR, exc))
+
+    thread = threading.Thread(target=work, daemon=True)
+    thread.start()
+    try:
+        while True:
+            kind, value = results.get()
+            if kind == _RECORD:
+                # let the worker compute the next value while this one is consumed
+                slots.release()
+                yield value
+            elif kind == _DONE:
+                return
+            else:
+                raise value
+    finally:
+        stopped.set()
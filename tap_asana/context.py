@@ -1,4 +1,43 @@
+import threading
 from singer import metadata
+from tap_asana.request_metrics import RequestMetrics
+from tap_asana.streams import StreamRegistry
+from tap_asana.writer import Writer
+
+
+class ResourceDirectory():
+    """Run-scoped listing of workspaces and projects shared by all streams.
+
+    Each listing is fetched lazily, through the requesting stream's `call_api`,
+    the first time a stream asks for it and served from memory afterwards.
+    """
+
+    def __init__(self, asana, workspaces=None, project_ids=None):
+        self.asana = asana
+        self._lock = threading.Lock()
+        self._workspaces = workspaces
+        self._project_ids = project_ids
+
+    def get_workspaces(self, stream):
+        """Return every workspace visible to the authenticated user"""
+        with self._lock:
+            if self._workspaces is None:
+                self._workspaces = list(
+                    stream.call_api("workspaces", opt_fields="gid,name,is_organization")
+                )
+            return self._workspaces
+
+    def get_project_ids(self, stream):
+        """Return the gids of every project in every workspace"""
+        workspaces = self.get_workspaces(stream)
+        with self._lock:
+            if self._project_ids is None:
+                self._project_ids = [
+                    project["gid"]
+                    for workspace in workspaces
+                    for project in stream.call_api("projects", workspace=workspace["gid"])
+                ]
+            return self._project_ids
 
 
 class Context():
@@ -6,9 +45,16 @@ class Context():
     state = {}
     catalog = {}
     stream_map = {}
-    stream_objects = {}
+    stream_objects = StreamRegistry()
     counts = {}
     asana = {}
+    directory = None
+    rate_limiter = None
+    response_cache = None
+    tap_start = None
+    request_metrics = RequestMetrics()
+    profiler = None
+    writer = Writer()
 
     @classmethod
     def get_catalog_entry(cls, stream_name):
@@ -23,3 +69,10 @@ class Context():
         stream = cls.get_catalog_entry(stream_name)
         stream_metadata = metadata.to_map(stream["metadata"])
         return metadata.get(stream_metadata, (), "selected")
+
+    @classmethod
+    def get_directory(cls):
+        """Return the resource directory of the current Asana client, creating it on first use"""
+        if cls.directory is None or cls.directory.asana is not cls.asana:
+            cls.directory = ResourceDirectory(cls.asana)
+        return cls.directory
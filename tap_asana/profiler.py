@@ -0,0 +1,132 @@
+import cProfile
+import collections
+import contextlib
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+
+import singer
+
+LOGGER = singer.get_logger()
+
+# Number of functions in the hot function report
+PROFILE_TOP = 30
+
+# Phases of a stream's sync, in thread-seconds
+PHASES = ["api_wait", "json_decode", "transform", "emit"]
+
+REPORT_FILE = "profile_report.txt"
+
+
+class Profiler():
+    """
+    Profile of a sync: cProfile statistics of every thread, dumped to a
+    `.prof` file in `directory`, and the seconds each stream spends in each
+    of PHASES. Phases are timed in the thread running them, so with
+    concurrent fetches a stream's phases may add up to more than its wall time.
+    """
+
+    def __init__(self, directory, top=PROFILE_TOP):
+        self.directory = directory
+        self.top = top
+        self.stream = None
+        self.phases = collections.defaultdict(collections.Counter)
+        self.profiles = []
+        self.paths = []
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config):
+        """Create the profiler from the config, or return None without `profile_dir`"""
+        directory = config.get("profile_dir")
+        if not directory:
+            return None
+        # If value is 0, "0", "" or not passed then it sets default to 30.
+        config_top = config.get("profile_top")
+        if config_top and int(config_top):
+            top = int(config_top)
+        else:
+            top = PROFILE_TOP
+        return cls(directory, top)
+
+    def start(self):
+        """Profile the calling thread and every thread started from now on"""
+        threading.setprofile(self._profile_thread)
+        self._profile_thread()
+
+    def _profile_thread(self, *_args):
+        # Called by the first profiling event of a new thread, replaced by its own profile
+        profile = cProfile.Profile()
+        with self._lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def stop(self, name="tap_asana"):
+        """Stop profiling and dump the statistics of every thread to `<name>.prof`"""
+        threading.setprofile(None)
+        for profile in self.profiles:
+            profile.disable()
+        stats = pstats.Stats()
+        for profile in self.profiles:
+            profile.create_stats()
+            # A thread that made no call has no statistics, which Stats rejects
+            if profile.stats:
+                stats.add(profile)
+        path = os.path.join(self.directory, f"{name}.prof")
+        stats.dump_stats(path)
+        self.paths.append(path)
+        return path
+
+    def add(self, phase, seconds, stream=None):
+        with self._lock:
+            self.phases[stream or self.stream][phase] += seconds
+
+    @contextlib.contextmanager
+    def phase(self, phase, stream=None):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(phase, time.monotonic() - started, stream)
+
+    def timed(self, phase, function):
+        """Return `function` counting the time of its calls in `phase`"""
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.phase(phase):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def merge(self, phases, path):
+        """Add the phases and profile of another process"""
+        with self._lock:
+            for stream, seconds in phases.items():
+                self.phases[stream].update(seconds)
+        self.paths.append(path)
+
+    def get_report(self):
+        """Return the phases of every stream and the top functions of every profile dumped"""
+        out = io.StringIO()
+        out.write("Phases of each stream, in seconds (thread-seconds for the phases):\n")
+        out.write(f"{'stream':<16} {'wall':>10}" + "".join(f" {phase:>12}" for phase in PHASES) + "\n")
+        for stream, seconds in sorted(self.phases.items(), key=lambda item: str(item[0])):
+            out.write(f"{stream or '-':<16} {seconds['wall']:>10.3f}" +
+                      "".join(f" {seconds[phase]:>12.3f}" for phase in PHASES) + "\n")
+        out.write(f"\nTop {self.top} functions by own time:\n")
+        stats = pstats.Stats(*self.paths, stream=out)
+        stats.sort_stats("tottime").print_stats(self.top)
+        return out.getvalue()
+
+    def report(self):
+        """Log the report and write it next to the profiles"""
+        report = self.get_report()
+        path = os.path.join(self.directory, REPORT_FILE)
+        with open(path, "w", encoding="utf-8") as report_file:
+            report_file.write(report)
+        for line in report.splitlines():
+            LOGGER.info(line)
+        LOGGER.info("Profiles written to %s, report to %s", ", ".join(self.paths), path)
@@ -0,0 +1,188 @@
+import threading
+import time
+
+import singer
+from requests.adapters import HTTPAdapter
+
+LOGGER = singer.get_logger()
+
+# Asana's standard limits: requests per minute (paid plans) and concurrent GET requests
+REQUESTS_PER_MINUTE = 1500
+MAX_CONCURRENT_REQUESTS = 50
+
+# Share of the per-minute budget that may be spent in a burst
+BURST_FRACTION = 0.1
+
+# Adaptive concurrency: starting limit, multiplicative decrease and latency spike detection
+INITIAL_CONCURRENT_REQUESTS = 10
+DECREASE_FACTOR = 0.5
+LATENCY_SPIKE_FACTOR = 3
+LATENCY_SMOOTHING = 0.1
+LATENCY_MIN_SAMPLES = 10
+
+
+class ConcurrencyController():
+    """
+    AIMD limit on the number of requests in flight.
+
+    Every healthy response raises the limit by `1 / limit`, about one more
+    request per round of `limit` responses. A 429, a 5xx, a failed request or
+    a response much slower than the average latency cuts the limit by
+    `DECREASE_FACTOR`. Only requests sent after the last cut can cut it again,
+    so one burst of errors lowers the limit once.
+    """
+
+    def __init__(self, max_concurrent, initial=INITIAL_CONCURRENT_REQUESTS):
+        self.max_limit = max(1, max_concurrent)
+        self.limit = float(min(initial, self.max_limit))
+        self.in_flight = 0
+        self.latency = None
+        self.samples = 0
+        self._last_decrease = float("-inf")
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Wait until a request fits within the current limit"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def try_acquire(self):
+        """Take a request slot if one fits within the current limit, without waiting"""
+        with self._condition:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, sent_at, latency, status_code):
+        """Free the request's slot and adjust the limit to its outcome"""
+        with self._condition:
+            self.in_flight -= 1
+            reason = self.get_decrease_reason(latency, status_code)
+            if reason is None:
+                self.update_latency(latency)
+                self.increase()
+            elif sent_at >= self._last_decrease:
+                self._last_decrease = time.monotonic()
+                self.decrease(reason)
+            self._condition.notify_all()
+
+    def get_decrease_reason(self, latency, status_code):
+        """Return why the response calls for a lower limit, or None if it is healthy"""
+        if status_code is None:
+            return "a failed request"
+        if status_code == 429 or status_code >= 500:
+            return f"status code {status_code}"
+        if self.samples >= LATENCY_MIN_SAMPLES and latency > LATENCY_SPIKE_FACTOR * self.latency:
+            return f"latency of {latency:.2f}s (average {self.latency:.2f}s)"
+        return None
+
+    def update_latency(self, latency):
+        """Update the moving average latency of healthy responses"""
+        self.samples += 1
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+
+    def increase(self):
+        previous = int(self.limit)
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        if int(self.limit) > previous:
+            LOGGER.info("Raised concurrent requests limit to %d", int(self.limit))
+
+    def decrease(self, reason):
+        previous = int(self.limit)
+        self.limit = max(1.0, self.limit * DECREASE_FACTOR)
+        LOGGER.info("Lowered concurrent requests limit from %d to %d after %s",
+                    previous, int(self.limit), reason)
+
+
+class RateLimiter():
+    """
+    Token bucket in front of every API request, shared by all threads.
+
+    The bucket holds up to `requests_per_minute * BURST_FRACTION` tokens and
+    refills at the rate that keeps any 60 second window within
+    `requests_per_minute`. The number of requests in flight adapts between 1
+    and `max_concurrent`, and a `Retry-After` pause holds back every request,
+    not only the one that was rejected.
+    """
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, max_concurrent=MAX_CONCURRENT_REQUESTS):
+        self.capacity = max(1.0, requests_per_minute * BURST_FRACTION)
+        self.rate = max(requests_per_minute - self.capacity, 1.0) / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.concurrency = ConcurrencyController(max_concurrent)
+
+    @classmethod
+    def from_config(cls, config, share=1):
+        """Create the limiter from the config, keeping `1/share` of the budget"""
+        requests_per_minute = float(config.get("requests_per_minute") or REQUESTS_PER_MINUTE)
+        max_concurrent = int(config.get("max_concurrent_requests") or MAX_CONCURRENT_REQUESTS)
+        return cls(requests_per_minute / share, max(1, max_concurrent // share))
+
+    def acquire(self):
+        """Wait for a request slot and a token, or until a pause is over"""
+        self.concurrency.acquire()
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def reserve(self):
+        """Take a token without waiting, returning the seconds to wait before sending"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # A negative balance reserves a token that is refilled later
+            self._tokens -= 1
+            return max(-self._tokens / self.rate, self._paused_until - now)
+
+    def release(self, sent_at, status_code):
+        """Free the request slot taken by `acquire`, `status_code` is None if the request failed"""
+        self.concurrency.release(sent_at, time.monotonic() - sent_at, status_code)
+
+    def pause(self, seconds):
+        """Hold back every request for the next `seconds` seconds"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        LOGGER.info("Received 429 -- pausing all requests for %s seconds", seconds)
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """Transport adapter sending every request through a RateLimiter"""
+
+    def __init__(self, get_limiter, **kwargs):
+        # `get_limiter` returns the limiter to use, or None to not limit
+        self.get_limiter = get_limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        limiter = self.get_limiter()
+        if limiter is None:
+            return self.send_request(request, **kwargs)
+        limiter.acquire()
+        sent_at = time.monotonic()
+        status_code = None
+        try:
+            response = self.send_request(request, **kwargs)
+            status_code = response.status_code
+        finally:
+            limiter.release(sent_at, status_code)
+        if response.status_code == 429 and response.headers.get("Retry-After"):
+            limiter.pause(float(response.headers["Retry-After"]))
+        return response
+
+    def send_request(self, request, **kwargs):
+        """Send the request once its slot is acquired"""
+        response = super().send(request, **kwargs)
+        if not kwargs.get("stream"):
+            # Hold the slot, and the connection, until the body is downloaded
+            response.content  # pylint: disable=pointless-statement
+        return response
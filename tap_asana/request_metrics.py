@@ -0,0 +1,144 @@
+import collections
+import json
+import re
+import threading
+
+import singer
+from singer.metrics import Point
+
+LOGGER = singer.get_logger()
+
+PERCENTILES = [50, 90, 99]
+
+# Gids in a path are replaced by this, so the requests of an endpoint are grouped
+GID_PATTERN = re.compile(r"/\d+(?=/|$)")
+
+
+def get_endpoint(path):
+    """Return the endpoint of a request path, e.g. `/tasks/{gid}/stories`"""
+    path = path.split("?")[0]
+    if path.startswith("/api/1.0"):
+        path = path[len("/api/1.0"):]
+    return GID_PATTERN.sub("/{gid}", path)
+
+
+def get_percentile(sorted_values, percentile):
+    """Return the nearest-rank percentile of sorted values"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * percentile // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class EndpointMetrics():
+    """
+    Requests of one stream to one endpoint: the `counts` of requests,
+    rate_limited, server_errors, failed and bytes_received, the
+    queued_seconds and backoff_seconds, and the latency of every request
+    """
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.latencies = []
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.latencies.extend(other.latencies)
+
+    def to_dict(self):
+        latencies = sorted(self.latencies)
+        latency_ms = {f"p{percentile}": get_percentile(latencies, percentile)
+                      for percentile in PERCENTILES}
+        latency_ms["max"] = latencies[-1] if latencies else None
+        return {
+            "requests": self.counts["requests"],
+            "rate_limited": self.counts["rate_limited"],
+            "server_errors": self.counts["server_errors"],
+            "failed": self.counts["failed"],
+            "bytes_received": self.counts["bytes_received"],
+            "latency_ms": {key: value if value is None else round(value * 1000, 1)
+                           for key, value in latency_ms.items()},
+            "queued_seconds": round(float(self.counts["queued_seconds"]), 3),
+            "backoff_seconds": round(float(self.counts["backoff_seconds"]), 3),
+        }
+
+
+class RequestMetrics():
+    """
+    Requests of the sync by stream and endpoint: counts, latencies, response
+    bytes, 429 and 5xx responses, requests that failed without a response,
+    seconds queued by the rate limiter and seconds spent in backoff.
+
+    Requests are attributed to the stream being synced. A backoff is
+    attributed to the endpoint of the last request of the thread backing off.
+    """
+
+    def __init__(self):
+        self.stream = None
+        self.endpoints = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def get(self, endpoint):
+        key = (self.stream, endpoint)
+        if key not in self.endpoints:
+            self.endpoints[key] = EndpointMetrics()
+        return self.endpoints[key]
+
+    def add_request(self, path, latency, queued, status_code, bytes_received):
+        """Count a request, `status_code` is None if it failed without a response"""
+        endpoint = get_endpoint(path)
+        self._local.endpoint = endpoint
+        with self._lock:
+            metrics = self.get(endpoint)
+            metrics.latencies.append(latency)
+            metrics.counts.update(requests=1, queued_seconds=queued, bytes_received=bytes_received)
+            if status_code is None:
+                metrics.counts["failed"] += 1
+            elif status_code == 429:
+                metrics.counts["rate_limited"] += 1
+            elif 500 <= status_code < 600:
+                metrics.counts["server_errors"] += 1
+
+    def add_backoff(self, seconds, path=None):
+        """Count the seconds waited before retrying a request to `path`, by default the thread's last one"""
+        endpoint = get_endpoint(path) if path else getattr(self._local, "endpoint", None)
+        with self._lock:
+            self.get(endpoint).counts["backoff_seconds"] += seconds
+
+    def merge(self, endpoints):
+        """Add the metrics of another process"""
+        with self._lock:
+            for key, metrics in endpoints.items():
+                self.endpoints.setdefault(key, EndpointMetrics()).merge(metrics)
+
+    def to_dict(self):
+        summary = {}
+        for (stream, endpoint), metrics in sorted(self.endpoints.items(), key=lambda item: str(item[0])):
+            summary.setdefault(stream or "", {})[endpoint or ""] = metrics.to_dict()
+        return {"streams": summary}
+
+    def log(self):
+        """Log the metrics of every stream and endpoint as Singer metrics"""
+        for stream, endpoints in self.to_dict()["streams"].items():
+            for endpoint, metrics in endpoints.items():
+                tags = {"stream": stream, "endpoint": endpoint}
+                points = [
+                    Point("counter", "http_request_count", metrics["requests"], tags),
+                    Point("counter", "http_response_bytes", metrics["bytes_received"], tags),
+                    Point("counter", "http_error_count", metrics["rate_limited"], dict(tags, http_status_code="429")),
+                    Point("counter", "http_error_count", metrics["server_errors"], dict(tags, http_status_code="5xx")),
+                    Point("counter", "http_error_count", metrics["failed"], dict(tags, http_status_code="none")),
+                    Point("timer", "rate_limit_wait", metrics["queued_seconds"], tags),
+                    Point("timer", "backoff_duration", metrics["backoff_seconds"], tags),
+                ]
+                for percentile, value in metrics["latency_ms"].items():
+                    if value is not None:
+                        points.append(Point("timer", "http_request_duration", value / 1000,
+                                            dict(tags, percentile=percentile)))
+                for point in points:
+                    singer.metrics.log(LOGGER, point)
+
+    def write_summary(self, path):
+        with open(path, "w", encoding="utf-8") as summary_file:
+            json.dump(self.to_dict(), summary_file, indent=2)
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+
+import singer
+from requests.structures import CaseInsensitiveDict
+
+LOGGER = singer.get_logger()
+
+# Size of the cache directory in megabytes, the least recently used
+# responses are evicted beyond it
+RESPONSE_CACHE_SIZE_MB = 100
+
+# Endpoints of the FULL_TABLE streams, and the workspace listing of the
+# resource directory: slow moving and re-read in full on every sync
+CACHED_PATHS = re.compile(
+    r"/(workspaces|users|organizations/\d+/teams|teams/\d+/users"
+    r"|projects/\d+/sections|portfolios|portfolios/\d+/items)$"
+)
+
+# Headers of the cached response kept with its body
+KEPT_HEADERS = ["Content-Type", "ETag", "Last-Modified"]
+
+
+class ResponseCache():
+    """
+    On-disk cache of GET responses carrying an ETag or Last-Modified
+    validator, keyed by URL (endpoint and parameters).
+
+    A request to a cached URL is sent with If-None-Match / If-Modified-Since,
+    and a `304 Not Modified` is answered with the cached body. Each response
+    is one file: a JSON line of its headers followed by its decompressed body.
+    Beyond `max_bytes` the least recently used files are removed.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._sizes = {}
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith(".cache") and os.path.isfile(path):
+                self._sizes[path] = os.path.getsize(path)
+
+    @classmethod
+    def from_config(cls, config):
+        """Create the cache from the config, or return None without `response_cache_dir`"""
+        directory = config.get("response_cache_dir")
+        if not directory:
+            return None
+        # If value is 0, "0", "" or not passed then it sets default to 100 MB.
+        config_size_mb = config.get("response_cache_size_mb")
+        if config_size_mb and float(config_size_mb):
+            size_mb = float(config_size_mb)
+        else:
+            size_mb = RESPONSE_CACHE_SIZE_MB
+        return cls(directory, int(size_mb * 1024 * 1024))
+
+    @staticmethod
+    def is_cacheable(request):
+        return request.method == "GET" and CACHED_PATHS.search(request.path_url.split("?")[0]) is not None
+
+    def get_path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest() + ".cache")
+
+    def load(self, url):
+        """Return the headers and body cached for `url`, or None"""
+        path = self.get_path(url)
+        try:
+            with open(path, "rb") as cached:
+                headers = json.loads(cached.readline())
+                body = cached.read()
+            # Mark the file as recently used
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        if headers.pop("url", None) != url:
+            return None
+        return headers, body
+
+    def add_validators(self, request):
+        """Make `request` conditional on its cached response, returning the cached response or None"""
+        cached = self.load(request.url)
+        if cached is None:
+            return None
+        headers, _ = cached
+        if headers.get("ETag"):
+            request.headers["If-None-Match"] = headers["ETag"]
+        if headers.get("Last-Modified"):
+            request.headers["If-Modified-Since"] = headers["Last-Modified"]
+        return cached
+
+    def update(self, request, response, cached):
+        """Serve a 304 from the cached response, or cache a new response with validators"""
+        if response.status_code == 304 and cached is not None:
+            headers, body = cached
+            response.status_code = 200
+            response.reason = "OK"
+            response.headers = CaseInsensitiveDict(headers)
+            response._content = body  # pylint: disable=protected-access
+            with self._lock:
+                self.hits += 1
+            return response
+        with self._lock:
+            self.misses += 1
+        if response.status_code == 200 and (response.headers.get("ETag") or response.headers.get("Last-Modified")):
+            self.store(request.url, response)
+        return response
+
+    def store(self, url, response):
+        headers = {key: response.headers[key] for key in KEPT_HEADERS if key in response.headers}
+        headers["url"] = url
+        path = self.get_path(url)
+        # Write to a temporary file first so readers never see a partial response
+        descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(descriptor, "wb") as temp:
+            temp.write(json.dumps(headers).encode() + b"\n")
+            temp.write(response.content)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._sizes[path] = os.path.getsize(path)
+            if sum(self._sizes.values()) > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Remove the least recently used responses until the cache fits in `max_bytes`"""
+        def last_used(path):
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                return 0
+        total = sum(self._sizes.values())
+        for path in sorted(self._sizes, key=last_used):
+            if total <= self.max_bytes:
+                break
+            total -= self._sizes.pop(path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def log_stats(self):
+        LOGGER.info("Response cache: %d responses not modified, %d fetched", self.hits, self.misses)
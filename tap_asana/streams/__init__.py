@@ -1,10 +1,35 @@
-import tap_asana.streams.portfolios
-import tap_asana.streams.projects
-import tap_asana.streams.sections
-import tap_asana.streams.stories
-import tap_asana.streams.subtasks
-import tap_asana.streams.tags
-import tap_asana.streams.tasks
-import tap_asana.streams.teams
-import tap_asana.streams.users
-import tap_asana.streams.workspaces
+import importlib
+
+# Streams of the tap, each defined and registered in the module of the same name
+STREAM_NAMES = [
+    "portfolios",
+    "projects",
+    "sections",
+    "stories",
+    "subtasks",
+    "tags",
+    "tasks",
+    "teams",
+    "users",
+    "workspaces",
+]
+
+
+class StreamRegistry(dict):
+    """
+    Stream classes by stream name. A stream's module is only imported when
+    the stream is first looked up, so a sync imports the streams it syncs.
+    """
+
+    def __missing__(self, stream_name):
+        if stream_name not in STREAM_NAMES:
+            raise KeyError(stream_name)
+        # The module registers its stream class on import
+        importlib.import_module("tap_asana.streams." + stream_name)
+        return dict.__getitem__(self, stream_name)
+
+    def __contains__(self, stream_name):
+        return dict.__contains__(self, stream_name) or stream_name in STREAM_NAMES
+
+    def get(self, stream_name, default=None):
+        return self[stream_name] if stream_name in self else default
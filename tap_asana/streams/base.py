@@ -1,20 +1,25 @@
 import math
 import functools
 import sys
+import time
 
 import requests
 import backoff
 import simplejson
 import singer
 from asana.error import (
+    AsanaError,
     NoAuthorizationError,
+    NotFoundError,
     RetryableAsanaError,
     InvalidTokenError,
     RateLimitEnforcedError,
 )
 from asana.page_iterator import CollectionPageIterator
 from oauthlib.oauth2 import TokenExpiredError
+from singer import metadata
 from singer import utils
+from tap_asana.concurrency import WorkItems, fan_out, prefetch
 from tap_asana.context import Context
 
 
@@ -35,6 +40,24 @@ DATE_WINDOW_SIZE = 1
 # We will retry a 500 error a maximum of 5 times before giving up
 MAX_RETRIES = 5
 
+# Number of parent objects (e.g. projects) fetched concurrently by streams
+# that fan out over them without a rate limiter. 1 keeps the original serial behaviour.
+MAX_WORKERS = 1
+
+# With `use_events`, a project with more changed tasks than this is scanned
+# with a `modified_since` listing instead of one request per changed task
+EVENTS_MAX_TASK_LOOKUPS = 50
+
+# Maximum number of actions Asana accepts in one batch API request
+BATCH_SIZE = 10
+
+# Page size of the collections fetched through the batch API
+BATCH_PAGE_SIZE = 100
+
+# Number of collection pages fetched in the background ahead of the page
+# being consumed. 0 fetches every page on demand.
+PREFETCH_PAGES = 0
+
 
 def is_not_status_code_fn(status_code):
     """Check for status code"""
@@ -47,6 +70,11 @@ def is_not_status_code_fn(status_code):
     return gen_fn
 
 
+def record_backoff(details):
+    """Count the wait before a retry in the request metrics"""
+    Context.request_metrics.add_backoff(details["wait"])
+
+
 def leaky_bucket_handler(details):
     """Function to handle leaky bucket"""
     LOGGER.info("Received 429 -- sleeping for %s seconds", details["wait"])
@@ -62,13 +90,14 @@ def retry_handler(details):
 # pylint: disable=unused-argument
 def retry_after_wait_gen(**kwargs):
     # This is called in an except block so we can retrieve the exception
-    # and check it.
-    exc_info = sys.exc_info()
-    resp = exc_info[1].response
-    # Retry-After is an undocumented header. But honoring
-    # it was proven to work in our spikes.
-    sleep_time_str = resp.headers.get("Retry-After")
-    yield math.floor(float(sleep_time_str))
+    # and check it. Every retry reads the Retry-After of its own 429.
+    while True:
+        exc_info = sys.exc_info()
+        resp = exc_info[1].response
+        # Retry-After is an undocumented header. But honoring
+        # it was proven to work in our spikes.
+        sleep_time_str = resp.headers.get("Retry-After")
+        yield math.floor(float(sleep_time_str))
 
 
 def invalid_token_handler(details):
@@ -81,26 +110,26 @@ def asana_error_handling(fnc):
     """Function for error handling"""
 
     @backoff.on_exception(
-        backoff.expo, requests.Timeout, max_tries=MAX_RETRIES, factor=FACTOR
+        backoff.expo, requests.Timeout, on_backoff=record_backoff, max_tries=MAX_RETRIES, factor=FACTOR
     )
     @backoff.on_exception(
         backoff.expo,
         (InvalidTokenError, NoAuthorizationError, TokenExpiredError),
-        on_backoff=invalid_token_handler,
+        on_backoff=[invalid_token_handler, record_backoff],
         max_tries=MAX_RETRIES,
     )
     @backoff.on_exception(
         backoff.expo,
         (simplejson.scanner.JSONDecodeError, RetryableAsanaError),
         giveup=is_not_status_code_fn(range(500, 599)),
-        on_backoff=retry_handler,
+        on_backoff=[retry_handler, record_backoff],
         max_tries=MAX_RETRIES,
     )
     @backoff.on_exception(
         retry_after_wait_gen,
         RateLimitEnforcedError,
         giveup=is_not_status_code_fn([429]),
-        on_backoff=leaky_bucket_handler,
+        on_backoff=[leaky_bucket_handler, record_backoff],
         # No jitter as we want a constant value
         jitter=None,
     )
@@ -118,6 +147,29 @@ CollectionPageIterator.get_initial = asana_error_handling(
 )
 CollectionPageIterator.get_next = asana_error_handling(CollectionPageIterator.get_next)
 
+
+def get_prefetch_depth():
+    """Return the config param `prefetch_pages`, the number of pages fetched ahead of the one consumed"""
+    # If value is 0, "0", "" or not passed then pages are fetched on demand.
+    config_prefetch_pages = Context.config.get("prefetch_pages")
+    if config_prefetch_pages and int(config_prefetch_pages):
+        return int(config_prefetch_pages)
+    return PREFETCH_PAGES
+
+
+def collection_items(page_iterator):
+    """Returns an iterator for each item in each page, fetching the next pages in the background"""
+    depth = get_prefetch_depth()
+    pages = prefetch(page_iterator, depth) if depth > 0 else page_iterator
+    for page in pages:
+        for item in page:
+            yield item
+
+
+# The SDK's collection methods iterate `items()`; the decorated `get_initial`
+# and `get_next` above run in the prefetching thread, retries included.
+CollectionPageIterator.items = collection_items
+
 class Stream():
     # Used for bookmarking and stream identification. Is overridden by
     # subclasses to change the bookmark key.
@@ -125,6 +177,10 @@ class Stream():
     replication_method = None
     replication_key = None
     key_properties = ["gid"]
+    # Whether the stream fans out over the project ids of the resource directory
+    uses_project_ids = False
+    # Fields the stream itself relies on, requested even when not selected
+    required_fields = []
     # Controls which SDK object we use to call the API by default.
 
     def __init__(self):
@@ -136,6 +192,55 @@ class Stream():
         else:
             self.request_timeout = REQUEST_TIMEOUT
 
+        # Set concurrency to config param `max_workers` value.
+        # If value is 0, "0", "" or not passed then it sets default to the rate limiter's
+        # maximum number of concurrent requests, the fan-outs following its adaptive limit
+        # (see `get_worker_limit`), or to 1 worker without a rate limiter.
+        config_max_workers = Context.config.get("max_workers")
+        if config_max_workers and int(config_max_workers):
+            self.max_workers = int(config_max_workers)
+        elif Context.rate_limiter is not None:
+            self.max_workers = Context.rate_limiter.concurrency.max_limit
+        else:
+            self.max_workers = MAX_WORKERS
+
+        # Set events mode to config param `use_events` value.
+        # Incremental task based streams then only fetch what the Events API reports changed.
+        self.use_events = str(Context.config.get("use_events", "")).lower() == "true"
+        # Set search mode to config param `use_search` value.
+        # The tasks stream then uses the workspace task search instead of a project scan.
+        self.use_search = str(Context.config.get("use_search", "")).lower() == "true"
+        # Set batch mode to config param `use_batch` value.
+        # Small fan-out reads are then grouped into batch API requests.
+        self.use_batch = str(Context.config.get("use_batch", "")).lower() == "true"
+        # Set engine to config param `use_async` value.
+        # Collections fanned out over are then paginated by the asyncio engine.
+        self.use_async = str(Context.config.get("use_async", "")).lower() == "true"
+        # Sync tokens received during this sync, saved with the stream's bookmark
+        self.sync_tokens = {}
+
+    def is_field_selected(self, field):
+        """
+        Return whether the records of the stream keep `field` once transformed:
+        it is in the schema, and automatic or not deselected in the catalog.
+        Without a catalog entry for the stream every field is kept.
+        """
+        try:
+            catalog_entry = Context.get_catalog_entry(self.name)
+        except KeyError:
+            return True
+        if field not in catalog_entry["schema"].get("properties", {}):
+            return False
+        field_metadata = metadata.to_map(catalog_entry["metadata"]).get(("properties", field), {})
+        if field_metadata.get("inclusion") == "automatic":
+            return True
+        return field_metadata.get("selected") is not False and field_metadata.get("inclusion") != "unsupported"
+
+    def get_opt_fields(self):
+        """Return the `opt_fields` of the stream: its selected, automatic, replication and required fields"""
+        always = set(self.key_properties + self.required_fields + [self.replication_key])
+        return ",".join(field for field in self.fields if field in always or self.is_field_selected(field))
+
     def get_bookmark(self):
         """Function to get bookmark"""
         bookmark = (
@@ -173,7 +278,7 @@ class Stream():
                 self.replication_key,
                 value,
             )
-            singer.write_state(Context.state)
+            Context.writer.update_state(Context.state)
 
     @staticmethod
     def get_updated_session_bookmark(session_bookmark, value):
@@ -202,6 +307,170 @@ class Stream():
         query_params["timeout"] = self.request_timeout
         return api_function.find_all(**query_params)
 
+    @asana_error_handling
+    def call_batch_api(self, actions):
+        """Submit one batch API request and return the response of each action"""
+        return Context.asana.client.batch_api.create_batch_request(
+            {"actions": actions}, timeout=self.request_timeout
+        )
+
+    def get_collections_in_batch(self, relative_paths, fields=None):
+        """
+        Return the full collection at each relative path (e.g. `/teams/1/users`),
+        in the same order, fetching up to BATCH_SIZE pages per batch API request.
+
+        Further pages are requested in later batches. Actions failing with a
+        429 or 5xx are retried in a later batch, after the Retry-After delay or
+        an exponential backoff, up to MAX_RETRIES times; any other failing
+        action raises an AsanaError.
+        """
+        results = [[] for _ in relative_paths]
+        # (index, relative path, offset, tries) of every page still to fetch
+        pending = [(index, path, None, 0) for index, path in enumerate(relative_paths)]
+        while pending:
+            chunk, pending = pending[:BATCH_SIZE], pending[BATCH_SIZE:]
+            actions = []
+            for _, path, offset, _ in chunk:
+                options = {"limit": BATCH_PAGE_SIZE}
+                if offset:
+                    options["offset"] = offset
+                if fields:
+                    options["fields"] = fields
+                actions.append({"method": "get", "relative_path": path, "options": options})
+
+            wait = 0
+            for page, response in zip(chunk, self.call_batch_api(actions)):
+                wait = max(wait, self.add_batch_response(results, pending, page, response))
+            if wait:
+                Context.request_metrics.add_backoff(wait)
+                time.sleep(wait)
+        return results
+
+    @staticmethod
+    def add_batch_response(results, pending, page, response):
+        """
+        Add the records of a batch action's response to `results`, queueing its
+        next page, or its retry, in `pending`. Return the seconds to wait before
+        the retry, 0 if none.
+        """
+        index, path, offset, tries = page
+        status = response["status_code"]
+        if status == 200:
+            body = response["body"]
+            results[index].extend(body["data"])
+            if body.get("next_page"):
+                pending.append((index, path, body["next_page"]["offset"], 0))
+            return 0
+        if (status == 429 or 500 <= status < 600) and tries + 1 < MAX_RETRIES:
+            LOGGER.info("Batch action %s received %s -- Retry %s/%s", path, status, tries + 1, MAX_RETRIES)
+            pending.append((index, path, offset, tries + 1))
+            headers = {key.lower(): value for key, value in (response.get("headers") or {}).items()}
+            if status == 429 and headers.get("retry-after"):
+                return float(headers["retry-after"])
+            return FACTOR ** tries
+        raise AsanaError(f"Batch action {path} failed: {response.get('body')}", status=status)
+
+    @asana_error_handling
+    def call_events_api(self, project_id, sync_token):
+        """
+        Fetch one page of a project's events since `sync_token`. When the token
+        is missing or expired Asana answers 412 with a fresh token, which is
+        returned with `data` set to None.
+        """
+        params = {"resource": project_id}
+        if sync_token:
+            params["sync"] = sync_token
+        try:
+            return Context.asana.client.get(
+                "/events", params, full_payload=True, timeout=self.request_timeout
+            )
+        except InvalidTokenError as exc:
+            return {"data": None, "sync": exc.sync}
+
+    def get_changed_task_gids(self, project_id):
+        """
+        Return the gids of the tasks the Events API reports changed in a project
+        since the last sync, or None when the project needs a full scan because
+        there was no valid sync token or too many tasks changed.
+        """
+        sync_tokens = singer.get_bookmark(Context.state, self.name, "sync_tokens", {})
+        sync_token = sync_tokens.get(project_id)
+        task_gids = set()
+        while True:
+            page = self.call_events_api(project_id, sync_token)
+            sync_token = page["sync"]
+            if page["data"] is None:
+                self.sync_tokens[project_id] = sync_token
+                return None
+            for event in page["data"]:
+                # Stories are reported with their task as parent
+                for resource in (event.get("resource"), event.get("parent")):
+                    if resource and resource.get("resource_type") == "task":
+                        task_gids.add(resource["gid"])
+            if not page.get("has_more"):
+                break
+        self.sync_tokens[project_id] = sync_token
+        if len(task_gids) > EVENTS_MAX_TASK_LOOKUPS:
+            return None
+        return sorted(task_gids)
+
+    @asana_error_handling
+    def get_task(self, task_gid, opt_fields):
+        """Fetch a single task, returning None if it was deleted"""
+        try:
+            return Context.asana.client.tasks.get_task(
+                task_gid, opt_fields=opt_fields, timeout=self.request_timeout
+            )
+        except NotFoundError:
+            return None
+
+    def get_tasks(self, task_gids, opt_fields):
+        """Yield the tasks with the given gids, skipping deleted ones"""
+        for task_gid in task_gids:
+            task = self.get_task(task_gid, opt_fields)
+            if task:
+                yield task
+
+    def save_sync_tokens(self):
+        """Store the sync tokens received during this sync with the stream's bookmark"""
+        if not self.sync_tokens:
+            return
+        sync_tokens = singer.get_bookmark(Context.state, self.name, "sync_tokens", {})
+        sync_tokens.update(self.sync_tokens)
+        singer.write_bookmark(Context.state, self.name, "sync_tokens", sync_tokens)
+
+    def get_workspaces(self):
+        """Return all workspaces from the run-scoped resource directory"""
+        return Context.get_directory().get_workspaces(self)
+
+    def get_project_ids(self):
+        """Return all project ids from the run-scoped resource directory"""
+        return Context.get_directory().get_project_ids(self)
+
+    def get_worker_limit(self):
+        """
+        Return how many fan-out workers may run now: `max_workers` when set in
+        the config, else the current adaptive concurrency limit of the rate limiter
+        """
+        if int(Context.config.get("max_workers") or 0) or Context.rate_limiter is None:
+            return self.max_workers
+        return int(Context.rate_limiter.concurrency.limit)
+
+    def fan_out(self, fetch, items, expand=None, batch_size=None, on_done=None):
+        """Yield the records of `fetch(item)` for all items using up to `get_worker_limit()` threads"""
+        return fan_out(fetch, WorkItems(items, expand, batch_size, on_done), self.max_workers, self.get_worker_limit)
+
+    def fan_out_async(self, get_request, items, expand=None, on_done=None):
+        """
+        Yield `(item, record)` for every record of the collection whose path and
+        query params `get_request(item)` returns, for all items, paginating up
+        to `max_workers` collections at a time as coroutines of one thread
+        """
+        # Imported here as aiohttp is optional, and the engine builds on this module's error handling
+        from tap_asana.async_engine import AsyncEngine  # pylint: disable=import-outside-toplevel,cyclic-import
+        return AsyncEngine(self.request_timeout).fan_out(get_request, WorkItems(items, expand, on_done=on_done),
+                                                         self.max_workers)
+
     def sync(self):
         """Yield's processed SDK object dicts to the caller."""
         for obj in self.get_objects():
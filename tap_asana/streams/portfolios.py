@@ -1,5 +1,5 @@
 from tap_asana.context import Context
-from tap_asana.streams.base import Stream
+from tap_asana.streams.base import Stream, BATCH_SIZE
 
 
 class Portfolios(Stream):
@@ -29,15 +29,26 @@ class Portfolios(Stream):
 
     def get_objects(self):
         """Get stream object"""
-        opt_fields = ",".join(self.fields)
-        for workspace in self.call_api("workspaces"):
+        opt_fields = self.get_opt_fields()
+        for workspace in self.get_workspaces():
             # NOTE: Currently, API users can only get a list of portfolios that they themselves own; owner="me"
-            for portfolio in Context.asana.client.portfolios.get_portfolios(
+            portfolios = Context.asana.client.portfolios.get_portfolios(
                 workspace=workspace["gid"],
                 owner="me",
                 opt_fields=opt_fields,
                 timeout=self.request_timeout,
-            ):
+            )
+            if not self.is_field_selected("portfolio_items"):
+                for portfolio in portfolios:
+                    yield portfolio
+                continue
+            if self.use_batch:
+                # fetch the items of BATCH_SIZE portfolios per batch API request
+                for portfolio in self.fan_out(self.add_items_in_batch, portfolios, batch_size=BATCH_SIZE):
+                    yield portfolio
+                continue
+
+            for portfolio in portfolios:
                 # portfolio_items are typically the projects in a portfolio
                 portfolio_items = []
                 for (
@@ -49,5 +60,14 @@ class Portfolios(Stream):
                 portfolio["portfolio_items"] = portfolio_items
                 yield portfolio
 
+    def add_items_in_batch(self, portfolios):
+        """Return the portfolios with their items fetched in one batch"""
+        items = self.get_collections_in_batch(
+            [f"/portfolios/{portfolio['gid']}/items" for portfolio in portfolios]
+        )
+        for portfolio, portfolio_items in zip(portfolios, items):
+            portfolio["portfolio_items"] = portfolio_items
+        return portfolios
+
 
 Context.stream_objects["portfolios"] = Portfolios
@@ -42,10 +42,10 @@ class Projects(Stream):
 
   def get_objects(self):
     """Get stream object"""
-    opt_fields = ",".join(self.fields)
+    opt_fields = self.get_opt_fields()
     bookmark = self.get_bookmark()
     session_bookmark = bookmark
-    for workspace in self.call_api("workspaces"):
+    for workspace in self.get_workspaces():
       for project in self.call_api("projects", workspace=workspace["gid"], opt_fields=opt_fields):
         session_bookmark = self.get_updated_session_bookmark(session_bookmark, project[self.replication_key])
         if self.is_bookmark_old(project[self.replication_key]):
@@ -4,6 +4,7 @@ from tap_asana.streams.base import Stream
 
 class Sections(Stream):
     replication_method = "FULL_TABLE"
+    uses_project_ids = True
     name = "sections"
 
     fields = [
@@ -18,23 +19,27 @@ class Sections(Stream):
     def get_objects(self):
         """Get stream object"""
         # list of project ids
-        project_ids = []
-
-        opt_fields = ",".join(self.fields)
-
-        for workspace in self.call_api("workspaces"):
-            for project in self.call_api("projects", workspace=workspace["gid"]):
-                project_ids.append(project["gid"])
-
-        # iterate on all project ids and execute rest of the sync
-        for project_id in project_ids:
-            for section in Context.asana.client.sections.get_sections_for_project(
-                project_gid=project_id,
-                owner="me",
-                opt_fields=opt_fields,
-                timeout=self.request_timeout,
-            ):
+        project_ids = self.get_project_ids()
+
+        opt_fields = self.get_opt_fields()
+
+        if self.use_async:
+            # paginate the sections of up to `max_workers` projects at a time with the async engine
+            sections = self.fan_out_async(
+                lambda project_id: (f"/projects/{project_id}/sections", {"owner": "me", "opt_fields": opt_fields}),
+                project_ids)
+            for _, section in sections:
                 yield section
+        else:
+            # iterate on all project ids and execute rest of the sync
+            for project_id in project_ids:
+                for section in Context.asana.client.sections.get_sections_for_project(
+                    project_gid=project_id,
+                    owner="me",
+                    opt_fields=opt_fields,
+                    timeout=self.request_timeout,
+                ):
+                    yield section
 
 
 Context.stream_objects["sections"] = Sections
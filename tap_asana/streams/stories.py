@@ -1,3 +1,4 @@
+from tap_asana.checkpoint import ProjectCheckpoint
 from tap_asana.context import Context
 from tap_asana.streams.base import Stream
 
@@ -5,6 +6,7 @@ from tap_asana.streams.base import Stream
 class Stories(Stream):
     name = "stories"
     replication_method = "INCREMENTAL"
+    uses_project_ids = True
     replication_key = "created_at"
 
     fields = [
@@ -67,31 +69,65 @@ class Stories(Stream):
         """Get stream object"""
         bookmark = self.get_bookmark()
         session_bookmark = bookmark
-        opt_fields = ",".join(self.fields)
+        opt_fields = self.get_opt_fields()
+        # A new story always bumps its task's `modified_at`, so only tasks
+        # modified since the stories bookmark can have stories to sync
+        modified_since = bookmark.strftime("%Y-%m-%dT%H:%M:%S.%f")
 
-        # list of project ids
-        project_ids = []
+        # list of project ids, without those completed by an interrupted sync
+        checkpoint = ProjectCheckpoint(self.name, modified_since)
+        project_ids = checkpoint.get_remaining(self.get_project_ids())
 
-        for workspace in self.call_api("workspaces"):
-            for project in self.call_api("projects", workspace=workspace["gid"]):
-                project_ids.append(project["gid"])
+        def fetch_tasks(project_id):
+            if self.use_events:
+                task_gids = self.get_changed_task_gids(project_id)
+                if task_gids is not None:
+                    return [(project_id, {"gid": task_gid}) for task_gid in task_gids]
+            tasks = self.call_api(
+                "tasks", project=project_id, modified_since=modified_since
+            )
+            return ((project_id, task) for task in tasks)
 
-        # iterate over all project ids and continue fetching
-        for project_id in project_ids:
-            for task in self.call_api("tasks", project=project_id):
-                task_gid = task.get("gid")
-                for story in Context.asana.client.stories.get_stories_for_task(
-                    task_gid=task_gid,
-                    opt_fields=opt_fields,
-                    timeout=self.request_timeout,
-                ):
-                    session_bookmark = self.get_updated_session_bookmark(
-                        session_bookmark, story[self.replication_key]
-                    )
-                    if self.is_bookmark_old(story[self.replication_key]):
-                        yield story
+        def fetch_stories(project_task):
+            _, task = project_task
+            return Context.asana.client.stories.get_stories_for_task(
+                task_gid=task.get("gid"),
+                opt_fields=opt_fields,
+                timeout=self.request_timeout,
+            )
 
-        self.update_bookmark(session_bookmark)
+        def list_tasks():
+            # The changed tasks of `use_events` are looked up with the SDK
+            if self.use_async and not self.use_events:
+                tasks = self.fan_out_async(
+                    lambda project_id: ("/tasks", {"project": project_id, "modified_since": modified_since}),
+                    project_ids, on_done=checkpoint.listed)
+            else:
+                tasks = self.fan_out(fetch_tasks, project_ids, on_done=checkpoint.listed)
+            # count each task for its project's checkpoint before fetching its stories
+            for project_id, task in tasks:
+                checkpoint.add(project_id)
+                yield project_id, task
+
+        # list the tasks of every project and fetch the stories of up to
+        # `max_workers` tasks at a time, keeping each task's stories in order
+        if self.use_async:
+            stories = (story for _, story in self.fan_out_async(
+                lambda project_task: (f"/tasks/{project_task[1]['gid']}/stories", {"opt_fields": opt_fields}),
+                list_tasks(), on_done=lambda project_task: checkpoint.done(project_task[0])))
+        else:
+            stories = self.fan_out(fetch_stories, list_tasks(),
+                                   on_done=lambda project_task: checkpoint.done(project_task[0]))
+        for story in stories:
+            session_bookmark = self.get_updated_session_bookmark(
+                session_bookmark, story[self.replication_key]
+            )
+            if self.is_bookmark_old(story[self.replication_key]):
+                yield story
+
+        checkpoint.finish()
+        self.save_sync_tokens()
+        self.update_bookmark(checkpoint.cap(session_bookmark))
 
 
 Context.stream_objects["stories"] = Stories
@@ -1,7 +1,8 @@
 # pylint:disable=duplicate-code
 import singer
+from tap_asana.checkpoint import ProjectCheckpoint
 from tap_asana.context import Context
-from tap_asana.streams.base import Stream
+from tap_asana.streams.base import Stream, BATCH_SIZE
 
 LOGGER = singer.get_logger()
 
@@ -11,6 +12,8 @@ class SubTasks(Stream):
     name = "subtasks"
     replication_key = "modified_at"
     replication_method = "INCREMENTAL"
+    uses_project_ids = True
+    required_fields = ["num_subtasks"]
     fields = [
         "gid",
         "resource_type",
@@ -54,34 +57,104 @@ class SubTasks(Stream):
 
     def get_objects(self):
         """Get stream object"""
-        # list of project ids
-        project_ids = []
-        opt_fields = ",".join(self.fields)
+        opt_fields = self.get_opt_fields()
         bookmark = self.get_bookmark()
         session_bookmark = bookmark
-        for workspace in self.call_api("workspaces"):
-            for project in self.call_api("projects", workspace=workspace["gid"]):
-                project_ids.append(project["gid"])
+        # list of project ids, without those completed by an interrupted sync
+        checkpoint = ProjectCheckpoint(self.name, bookmark.strftime("%Y-%m-%dT%H:%M:%S.%f"))
+        project_ids = checkpoint.get_remaining(self.get_project_ids())
 
-        for indx, project_id in enumerate(project_ids, 1):
+        def fetch_task_gids(project):
+            indx, project_id = project
             LOGGER.info("Fetching Subtasks for project: %s/%s", indx, len(project_ids))
-            tasks_list = self.call_api("tasks", project=project_id, opt_fields=opt_fields)
-            for task in tasks_list:
-                for subt in self.fetch_children(task, opt_fields):
-                    session_bookmark = self.get_updated_session_bookmark(
-                        session_bookmark, subt[self.replication_key]
-                    )
-                    if self.is_bookmark_old(subt[self.replication_key]):
-                        yield subt
-        self.update_bookmark(session_bookmark)
-
-    def fetch_children(self, p_task, opt_fields):
-        subtasks_children = []
-        resource = getattr(Context.asana.client, "tasks")
-        subtasks = list(resource.get_subtasks_for_task(p_task.get("gid"), opt_fields=opt_fields))
-        for s_task in subtasks:
-            subtasks_children.extend(self.fetch_children(s_task, opt_fields))
-        return subtasks + subtasks_children
+            # Every subtask tree is walked, even with `use_events`: the events of a
+            # project do not report the changes of subtasks outside of the project.
+            # Only the parent tasks' gids and subtask counts are needed
+            for task in self.call_api("tasks", project=project_id, opt_fields="gid,num_subtasks"):
+                if self.has_subtasks(task):
+                    yield project_id, task["gid"]
+
+        def fetch_subtasks(project_task_gid):
+            project_id, task_gid = project_task_gid
+            subtasks = Context.asana.client.tasks.get_subtasks_for_task(
+                task_gid, opt_fields=opt_fields, timeout=self.request_timeout
+            )
+            for subt in subtasks:
+                yield project_id, subt
+
+        def fetch_subtasks_in_batch(project_task_gids):
+            subtasks = self.get_collections_in_batch(
+                [f"/tasks/{task_gid}/subtasks" for _, task_gid in project_task_gids],
+                fields=opt_fields.split(","),
+            )
+            for (project_id, _), task_subtasks in zip(project_task_gids, subtasks):
+                for subt in task_subtasks:
+                    yield project_id, subt
+
+        def list_task_gids_async():
+            tasks = self.fan_out_async(
+                lambda project: ("/tasks", {"project": project[1], "opt_fields": "gid,num_subtasks"}),
+                enumerate(project_ids, 1), on_done=lambda project: checkpoint.listed(project[1]))
+            for (_, project_id), task in tasks:
+                if self.has_subtasks(task):
+                    yield project_id, task["gid"]
+
+        def list_task_gids():
+            if self.use_async:
+                task_gids = list_task_gids_async()
+            else:
+                task_gids = self.fan_out(fetch_task_gids, enumerate(project_ids, 1),
+                                         on_done=lambda project: checkpoint.listed(project[1]))
+            # count each task for its project's checkpoint before walking its subtasks
+            for project_id, task_gid in task_gids:
+                checkpoint.add(project_id)
+                yield project_id, task_gid
+
+        def expand(project_subt):
+            project_id, subt = project_subt
+            children = [(project_id, gid) for gid in self.children_to_fetch(subt)]
+            for _ in children:
+                checkpoint.add(project_id)
+            return children
+
+        def batch_done(project_task_gids):
+            for project_id, _ in project_task_gids:
+                checkpoint.done(project_id)
+
+        # walk every task's subtask tree breadth-first, fetching the children
+        # of up to `max_workers` tasks (or batches of tasks) at a time
+        if self.use_batch:
+            subtasks = self.fan_out(fetch_subtasks_in_batch, list_task_gids(), expand=expand,
+                                    batch_size=BATCH_SIZE, on_done=batch_done)
+        elif self.use_async:
+            # records come as ((project id, task gid), subtask) pairs
+            subtasks = self.fan_out_async(
+                lambda project_task_gid: (f"/tasks/{project_task_gid[1]}/subtasks", {"opt_fields": opt_fields}),
+                list_task_gids(), expand=lambda task_subt: expand((task_subt[0][0], task_subt[1])),
+                on_done=lambda project_task_gid: checkpoint.done(project_task_gid[0]))
+        else:
+            subtasks = self.fan_out(fetch_subtasks, list_task_gids(), expand=expand,
+                                    on_done=lambda project_task_gid: checkpoint.done(project_task_gid[0]))
+        for _, subt in subtasks:
+            session_bookmark = self.get_updated_session_bookmark(
+                session_bookmark, subt[self.replication_key]
+            )
+            if self.is_bookmark_old(subt[self.replication_key]):
+                yield subt
+        checkpoint.finish()
+        self.update_bookmark(checkpoint.cap(session_bookmark))
+
+    @staticmethod
+    def has_subtasks(task):
+        """Return False only when the task's `num_subtasks` says it has none"""
+        # `num_subtasks` is part of the requested fields; fetch anyway if it is missing
+        return task.get("num_subtasks") != 0
+
+    def children_to_fetch(self, subt):
+        """Return the subtask gid to queue for its own subtasks lookup, if it has any"""
+        if self.has_subtasks(subt):
+            return [subt["gid"]]
+        return []
 
 
 Context.stream_objects["subtasks"] = SubTasks
@@ -21,9 +21,9 @@ class Tags(Stream):
     def get_objects(self):
         """Get stream object"""
         bookmark = self.get_bookmark()
-        opt_fields = ",".join(self.fields)
+        opt_fields = self.get_opt_fields()
         session_bookmark = bookmark
-        for workspace in self.call_api("workspaces"):
+        for workspace in self.get_workspaces():
             for tag in self.call_api(
                 "tags", workspace=workspace["gid"], opt_fields=opt_fields
             ):
@@ -1,11 +1,28 @@
+import datetime
+
+import singer
+from asana.error import AsanaError, PremiumOnlyError, ServerError
+from singer import utils
+from tap_asana.checkpoint import ProjectCheckpoint
 from tap_asana.context import Context
-from tap_asana.streams.base import Stream
+from tap_asana.streams.base import Stream, asana_error_handling, DATE_WINDOW_SIZE
+
+LOGGER = singer.get_logger()
+
+# The task search API returns at most this many tasks and can't be paginated
+SEARCH_RESULT_CAP = 100
+
+# Search windows are never shrunk below this size
+MIN_SEARCH_WINDOW = datetime.timedelta(minutes=1)
 
 
 class Tasks(Stream):
     name = "tasks"
     replication_key = "modified_at"
     replication_method = "INCREMENTAL"
+    uses_project_ids = True
+    # Task search skips the tasks without projects
+    required_fields = ["projects"]
     fields = [
         "gid",
         "resource_type",
@@ -49,33 +66,128 @@ class Tasks(Stream):
 
     def get_objects(self):
         """Get stream object"""
-        # list of project ids
-        project_ids = []
-
-        opt_fields = ",".join(self.fields)
+        opt_fields = self.get_opt_fields()
         bookmark = self.get_bookmark()
         session_bookmark = bookmark
         modified_since = bookmark.strftime("%Y-%m-%dT%H:%M:%S.%f")
 
-        for workspace in self.call_api("workspaces"):
-            for project in self.call_api("projects", workspace=workspace["gid"]):
-                project_ids.append(project["gid"])
-
-        # iterate over all project ids and continue fetching
-        for project_id in project_ids:
-            for task in self.call_api(
+        def fetch_tasks(project_id):
+            if self.use_events:
+                task_gids = self.get_changed_task_gids(project_id)
+                if task_gids is not None:
+                    return self.get_tasks(task_gids, opt_fields)
+            return self.call_api(
                 "tasks",
                 project=project_id,
                 opt_fields=opt_fields,
                 modified_since=modified_since,
-            ):
-                session_bookmark = self.get_updated_session_bookmark(
-                    session_bookmark, task[self.replication_key]
-                )
-                if self.is_bookmark_old(task[self.replication_key]):
+            )
+
+        def search_tasks(workspace):
+            try:
+                for task in self.search_tasks(workspace["gid"], bookmark, opt_fields):
                     yield task
+            except PremiumOnlyError:
+                LOGGER.warning("Task search unavailable in workspace %s, scanning its projects", workspace["gid"])
+                for project in self.call_api("projects", workspace=workspace["gid"]):
+                    for task in fetch_tasks(project["gid"]):
+                        yield task
+
+        checkpoint = ProjectCheckpoint(self.name, modified_since)
+        if self.use_search:
+            # search each workspace for the tasks modified since the bookmark
+            tasks = self.fan_out(search_tasks, self.get_workspaces())
+        elif self.use_async and not self.use_events:
+            # paginate the tasks of up to `max_workers` projects at a time with the async engine
+            tasks = (task for _, task in self.fan_out_async(
+                lambda project_id: ("/tasks", {"project": project_id, "opt_fields": opt_fields,
+                                               "modified_since": modified_since}),
+                checkpoint.get_remaining(self.get_project_ids()), on_done=checkpoint.listed))
+        else:
+            # fetch the tasks of up to `max_workers` projects at a time,
+            # checkpointing every project whose tasks are all written
+            tasks = self.fan_out(fetch_tasks, checkpoint.get_remaining(self.get_project_ids()),
+                                 on_done=checkpoint.listed)
+
+        for task in tasks:
+            session_bookmark = self.get_updated_session_bookmark(
+                session_bookmark, task[self.replication_key]
+            )
+            if self.is_bookmark_old(task[self.replication_key]):
+                yield task
+
+        checkpoint.finish()
+        self.save_sync_tokens()
+        self.update_bookmark(checkpoint.cap(session_bookmark))
+
+    @asana_error_handling
+    def call_search_api(self, workspace_gid, params):
+        """Run one task search, returning None when Asana fails with a 500"""
+        try:
+            # No SDK retries, a failing window is shrunk instead of retried
+            return Context.asana.client.get(
+                f"/workspaces/{workspace_gid}/tasks/search",
+                params,
+                max_retries=0,
+                timeout=self.request_timeout,
+            )
+        except ServerError:
+            return None
+
+    def search_tasks(self, workspace_gid, start, opt_fields):
+        """
+        Yield the workspace's tasks modified since `start` using the task search
+        API, one `modified_at` window at a time. A window is halved when it hits
+        the search result cap or Asana fails with a 500, and grows back to
+        DATE_WINDOW_SIZE days after a successful search.
+        """
+        max_window = datetime.timedelta(days=DATE_WINDOW_SIZE)
+        window = max_window
+        end = utils.now()
+        # The versions of the tasks returned by the previous search, which the
+        # overlap of the next window returns again
+        previous = set()
+        while start < end:
+            window_end = min(start + window, end)
+            tasks = self.call_search_api(workspace_gid, {
+                # overlap windows by a second as the search bounds are exclusive
+                "modified_at.after": self.format_search_date(start - datetime.timedelta(seconds=1)),
+                "modified_at.before": self.format_search_date(window_end),
+                "is_subtask": False,
+                "sort_by": "modified_at",
+                "sort_ascending": True,
+                "limit": SEARCH_RESULT_CAP,
+                "opt_fields": opt_fields,
+            })
+            capped = tasks is not None and len(tasks) >= SEARCH_RESULT_CAP
+            if (tasks is None or capped) and window > MIN_SEARCH_WINDOW:
+                window = max(window / 2, MIN_SEARCH_WINDOW)
+                LOGGER.info("Shrinking task search window for workspace %s to %s", workspace_gid, window)
+                continue
+            if tasks is None:
+                raise AsanaError(f"Task search failed for workspace {workspace_gid} at the minimum window size")
+
+            for task in tasks:
+                # Only tasks in projects are synced, as with the project scan
+                if task.get("projects") and (task["gid"], task["modified_at"]) not in previous:
+                    yield task
+            previous = {(task["gid"], task["modified_at"]) for task in tasks}
+
+            if capped:
+                # Results are sorted by modified_at, continue after the last one
+                last_modified = utils.strptime_to_utc(tasks[-1]["modified_at"])
+                if last_modified <= start:
+                    raise AsanaError(f"More than {SEARCH_RESULT_CAP} tasks of workspace {workspace_gid} "
+                                     f"were modified at {tasks[-1]['modified_at']}")
+                start = last_modified
+            else:
+                start = window_end
+                window = min(window * 2, max_window)
 
-        self.update_bookmark(session_bookmark)
+    @staticmethod
+    def format_search_date(value):
+        """Format a datetime for the task search `modified_at` filters"""
+        return value.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
 
 
 Context.stream_objects["tasks"] = Tasks
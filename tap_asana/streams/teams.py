@@ -1,5 +1,5 @@
 from tap_asana.context import Context
-from tap_asana.streams.base import Stream
+from tap_asana.streams.base import Stream, BATCH_SIZE
 
 
 class Teams(Stream):
@@ -19,14 +19,25 @@ class Teams(Stream):
 
     def get_objects(self):
         """Get stream object"""
-        opt_fields = ",".join(self.fields)
-        for workspace in self.call_api("workspaces", opt_fields="gid,is_organization"):
+        opt_fields = self.get_opt_fields()
+        for workspace in self.get_workspaces():
             if workspace.get("is_organization", False):
-                for team in Context.asana.client.teams.find_by_organization(
+                teams = Context.asana.client.teams.find_by_organization(
                     organization=workspace["gid"],
                     opt_fields=opt_fields,
                     timeout=self.request_timeout,
-                ):
+                )
+                if not self.is_field_selected("users"):
+                    for team in teams:
+                        yield team
+                    continue
+                if self.use_batch:
+                    # fetch the users of BATCH_SIZE teams per batch API request
+                    for team in self.fan_out(self.add_users_in_batch, teams, batch_size=BATCH_SIZE):
+                        yield team
+                    continue
+
+                for team in teams:
                     users = []
                     for user in Context.asana.client.teams.users(
                         team=team["gid"], timeout=self.request_timeout
@@ -35,5 +46,14 @@ class Teams(Stream):
                     team["users"] = users
                     yield team
 
+    def add_users_in_batch(self, teams):
+        """Return the teams with their users fetched in one batch"""
+        users = self.get_collections_in_batch(
+            [f"/teams/{team['gid']}/users" for team in teams]
+        )
+        for team, team_users in zip(teams, users):
+            team["users"] = team_users
+        return teams
+
 
 Context.stream_objects["teams"] = Teams
@@ -17,8 +17,8 @@ class Users(Stream):
 
     def get_objects(self):
         """Get stream object"""
-        opt_fields = ",".join(self.fields)
-        for workspace in self.call_api("workspaces"):
+        opt_fields = self.get_opt_fields()
+        for workspace in self.get_workspaces():
             for user in self.call_api(
                 "users", workspace=workspace["gid"], opt_fields=opt_fields
             ):
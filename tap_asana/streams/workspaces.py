@@ -16,7 +16,7 @@ class Workspaces(Stream):
 
     def get_objects(self):
         """Get stream object"""
-        opt_fields = ",".join(self.fields)
+        opt_fields = self.get_opt_fields()
         for workspace in self.call_api("workspaces", opt_fields=opt_fields):
             yield workspace
 
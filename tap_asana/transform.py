@@ -0,0 +1,300 @@
+import datetime
+import decimal
+import re
+import time
+
+import singer
+from singer import utils
+from singer.transform import Transformer, Error, SchemaMismatch, breadcrumb_path, string_to_datetime
+
+LOGGER = singer.get_logger()
+
+# Date-times as Asana formats them, e.g. "2021-01-01T12:00:00.000Z"
+ASANA_DATETIME = re.compile(r"^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?Z$")
+
+
+def transform_datetime(value):
+    """Format a date-time value as `Transformer` does, without parsing Asana's own format"""
+    if value is None or value == "":
+        return None
+    match = ASANA_DATETIME.match(value) if isinstance(value, str) else None
+    if match:
+        year, month, day, hour, minute, second, fraction = match.groups()
+        try:
+            # Only checks that the date-time exists, the output is built from the matched text
+            datetime.datetime(int(year), int(month), int(day), int(hour), int(minute), int(second))
+        except ValueError:
+            return string_to_datetime(value)
+        return f"{year}-{month}-{day}T{hour}:{minute}:{second}.{(fraction or '').ljust(6, '0')}Z"
+    return string_to_datetime(value)
+
+
+def flatten_path(path):
+    """Return the list of keys of a path built as nested `(parent, key)` pairs"""
+    keys = []
+    while path is not None:
+        path, key = path
+        keys.append(key)
+    keys.reverse()
+    return keys
+
+
+class StreamTransformer(Transformer):
+    """
+    Transformer compiled once for a stream's schema and selection metadata.
+
+    `transform_record` returns the same records as `Transformer.transform`
+    but resolves the schema's types, formats and the fields to filter out
+    ahead of time, so each record is only walked once along a precomputed
+    plan. Removed and filtered fields are tracked and logged as by
+    `Transformer`.
+    """
+
+    def __init__(self, schema, mdata=None):
+        super().__init__()
+        self.filter_paths = self.compile_filter(mdata or {})
+        self.transform_fn = self.compile(schema)
+
+    def transform_record(self, data):
+        """Filter and transform one record of the stream"""
+        for breadcrumb in self.filter_paths:
+            self.filter_path(data, breadcrumb, 0)
+
+        success, transformed_data = self.transform_fn(data, None)
+        if not success:
+            raise SchemaMismatch(self.errors)
+        return transformed_data
+
+    @staticmethod
+    def compile_filter(mdata):
+        """Return the breadcrumbs of the fields `filter_data_by_metadata` would remove"""
+        filter_paths = []
+        for breadcrumb, entry in mdata.items():
+            if not breadcrumb or entry.get("inclusion") == "automatic":
+                continue
+            if entry.get("selected") is not False and entry.get("inclusion") != "unsupported":
+                continue
+            # Fields below an automatic field are kept as the filter does not descend into it
+            parents = [breadcrumb[:i] for i in range(2, len(breadcrumb)) if breadcrumb[i - 2] == "properties"]
+            if any(mdata.get(parent, {}).get("inclusion") == "automatic" for parent in parents):
+                continue
+            filter_paths.append(breadcrumb)
+        # Parents go first so fields inside a removed parent are not tracked as filtered
+        return sorted(filter_paths, key=len)
+
+    def filter_path(self, data, breadcrumb, index):
+        """Remove the field at `breadcrumb` from `data`, following every item of the arrays on the way"""
+        if breadcrumb[index] == "items":
+            if isinstance(data, list):
+                for row in data:
+                    self.filter_path(row, breadcrumb, index + 1)
+            return
+        if not isinstance(data, dict) or breadcrumb[index + 1] not in data:
+            return
+        if index + 2 == len(breadcrumb):
+            data.pop(breadcrumb[index + 1])
+            self.filtered.add(breadcrumb_path(breadcrumb))
+        else:
+            self.filter_path(data[breadcrumb[index + 1]], breadcrumb, index + 2)
+
+    def compile(self, schema):
+        """
+        Return a function of `(data, path)` returning `(success, data)` for `schema`,
+        following the rules of `Transformer.transform_recur`
+        """
+        if "anyOf" in schema:
+            return self.compile_any_of(schema)
+
+        if "type" not in schema:
+            return lambda data, path: (True, data)
+
+        types = schema["type"]
+        if not isinstance(types, list):
+            types = [types]
+        # "null" is always tried last
+        types = [typ for typ in types if typ != "null"] + [typ for typ in types if typ == "null"]
+        fns = [self.compile_type(typ, schema) for typ in types]
+
+        def transform_types(data, path):
+            for fn in fns:
+                success, transformed_data = fn(data, path)
+                if success:
+                    return success, transformed_data
+            self.errors.append(Error(flatten_path(path), data, schema, logging_level=LOGGER.level))
+            return False, None
+
+        return transform_types
+
+    def compile_any_of(self, schema):
+        fns = [self.compile(subschema) for subschema in schema["anyOf"]]
+
+        def transform_any_of(data, path):
+            for fn in fns:
+                success, transformed_data = fn(data, path)
+                if success:
+                    return success, transformed_data
+            self.errors.append(Error(flatten_path(path), data, schema, logging_level=LOGGER.level))
+            return False, None
+
+        return transform_any_of
+
+    def compile_type(self, typ, schema):  # pylint: disable=too-many-return-statements
+        """Return the function transforming data to one of the schema's types"""
+        if typ == "null":
+            return transform_null
+        if schema.get("format") == "date-time":
+            return transform_date_time
+        if schema.get("format") == "singer.decimal":
+            return transform_decimal
+        if typ == "object":
+            return self.compile_object(schema.get("properties", {}), schema.get("patternProperties"))
+        if typ == "array":
+            item_fn = self.compile(schema["items"])
+
+            def transform_array(data, path):
+                if not isinstance(data, list):
+                    return False, data
+                result = []
+                all_success = True
+                for i, row in enumerate(data):
+                    success, subdata = item_fn(row, (path, i))
+                    if not success:
+                        all_success = False
+                    result.append(subdata)
+                return all_success, result
+
+            return transform_array
+        return SIMPLE_TYPES.get(typ, transform_unknown)
+
+    def compile_object(self, properties, pattern_properties):
+        if properties == {} and not pattern_properties:
+            return lambda data, path: (True, data) if isinstance(data, dict) else (False, data)
+
+        field_fns = {key: self.compile(sub_schema) for key, sub_schema in properties.items()}
+        patterns = [(re.compile(pattern), sub_schema) for pattern, sub_schema in (pattern_properties or {}).items()]
+        pattern_fns = {}
+
+        def get_field_fn(key):
+            # Fields matched by patternProperties are compiled the first time they are seen
+            if key not in pattern_fns:
+                pattern_schemas = [sub_schema for pattern, sub_schema in patterns if pattern.match(key)]
+                if key in properties:
+                    pattern_fns[key] = field_fns[key]
+                elif pattern_schemas:
+                    pattern_fns[key] = self.compile({"anyOf": pattern_schemas})
+                else:
+                    pattern_fns[key] = None
+            return pattern_fns[key]
+
+        def transform_object(data, path):
+            if not isinstance(data, dict):
+                return False, data
+            result = {}
+            all_success = True
+            for key, value in data.items():
+                fn = field_fns.get(key) if not patterns else get_field_fn(key)
+                if fn is None:
+                    self.removed.add(".".join(map(str, flatten_path(path) + [key])))
+                    continue
+                success, subdata = fn(value, (path, key))
+                if not success:
+                    all_success = False
+                result[key] = subdata
+            return all_success, result
+
+        return transform_object
+
+
+def transform_null(data, _path):
+    if data is None or data == "":
+        return True, None
+    return False, None
+
+
+def transform_date_time(data, _path):
+    data = transform_datetime(data)
+    if data is None:
+        return False, None
+    return True, data
+
+
+def transform_decimal(data, _path):  # pylint: disable=too-many-return-statements
+    if data is None:
+        return False, None
+    if isinstance(data, (str, float, int)):
+        try:
+            return True, str(decimal.Decimal(str(data)))
+        except Exception:  # pylint: disable=broad-except
+            return False, None
+    if isinstance(data, decimal.Decimal):
+        try:
+            if data.is_snan():
+                return True, "NaN"
+            return True, str(data)
+        except Exception:  # pylint: disable=broad-except
+            return False, None
+    return False, None
+
+
+def transform_string(data, _path):
+    if data is None:
+        return False, None
+    try:
+        return True, str(data)
+    except Exception:  # pylint: disable=broad-except
+        return False, None
+
+
+def transform_integer(data, _path):
+    if isinstance(data, str):
+        data = data.replace(",", "")
+    try:
+        return True, int(data)
+    except Exception:  # pylint: disable=broad-except
+        return False, None
+
+
+def transform_number(data, _path):
+    if isinstance(data, str):
+        data = data.replace(",", "")
+    try:
+        return True, float(data)
+    except Exception:  # pylint: disable=broad-except
+        return False, None
+
+
+def transform_boolean(data, _path):
+    if isinstance(data, str) and data.lower() == "false":
+        return True, False
+    try:
+        return True, bool(data)
+    except Exception:  # pylint: disable=broad-except
+        return False, None
+
+
+def transform_unknown(_data, _path):
+    return False, None
+
+
+SIMPLE_TYPES = {
+    "string": transform_string,
+    "integer": transform_integer,
+    "number": transform_number,
+    "boolean": transform_boolean,
+}
+
+
+class ExtractionClock():  # pylint: disable=too-few-public-methods
+    """Time of extraction of the records, read at most once per `resolution` seconds"""
+
+    def __init__(self, resolution=1):
+        self.resolution = resolution
+        self._read_at = None
+        self._now = None
+
+    def now(self):
+        monotonic = time.monotonic()
+        if self._read_at is None or monotonic - self._read_at >= self.resolution:
+            self._read_at = monotonic
+            self._now = utils.now()
+        return self._now
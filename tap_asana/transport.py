@@ -0,0 +1,112 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+import singer
+from tap_asana.rate_limit import RateLimitedAdapter, MAX_CONCURRENT_REQUESTS
+
+LOGGER = singer.get_logger()
+
+# Compressed responses: Asana's JSON shrinks several times with gzip. Set explicitly,
+# as the default of requests depends on the compression packages installed
+ACCEPT_ENCODING = "gzip, deflate"
+
+
+class TransportStats():  # pylint: disable=too-few-public-methods
+    """Requests, connections and response bytes of a TransportAdapter"""
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self._lock = threading.Lock()
+
+    def add_response(self, bytes_received, bytes_decoded):
+        with self._lock:
+            self.requests += 1
+            self.bytes_received += bytes_received
+            self.bytes_decoded += bytes_decoded
+
+
+class TransportAdapter(RateLimitedAdapter):
+    """
+    Rate limited adapter keeping a connection open for every request that may
+    be in flight, so concurrent requests reuse connections instead of opening
+    (and handshaking) new ones once the default pool of 10 is full.
+
+    Cacheable requests are made conditional on the response cache returned
+    by `get_cache`, if any, and every request is counted in the request
+    metrics returned by `get_metrics`, if any. With the profiler returned by
+    `get_profiler`, the requests and the JSON decoding of their responses
+    are timed.
+    """
+
+    def __init__(self, get_limiter, get_cache=lambda: None, get_metrics=lambda: None,
+                 get_profiler=lambda: None, **kwargs):  # pylint: disable=too-many-arguments
+        limiter = get_limiter()
+        pool_size = limiter.concurrency.max_limit if limiter is not None else MAX_CONCURRENT_REQUESTS
+        kwargs.setdefault("pool_maxsize", pool_size)
+        self.get_cache = get_cache
+        self.get_metrics = get_metrics
+        self.get_profiler = get_profiler
+        self.stats = TransportStats()
+        self._local = threading.local()
+        super().__init__(get_limiter, **kwargs)
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        cache = self.get_cache()
+        cacheable = cache is not None and not kwargs.get("stream") and cache.is_cacheable(request)
+        cached = cache.add_validators(request) if cacheable else None
+        self._local.queued_at = time.monotonic()
+        profiler = self.get_profiler()
+        if profiler is not None:
+            with profiler.phase("api_wait"):
+                response = super().send(request, **kwargs)
+        else:
+            response = super().send(request, **kwargs)
+        if not kwargs.get("stream") and response.raw is not None:
+            # The body is read (if not already) to count the bytes on the wire, before decompression
+            bytes_decoded = len(response.content)
+            self.stats.add_response(response.raw.tell(), bytes_decoded)
+        if cacheable:
+            response = cache.update(request, response, cached)
+        return response
+
+    def send_request(self, request, **kwargs):
+        metrics = self.get_metrics()
+        if metrics is None:
+            return super().send_request(request, **kwargs)
+        # The latency excludes the wait for the rate limiter, counted separately
+        sent_at = time.monotonic()
+        status_code = None
+        bytes_received = 0
+        try:
+            response = super().send_request(request, **kwargs)
+            status_code = response.status_code
+            if not kwargs.get("stream") and response.raw is not None:
+                bytes_received = response.raw.tell()
+        finally:
+            metrics.add_request(urlparse(request.url).path, time.monotonic() - sent_at,
+                                sent_at - self._local.queued_at, status_code, bytes_received)
+        return response
+
+    def build_response(self, req, resp):
+        response = super().build_response(req, resp)
+        profiler = self.get_profiler()
+        if profiler is not None:
+            # The SDK decodes every response with `json()`
+            response.json = profiler.timed("json_decode", response.json)
+        return response
+
+    def get_connections_opened(self):
+        """Return the number of connections opened by the pools currently held"""
+        pools = self.poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys())
+
+    def log_stats(self):
+        stats = self.stats
+        LOGGER.info("HTTP transport: %d requests over %d connections, %d bytes received (%d decompressed)",
+                    stats.requests, self.get_connections_opened(), stats.bytes_received, stats.bytes_decoded)
+        cache = self.get_cache()
+        if cache is not None:
+            cache.log_stats()
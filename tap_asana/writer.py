@@ -0,0 +1,155 @@
+import copy
+import sys
+import time
+
+import pytz
+import simplejson
+import singer
+from singer import utils
+
+# Bytes of messages buffered before they are written to stdout
+BUFFER_SIZE = 1024 * 1024
+# Seconds after which buffered messages are written even without a STATE message
+FLUSH_INTERVAL = 1
+# Records or seconds after which an updated state is written
+STATE_INTERVAL_RECORDS = 10000
+STATE_INTERVAL_SECONDS = 30
+
+# Same encoder as `singer.format_message`, reused for every message
+ENCODER = simplejson.JSONEncoder(use_decimal=True)
+
+
+# The buffer, state throttling and encoding caches are kept together for the hot path
+class Writer():  # pylint: disable=too-many-instance-attributes
+    """
+    Writes Singer messages to stdout.
+
+    RECORD messages are encoded directly into the bytes `singer.write_record`
+    produces and buffered. The buffer is written and stdout flushed with every
+    STATE message, once it holds `BUFFER_SIZE` characters or when a record
+    arrives more than `FLUSH_INTERVAL` seconds after the last flush.
+
+    State updates are coalesced: an updated state is only written once
+    `state_interval_records` records or `state_interval_seconds` seconds have
+    passed since the last STATE message, or at the next `write_state`. The
+    state is serialised when it is written, after every record written
+    before it, so it never runs ahead of the records.
+    """
+
+    def __init__(self, state_interval_records=STATE_INTERVAL_RECORDS,
+                 state_interval_seconds=STATE_INTERVAL_SECONDS):
+        self.state_interval_records = state_interval_records
+        self.state_interval_seconds = state_interval_seconds
+        self.pending_state = None
+        self.records_since_state = 0
+        self.state_written_at = time.monotonic()
+        self.buffer = []
+        self.buffered_size = 0
+        self.flushed_at = time.monotonic()
+        self._stream_prefixes = {}
+        self._time_extracted = None
+        self._time_extracted_suffix = None
+
+    @classmethod
+    def from_config(cls, config, *args):
+        """Create the writer with the state intervals of the config"""
+        state_interval_records = config.get("state_interval_records")
+        state_interval_seconds = config.get("state_interval_seconds")
+        return cls(
+            *args,
+            state_interval_records=int(state_interval_records)
+            if state_interval_records and int(state_interval_records) else STATE_INTERVAL_RECORDS,
+            state_interval_seconds=float(state_interval_seconds)
+            if state_interval_seconds and float(state_interval_seconds) else STATE_INTERVAL_SECONDS,
+        )
+
+    def write_record(self, stream_id, record, time_extracted=None):
+        """Write a RECORD message"""
+        prefix = self._stream_prefixes.get(stream_id)
+        if prefix is None:
+            prefix = '{"type": "RECORD", "stream": ' + ENCODER.encode(stream_id) + ', "record": '
+            self._stream_prefixes[stream_id] = prefix
+        if time_extracted:
+            self.write_line(prefix + ENCODER.encode(record) + self.get_time_extracted_suffix(time_extracted))
+        else:
+            self.write_line(prefix + ENCODER.encode(record) + "}\n")
+        self.records_since_state += 1
+        if self.pending_state is not None and self.is_state_due():
+            self.write_state(self.pending_state)
+
+    def write_schema(self, stream_id, schema, key_properties):
+        """Write a SCHEMA message"""
+        message = singer.SchemaMessage(stream=stream_id, schema=schema, key_properties=key_properties)
+        self.write_line(singer.format_message(message) + "\n")
+
+    def update_state(self, state):
+        """Write the updated state once it is due"""
+        self.pending_state = state
+        if self.is_state_due():
+            self.write_state(state)
+
+    def is_state_due(self):
+        return (self.records_since_state >= self.state_interval_records
+                or time.monotonic() - self.state_written_at >= self.state_interval_seconds)
+
+    def write_state(self, state):
+        """Write a STATE message now and flush every message before it"""
+        self.pending_state = None
+        self.records_since_state = 0
+        self.state_written_at = time.monotonic()
+        self.write_line(singer.format_message(singer.StateMessage(value=state)) + "\n")
+        self.flush()
+
+    def get_time_extracted_suffix(self, time_extracted):
+        # Records extracted within the same clock reading share the formatted time
+        if time_extracted != self._time_extracted:
+            self._time_extracted = time_extracted
+            formatted = utils.strftime(time_extracted.astimezone(pytz.utc))
+            self._time_extracted_suffix = f', "time_extracted": "{formatted}"}}\n'
+        return self._time_extracted_suffix
+
+    def write_line(self, line):
+        self.buffer.append(line)
+        self.buffered_size += len(line)
+        if self.buffered_size >= BUFFER_SIZE or time.monotonic() - self.flushed_at >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered messages to stdout"""
+        if self.buffer:
+            sys.stdout.write("".join(self.buffer))
+            self.buffer = []
+            self.buffered_size = 0
+        sys.stdout.flush()
+        self.flushed_at = time.monotonic()
+
+
+class QueueWriter(Writer):
+    """
+    Writer of a stream worker process. It forwards records and the stream's
+    bookmark to the parent process, which owns the only stdout writer.
+    State updates are coalesced as by `Writer` before they are forwarded.
+    """
+
+    def __init__(self, messages, stream_id, **kwargs):
+        super().__init__(**kwargs)
+        self.messages = messages
+        self.stream_id = stream_id
+
+    def write_record(self, stream_id, record, time_extracted=None):
+        self.messages.put(("record", stream_id, (record, time_extracted)))
+        self.records_since_state += 1
+        if self.pending_state is not None and self.is_state_due():
+            self.write_state(self.pending_state)
+
+    def write_state(self, state):
+        self.pending_state = None
+        self.records_since_state = 0
+        self.state_written_at = time.monotonic()
+        bookmark = state.get("bookmarks", {}).get(self.stream_id)
+        self.messages.put(("state", self.stream_id, copy.deepcopy(bookmark)))
+
+    def flush(self):
+        """Forward the pending state"""
+        if self.pending_state is not None:
+            self.write_state(self.pending_state)
@@ -0,0 +1,318 @@
+"""
+Local fake of the Asana API for the benchmark.
+
+Serves synthetic workspaces, users, teams, projects, sections, tags,
+portfolios, tasks, subtasks and stories at a configurable scale, with
+Asana's offset pagination, `opt_fields`, `modified_since`, gzip responses
+and an injected latency per request. Records are generated from the tap's
+schemas, so their size and shape follow what the tap extracts.
+"""
+import base64
+import collections
+import datetime
+import gzip
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+SCHEMAS_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "tap_asana", "schemas")
+
+# Number of objects per parent: workspaces in total, users, teams, projects,
+# tags and portfolios per workspace, sections and tasks per project, and
+# subtasks, stories per task
+DEFAULT_SCALE = {
+    "workspaces": 1,
+    "users": 20,
+    "teams": 3,
+    "projects": 10,
+    "tags": 5,
+    "portfolios": 2,
+    "sections": 3,
+    "tasks": 50,
+    "subtasks": 2,
+    "stories": 3,
+}
+
+# Users of a team and items of a portfolio
+TEAM_USERS = 5
+PORTFOLIO_ITEMS = 3
+
+MAX_PAGE_SIZE = 100
+BASE_TIME = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+NOTES = ("Synthetic task notes written to give the records a realistic size. " * 3).strip()
+
+
+def format_time(seconds):
+    return (BASE_TIME + datetime.timedelta(seconds=seconds)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def parse_time(value):
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=datetime.timezone.utc)
+
+
+def fake_value(field, schema, depth=0):
+    """Return a value of the field's type, for the record templates"""
+    if "anyOf" in schema:
+        schema = next((option for option in schema["anyOf"] if option.get("type") != "null"), {})
+    types = schema.get("type", [])
+    types = [types] if isinstance(types, str) else types
+    if "object" in types:
+        if depth > 0:
+            return None
+        return {key: fake_value(key, value, depth + 1) for key, value in schema.get("properties", {}).items()}
+    if "array" in types:
+        item = fake_value(field, schema.get("items", {}), depth)
+        return [item] if isinstance(item, dict) else []
+    if "string" in types:
+        if schema.get("format") == "date-time":
+            return format_time(0)
+        if field in ("notes", "html_notes", "text", "html_text", "description", "html_description"):
+            return NOTES
+        return "{} value".format(field)
+    if "integer" in types:
+        return 1
+    if "number" in types:
+        return 1.5
+    if "boolean" in types:
+        return False
+    return None
+
+
+def get_template(stream_name):
+    with open(os.path.join(SCHEMAS_DIR, stream_name + ".json")) as schema_file:
+        schema = json.load(schema_file)
+    return {field: fake_value(field, value) for field, value in schema["properties"].items()}
+
+
+def encode_offset(index):
+    return base64.urlsafe_b64encode("offset:{}".format(index).encode()).decode()
+
+
+def decode_offset(offset):
+    return int(base64.urlsafe_b64decode(offset.encode()).decode().split(":")[1])
+
+
+class FakeAsana():
+    """The synthetic objects of the fake API and the requests received, counted by route"""
+
+    def __init__(self, scale=None, latency=0.0, jitter=0.0, seed=0):
+        self.scale = dict(DEFAULT_SCALE, **(scale or {}))
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.requests = collections.Counter()
+        self.lock = threading.Lock()
+        self.templates = {name: get_template(name) for name in
+                          ["workspaces", "users", "teams", "projects", "sections", "tags",
+                           "portfolios", "tasks", "subtasks", "stories"]}
+        self.objects = {}
+        self.children = collections.defaultdict(list)
+        self.next_gid = 1000
+        for _ in range(self.scale["workspaces"]):
+            workspace = self.add("workspaces", None)
+            for kind in ["users", "teams", "tags", "portfolios"]:
+                for _ in range(self.scale[kind]):
+                    self.add(kind, workspace)
+            for _ in range(self.scale["projects"]):
+                project = self.add("projects", workspace)
+                for _ in range(self.scale["sections"]):
+                    self.add("sections", project)
+                for _ in range(self.scale["tasks"]):
+                    task = self.add("tasks", project)
+                    for _ in range(self.scale["subtasks"]):
+                        self.add("subtasks", task)
+                    for _ in range(self.scale["stories"]):
+                        self.add("stories", task)
+
+    def add(self, kind, parent):
+        gid = str(self.next_gid)
+        self.next_gid += 1
+        self.objects[gid] = (kind, parent)
+        self.children[(kind, parent)].append(gid)
+        return gid
+
+    def count(self, kind):
+        return sum(1 for object_kind, _ in self.objects.values() if object_kind == kind)
+
+    def get_workspace(self, gid):
+        kind, parent = self.objects[gid]
+        while kind != "workspaces":
+            gid = parent
+            kind, parent = self.objects[gid]
+        return gid
+
+    def render(self, gid):
+        """Return the full record of the object"""
+        kind, parent = self.objects[gid]
+        record = dict(self.templates[kind])
+        seconds = int(gid)
+        record.update(gid=gid, name="{} {}".format(kind[:-1], gid),
+                      resource_type=kind[:-1].replace("subtask", "task"))
+        for field in ["created_at", "modified_at"]:
+            if field in record:
+                record[field] = format_time(seconds)
+        if "workspace" in record:
+            record["workspace"] = {"gid": self.get_workspace(gid), "resource_type": "workspace"}
+        if kind == "workspaces":
+            record["is_organization"] = True
+        elif kind == "tasks":
+            record.update(num_subtasks=len(self.children[("subtasks", gid)]), parent=None,
+                          projects=[{"gid": parent, "resource_type": "project"}])
+        elif kind == "subtasks":
+            record.update(num_subtasks=0, parent={"gid": parent, "resource_type": "task"})
+        elif kind == "stories":
+            record["target"] = {"gid": parent, "resource_type": "task"}
+        elif kind == "sections":
+            record["project"] = {"gid": parent, "resource_type": "project"}
+        return record
+
+    def select(self, record, query):
+        """Keep the `opt_fields` of the record, or its compact form without them"""
+        if "opt_fields" in query:
+            fields = set(query["opt_fields"].split(",")) | {"gid"}
+        else:
+            fields = {"gid", "name", "resource_type"}
+        return {key: value for key, value in record.items() if key in fields}
+
+    def list(self, route, path_gid, query):
+        """Return the gids of the collection of a route"""
+        if route == "workspaces":
+            return self.children[("workspaces", None)]
+        if route in ("users", "projects", "tags", "portfolios"):
+            return self.children[(route, query.get("workspace"))]
+        if route == "teams":
+            return self.children[("teams", path_gid)]
+        if route == "team_users":
+            return self.children[("users", self.get_workspace(path_gid))][:TEAM_USERS]
+        if route == "portfolio_items":
+            return self.children[("projects", self.get_workspace(path_gid))][:PORTFOLIO_ITEMS]
+        if route == "sections":
+            return self.children[("sections", path_gid)]
+        if route == "tasks":
+            gids = self.children[("tasks", query.get("project"))]
+            if query.get("modified_since"):
+                since = parse_time(query["modified_since"])
+                gids = [gid for gid in gids if BASE_TIME + datetime.timedelta(seconds=int(gid)) >= since]
+            return gids
+        if route == "subtasks":
+            return self.children[("subtasks", path_gid)]
+        if route == "stories":
+            return self.children[("stories", path_gid)]
+        raise KeyError(route)
+
+    def get_page(self, route, path_gid, query):
+        """Return the status and payload of a page of the collection"""
+        limit = int(query.get("limit", MAX_PAGE_SIZE))
+        if limit > MAX_PAGE_SIZE:
+            return 400, {"errors": [{"message": "limit: Must be between 1 and 100"}]}
+        gids = self.list(route, path_gid, query)
+        start = decode_offset(query["offset"]) if query.get("offset") else 0
+        page = gids[start:start + limit]
+        next_page = None
+        if start + limit < len(gids):
+            next_page = {"offset": encode_offset(start + limit)}
+        return 200, {"data": [self.select(self.render(gid), query) for gid in page], "next_page": next_page}
+
+    def wait(self):
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+
+ROUTES = [
+    ("workspaces", re.compile(r"^/api/1\.0/workspaces$")),
+    ("users", re.compile(r"^/api/1\.0/users$")),
+    ("teams", re.compile(r"^/api/1\.0/organizations/(\d+)/teams$")),
+    ("team_users", re.compile(r"^/api/1\.0/teams/(\d+)/users$")),
+    ("projects", re.compile(r"^/api/1\.0/projects$")),
+    ("sections", re.compile(r"^/api/1\.0/projects/(\d+)/sections$")),
+    ("tags", re.compile(r"^/api/1\.0/tags$")),
+    ("portfolios", re.compile(r"^/api/1\.0/portfolios$")),
+    ("portfolio_items", re.compile(r"^/api/1\.0/portfolios/(\d+)/items$")),
+    ("tasks", re.compile(r"^/api/1\.0/tasks$")),
+    ("subtasks", re.compile(r"^/api/1\.0/tasks/(\d+)/subtasks$")),
+    ("stories", re.compile(r"^/api/1\.0/tasks/(\d+)/stories$")),
+    ("task", re.compile(r"^/api/1\.0/tasks/(\d+)$")),
+]
+
+
+class FakeAsanaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # The headers and the body are separate writes: without TCP_NODELAY each
+    # keep-alive response would stall on the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if urlparse(self.path).path != "/-/oauth_token":
+            self.send_json(404, {"errors": [{"message": "Not Found"}]})
+            return
+        self.server.fake.requests["oauth_token"] += 1
+        self.send_json(200, {"access_token": "fake-access-token", "token_type": "bearer",
+                             "expires_in": 3600, "refresh_token": "fake-refresh-token"})
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        fake = self.server.fake
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        for route, pattern in ROUTES:
+            match = pattern.match(url.path)
+            if match:
+                break
+        else:
+            self.send_json(404, {"errors": [{"message": "Not Found"}]})
+            return
+        with fake.lock:
+            fake.requests[route] += 1
+        fake.wait()
+        path_gid = match.group(1) if match.groups() else None
+        if route == "task":
+            if path_gid not in fake.objects:
+                self.send_json(404, {"errors": [{"message": "Not Found"}]})
+                return
+            self.send_json(200, {"data": fake.select(fake.render(path_gid), query)})
+            return
+        self.send_json(*fake.get_page(route, path_gid, query))
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=1)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class FakeAsanaServer(ThreadingHTTPServer):
+    """Serves a FakeAsana on a local port in a background thread"""
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, fake, host="127.0.0.1", port=0):
+        super().__init__((host, port), FakeAsanaHandler)
+        self.fake = fake
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return "http://{}:{}/api/1.0".format(*self.server_address)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
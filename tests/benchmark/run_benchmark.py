@@ -0,0 +1,168 @@
+"""
+End-to-end throughput benchmark of tap-asana against the local fake Asana API.
+
+Runs `tap_asana.main` in a subprocess once per stream, and once with every
+stream, and reports the records per second, requests per endpoint, peak RSS
+and wall-clock time of each run:
+
+    python tests/benchmark/run_benchmark.py --scale projects=50 --scale tasks=200 \
+        --latency 0.05 --config '{"max_workers": 8}' --output results.json
+"""
+import argparse
+import collections
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from fake_asana import DEFAULT_SCALE, FakeAsana, FakeAsanaServer
+
+STREAMS = ["workspaces", "users", "teams", "projects", "sections", "tags",
+           "portfolios", "tasks", "subtasks", "stories"]
+
+CONFIG = {
+    "client_id": "fake-client-id",
+    "client_secret": "fake-client-secret",
+    "redirect_uri": "http://127.0.0.1/callback",
+    "refresh_token": "fake-refresh-token",
+    "start_date": "2022-01-01T00:00:00Z",
+}
+
+TAP = "import tap_asana; tap_asana.main()"
+
+# The tap of this working tree is benchmarked, whether or not it is installed
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+
+def run_tap(args, directory, stdout_path=None):
+    """
+    Run the tap with `args` in `directory`. Return its exit code, records per
+    stream, wall-clock seconds and peak RSS in bytes.
+    """
+    # The fake API is served over plain HTTP
+    env = dict(os.environ, OAUTHLIB_INSECURE_TRANSPORT="1",
+               PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")])))
+    records = collections.Counter()
+    with open(os.path.join(directory, "tap.log"), "ab") as log:
+        started = time.monotonic()
+        process = subprocess.Popen([sys.executable, "-c", TAP] + args, stdout=subprocess.PIPE,
+                                   stderr=log, cwd=directory, env=env)
+        output = open(stdout_path, "wb") if stdout_path else None
+        try:
+            for line in process.stdout:
+                if output:
+                    output.write(line)
+                # Count without decoding every message
+                if line.startswith(b'{"type": "RECORD"'):
+                    records[json.loads(line)["stream"]] += 1
+        finally:
+            if output:
+                output.close()
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        elapsed = time.monotonic() - started
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+    peak_rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return process.returncode, records, elapsed, peak_rss
+
+
+def discover(directory, config_path):
+    """Return the catalog of the fake API, from the tap's discovery mode"""
+    catalog_path = os.path.join(directory, "discovered.json")
+    exit_code, _, _, _ = run_tap(["--config", config_path, "--discover"], directory, catalog_path)
+    if exit_code:
+        raise Exception("Discovery failed, see {}".format(os.path.join(directory, "tap.log")))
+    with open(catalog_path) as catalog_file:
+        return json.load(catalog_file)
+
+
+def select(catalog, streams):
+    """Return the catalog with every field of `streams` selected"""
+    catalog = json.loads(json.dumps(catalog))
+    for entry in catalog["streams"]:
+        for mdata in entry["metadata"]:
+            mdata["metadata"]["selected"] = entry["tap_stream_id"] in streams
+    return catalog
+
+
+def run_benchmark(scale=None, latency=0.0, jitter=0.0, config=None, streams=None, directory=None):
+    """
+    Sync each stream, then every stream, from a fake API of `scale`. Return
+    one result per run: records, requests by endpoint, seconds, records per
+    second and peak RSS.
+    """
+    streams = streams or STREAMS
+    fake = FakeAsana(scale, latency=latency, jitter=jitter)
+    results = []
+    with FakeAsanaServer(fake) as server, tempfile.TemporaryDirectory() as temp_directory:
+        directory = directory or temp_directory
+        config_path = os.path.join(directory, "config.json")
+        with open(config_path, "w") as config_file:
+            json.dump(dict(CONFIG, base_url=server.base_url, **(config or {})), config_file)
+        catalog = discover(directory, config_path)
+
+        runs = [[stream] for stream in streams]
+        if len(streams) > 1:
+            runs.append(streams)
+        for run in runs:
+            catalog_path = os.path.join(directory, "catalog.json")
+            with open(catalog_path, "w") as catalog_file:
+                json.dump(select(catalog, run), catalog_file)
+            fake.requests.clear()
+            exit_code, records, elapsed, peak_rss = run_tap(
+                ["--config", config_path, "--catalog", catalog_path], directory)
+            if exit_code:
+                raise Exception("Sync of {} failed, see {}".format(run, os.path.join(directory, "tap.log")))
+            total = sum(records.values())
+            results.append({
+                "streams": run if len(run) > 1 else run[0],
+                "records": dict(records),
+                "requests": dict(fake.requests),
+                "seconds": round(elapsed, 3),
+                "records_per_second": round(total / elapsed, 1),
+                "peak_rss_mb": round(peak_rss / 1024 / 1024, 1),
+            })
+    return results
+
+
+def print_report(results, out=sys.stdout):
+    out.write("{:<12} {:>10} {:>10} {:>10} {:>10} {:>12}\n".format(
+        "stream", "records", "requests", "seconds", "records/s", "peak RSS MB"))
+    for result in results:
+        name = result["streams"] if isinstance(result["streams"], str) else "all"
+        out.write("{:<12} {:>10} {:>10} {:>10} {:>10} {:>12}\n".format(
+            name, sum(result["records"].values()), sum(result["requests"].values()),
+            result["seconds"], result["records_per_second"], result["peak_rss_mb"]))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", action="append", default=[], metavar="KIND=COUNT",
+                        help="objects per parent, of: {}".format(", ".join(DEFAULT_SCALE)))
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra seconds, up to this")
+    parser.add_argument("--config", type=json.loads, default={}, help="JSON of extra tap config")
+    parser.add_argument("--streams", type=lambda value: value.split(","), default=None,
+                        help="comma separated streams, default: all")
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    args = parser.parse_args(argv)
+    args.scale = {kind: int(count) for kind, count in (item.split("=") for item in args.scale)}
+    unknown = set(args.scale) - set(DEFAULT_SCALE)
+    if unknown:
+        parser.error("unknown scale: {}".format(", ".join(sorted(unknown))))
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_benchmark(args.scale, args.latency, args.jitter, args.config, args.streams)
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import unittest
+import requests
+from fake_asana import FakeAsana, FakeAsanaServer
+from run_benchmark import run_benchmark
+
+SCALE = {"workspaces": 1, "projects": 2, "tasks": 3, "subtasks": 1, "stories": 2}
+
+
+class TestFakeAsana(unittest.TestCase):
+
+    def test_pagination(self):
+        """Verify that a collection is served in pages of `limit` records"""
+        fake = FakeAsana(SCALE)
+        with FakeAsanaServer(fake) as server:
+            project_gid = fake.children[("projects", fake.children[("workspaces", None)][0])][0]
+            gids = []
+            params = {"project": project_gid, "limit": 2, "opt_fields": "gid,name,modified_at"}
+            while True:
+                page = requests.get(server.base_url + "/tasks", params=params).json()
+                gids.extend(task["gid"] for task in page["data"])
+                self.assertEqual(set(page["data"][0]), {"gid", "name", "modified_at"})
+                if not page["next_page"]:
+                    break
+                params["offset"] = page["next_page"]["offset"]
+        self.assertEqual(gids, fake.children[("tasks", project_gid)])
+        self.assertEqual(fake.requests["tasks"], 2)
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_streams_synced_from_fake_api(self):
+        """Verify that the tap syncs every record of the fake API and the runs are measured"""
+        results = run_benchmark(SCALE, streams=["projects", "tasks", "stories"],
+                                config={"requests_per_minute": 100000})
+
+        self.assertEqual([result["streams"] for result in results],
+                         ["projects", "tasks", "stories", ["projects", "tasks", "stories"]])
+        self.assertEqual(results[-1]["records"], {"projects": 2, "tasks": 6, "stories": 12})
+        self.assertEqual(results[2]["requests"]["stories"], 6)
+        for result in results:
+            self.assertGreater(result["records_per_second"], 0)
+            self.assertGreater(result["peak_rss_mb"], 0)
@@ -0,0 +1,248 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import urlparse, parse_qs
+from asana.error import NotFoundError, ServerError
+import tap_asana.streams.sections as sections
+import tap_asana.streams.stories as stories
+import tap_asana.streams.subtasks as subtasks
+import tap_asana.streams.tasks as tasks
+from tap_asana.async_engine import AsyncEngine, aiohttp
+from tap_asana.concurrency import WorkItems
+from tap_asana.asana import Asana
+from tap_asana.context import Context
+from tap_asana.rate_limit import RateLimiter
+from tap_asana.streams.base import MAX_RETRIES
+
+STORIES_PER_TASK = 5
+REAL_SLEEP = asyncio.sleep
+
+
+async def fast_sleep(seconds):
+    """Skip the backoff waits while still yielding to the event loop"""
+    await REAL_SLEEP(0)
+
+
+def get_stories(task_gid):
+    return [{"gid": "{}-story{}".format(task_gid, i), "created_at": "2021-01-02T00:00:00Z"}
+            for i in range(STORIES_PER_TASK)]
+
+
+class FakeAsanaHandler(BaseHTTPRequestHandler):
+    """
+    Serves the paginated records of `server.collections`, by path and `project`
+    param, or else the stories of any task, failing the requests queued in `server.failures`
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        server = self.server
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            server.requests.append((url.path, query.get("offset")))
+            failures = server.failures.get((url.path, query.get("offset")), [])
+            status = failures.pop(0) if failures else 200
+        try:
+            time.sleep(0.01)
+            if self.headers["Authorization"] != "Bearer {}".format(server.token):
+                status = 401
+            if status != 200:
+                self.send_json(status, {"errors": [{"message": "failed"}]}, {"Retry-After": "0"})
+                return
+            key = "{}?project={}".format(url.path, query["project"]) if "project" in query else url.path
+            records = server.collections.get(key)
+            if records is None:
+                records = get_stories(url.path.split("/")[-2])
+            offset, limit = int(query.get("offset", 0)), int(query["limit"])
+            data = records[offset:offset + limit]
+            next_page = {"offset": str(offset + limit)} if offset + limit < len(records) else None
+            self.send_json(200, {"data": data, "next_page": next_page})
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeAsanaHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.in_flight = self.server.max_in_flight = 0
+        self.server.requests = []
+        self.server.failures = {}
+        self.server.collections = {}
+        self.server.token = "token"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        for patcher in [mock.patch("tap_asana.asana.Asana.refresh_access_token"),
+                        mock.patch("asyncio.sleep", fast_sleep)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        Context.config = {"start_date": "2021-01-01T00:00:00Z", "max_workers": 100, "use_async": "true"}
+        Context.asana = Asana('test', 'test', 'test', 'test', 'test')
+        client = Context.asana.client
+        client.options["base_url"] = "http://127.0.0.1:{}/api/1.0".format(self.server.server_port)
+        client.options["page_size"] = 2
+        client.session.token = {"access_token": "token", "token_type": "Bearer"}
+
+    def test_paginations_run_concurrently(self):
+        """Verify that every page of every collection is fetched, many paginations at a time"""
+        task_gids = [str(i) for i in range(50)]
+        done = []
+
+        records = [record for _, record in AsyncEngine(300).fan_out(
+            lambda gid: ("/tasks/{}/stories".format(gid), {"opt_fields": "gid,created_at"}),
+            WorkItems(task_gids, on_done=done.append), 100)]
+
+        self.assertEqual(sorted(done), sorted(task_gids))
+        self.assertCountEqual(records, [story for gid in task_gids for story in get_stories(gid)])
+        # Verify that the stories of each task keep their order
+        for gid in task_gids:
+            self.assertEqual([record for record in records if record["gid"].startswith(gid + "-")],
+                             get_stories(gid))
+        self.assertEqual(len(self.server.requests), 50 * 3)
+        self.assertGreater(self.server.max_in_flight, 10)
+
+    def test_errors_retried(self):
+        """Verify that 5xx and 429 responses are retried and a 401 refreshes the access token"""
+        self.server.failures = {("/api/1.0/tasks/1/stories", "2"): [500, 429]}
+        self.server.token = "fresh"
+        Context.asana.refresh_access_token.reset_mock()
+        Context.asana.refresh_access_token.side_effect = lambda: setattr(
+            Context.asana.client.session, "token", {"access_token": "fresh", "token_type": "Bearer"})
+
+        records = list(AsyncEngine(300).fan_out(lambda gid: ("/tasks/{}/stories".format(gid), {}), ["1"], 10))
+
+        self.assertEqual(records, [("1", story) for story in get_stories("1")])
+        self.assertEqual(Context.asana.refresh_access_token.call_count, 1)
+        # the first page once with the old token, the second page failing twice
+        self.assertEqual(self.server.requests, [("/api/1.0/tasks/1/stories", None)] * 2 +
+                         [("/api/1.0/tasks/1/stories", "2")] * 3 + [("/api/1.0/tasks/1/stories", "4")])
+
+    @mock.patch.dict(os.environ, {"OAUTHLIB_INSECURE_TRANSPORT": "1"})
+    @mock.patch("time.sleep")
+    def test_same_retry_budget_as_sdk(self, mocked_sleep):
+        """Verify that the engine and the SDK requests give up a failing request after as many tries"""
+        self.server.failures = {("/api/1.0/tasks/1/stories", None): [500] * 10}
+        with self.assertRaises(ServerError):
+            list(Context.asana.client.stories.get_stories_for_task("1"))
+        sdk_tries = len(self.server.requests)
+
+        self.server.requests = []
+        with self.assertRaises(ServerError):
+            list(AsyncEngine(300).fan_out(lambda gid: ("/tasks/{}/stories".format(gid), {}), ["1"], 1))
+
+        self.assertEqual(len(self.server.requests), sdk_tries)
+        self.assertEqual(sdk_tries, MAX_RETRIES)
+
+    def test_adaptive_concurrency_limit(self):
+        """Verify that requests are sent within the rate limiter's concurrency limit, adjusted to their outcome"""
+        Context.rate_limiter = limiter = RateLimiter(100000, 50)
+        self.addCleanup(setattr, Context, "rate_limiter", None)
+        self.server.failures = {("/api/1.0/tasks/0/stories", None): [500]}
+        task_gids = [str(i) for i in range(50)]
+
+        with self.assertLogs(level="INFO") as logs:
+            records = list(AsyncEngine(300).fan_out(lambda gid: ("/tasks/{}/stories".format(gid), {}), task_gids, 100))
+
+        self.assertEqual(len(records), 50 * STORIES_PER_TASK)
+        self.assertIn("Lowered concurrent requests limit from 10 to 5 after status code 500", "\n".join(logs.output))
+        # Raised back by the healthy responses, never passed by the requests in flight
+        self.assertGreater(limiter.concurrency.limit, 10)
+        self.assertLessEqual(self.server.max_in_flight, int(limiter.concurrency.limit))
+        self.assertEqual(limiter.concurrency.in_flight, 0)
+
+    def test_error_raised(self):
+        """Verify that a failing pagination raises the SDK's error in the calling thread"""
+        self.server.failures = {("/api/1.0/tasks/2/stories", None): [404]}
+
+        with self.assertRaises(NotFoundError):
+            list(AsyncEngine(300).fan_out(lambda gid: ("/tasks/{}/stories".format(gid), {}), ["1", "2", "3"], 1))
+
+    def sync_stream(self, stream_class):
+        """Sync the stream over the projects p1 and p2, listed with the (mocked) SDK"""
+        Context.state = {}
+        Context.directory = None
+        self.addCleanup(setattr, Context, "state", {})
+        with mock.patch("tap_asana.streams.base.Stream.call_api") as mocked_call_api, \
+                mock.patch.object(Context, "writer"):
+            mocked_call_api.side_effect = lambda resource, **kwargs: (
+                [{"gid": "w1"}] if resource == "workspaces" else [{"gid": "p1"}, {"gid": "p2"}])
+            records = list(stream_class().get_objects())
+        # Only the workspaces and projects were listed with the SDK
+        self.assertEqual({args[0] for args, kwargs in mocked_call_api.call_args_list}, {"workspaces", "projects"})
+        return records
+
+    def test_stories_stream(self):
+        """Verify that the stories stream lists the tasks and fetches their stories with `use_async`"""
+        self.server.collections = {"/api/1.0/tasks?project={}".format(project): [
+            {"gid": "{}t{}".format(project, i)} for i in range(3)] for project in ["p1", "p2"]}
+
+        records = self.sync_stream(stories.Stories)
+
+        self.assertCountEqual(records, [story for project in ["p1", "p2"] for i in range(3)
+                                        for story in get_stories("{}t{}".format(project, i))])
+        self.assertEqual(Context.state["bookmarks"]["stories"], {"created_at": "2021-01-02T00:00:00.000000"})
+
+    def test_tasks_stream(self):
+        """Verify that the tasks stream lists the tasks of every project with `use_async`"""
+        self.server.collections = {"/api/1.0/tasks?project={}".format(project): [
+            {"gid": "{}t{}".format(project, i), "modified_at": "2021-01-02T00:00:00Z"} for i in range(3)]
+                                   for project in ["p1", "p2"]}
+
+        records = self.sync_stream(tasks.Tasks)
+
+        self.assertCountEqual([record["gid"] for record in records], ["p1t0", "p1t1", "p1t2", "p2t0", "p2t1", "p2t2"])
+        self.assertEqual(Context.state["bookmarks"]["tasks"], {"modified_at": "2021-01-02T00:00:00.000000"})
+
+    def test_subtasks_stream(self):
+        """Verify that the subtasks stream walks the subtask trees of every project with `use_async`"""
+        modified_at = "2021-01-02T00:00:00Z"
+        self.server.collections = {
+            "/api/1.0/tasks?project=p1": [{"gid": "t1", "num_subtasks": 1}, {"gid": "t2", "num_subtasks": 0}],
+            "/api/1.0/tasks?project=p2": [{"gid": "t3", "num_subtasks": 2}],
+            "/api/1.0/tasks/t1/subtasks": [{"gid": "s1", "num_subtasks": 1, "modified_at": modified_at}],
+            "/api/1.0/tasks/s1/subtasks": [{"gid": "s2", "num_subtasks": 0, "modified_at": modified_at}],
+            "/api/1.0/tasks/t3/subtasks": [{"gid": "s3", "num_subtasks": 0, "modified_at": modified_at},
+                                           {"gid": "s4", "num_subtasks": 0, "modified_at": modified_at}],
+        }
+
+        records = self.sync_stream(subtasks.SubTasks)
+
+        self.assertCountEqual([record["gid"] for record in records], ["s1", "s2", "s3", "s4"])
+        self.assertNotIn(("/api/1.0/tasks/t2/subtasks", None), self.server.requests)
+        self.assertEqual(Context.state["bookmarks"]["subtasks"], {"modified_at": "2021-01-02T00:00:00.000000"})
+
+    def test_sections_stream(self):
+        """Verify that the sections stream lists the sections of every project with `use_async`"""
+        self.server.collections = {"/api/1.0/projects/{}/sections".format(project): [
+            {"gid": "{}s{}".format(project, i)} for i in range(3)] for project in ["p1", "p2"]}
+
+        records = self.sync_stream(sections.Sections)
+
+        self.assertCountEqual([record["gid"] for record in records], ["p1s0", "p1s1", "p1s2", "p2s0", "p2s1", "p2s2"])
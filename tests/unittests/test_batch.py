@@ -0,0 +1,115 @@
+import unittest
+from unittest import mock
+import asana
+import tap_asana.streams.subtasks as subtasks
+import tap_asana.streams.teams as teams
+from tap_asana.context import Context
+from tap_asana.asana import Asana
+from tap_asana.streams.base import Stream, BATCH_SIZE
+
+
+class FakeBatchEndpoint():
+    """Fake `/batch` endpoint serving paginated collections by relative path"""
+
+    def __init__(self, collections, page_size=2, fail_once=None):
+        self.collections = collections
+        self.page_size = page_size
+        # relative path -> status code returned on its first request
+        self.fail_once = dict(fail_once or {})
+        self.batches = []
+
+    def create_batch_request(self, params, **options):
+        actions = params["actions"]
+        assert len(actions) <= BATCH_SIZE
+        self.batches.append(actions)
+        responses = []
+        for action in actions:
+            path = action["relative_path"]
+            if path in self.fail_once:
+                status = self.fail_once.pop(path)
+                responses.append({"status_code": status, "headers": {"Retry-After": "3"}, "body": {}})
+                continue
+            if path not in self.collections:
+                responses.append({"status_code": 404, "headers": {}, "body": {"errors": [{"message": "Not Found"}]}})
+                continue
+            offset = int(action["options"].get("offset") or 0)
+            page = self.collections[path][offset:offset + self.page_size]
+            body = {"data": page, "next_page": None}
+            if offset + self.page_size < len(self.collections[path]):
+                body["next_page"] = {"offset": str(offset + self.page_size)}
+            responses.append({"status_code": 200, "headers": {}, "body": body})
+        return responses
+
+
+@mock.patch("time.sleep")
+@mock.patch("tap_asana.asana.Asana.refresh_access_token")
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        Context.config = {'start_date': '2021-01-01T00:00:00Z', 'use_batch': 'true'}
+        Context.state = {}
+        self.addCleanup(setattr, Context, "state", {})
+
+    def test_collections_are_paginated_and_retried(self, mocked_refresh_access_token, mocked_sleep):
+        """Verify that every page of every collection is returned in order, retrying 429 and 5xx actions"""
+        Context.asana = Asana('test', 'test', 'test', 'test', 'test')
+        collections = {"/teams/{}/users".format(i): [{"gid": "{}-{}".format(i, j)} for j in range(i)]
+                       for i in range(15)}
+        endpoint = FakeBatchEndpoint(collections, fail_once={"/teams/3/users": 429, "/teams/7/users": 503})
+        Context.asana.client.batch_api = endpoint
+
+        results = Stream().get_collections_in_batch(list(collections))
+
+        self.assertEqual(results, list(collections.values()))
+        mocked_sleep.assert_any_call(3.0)
+
+    def test_failing_action_raises(self, mocked_refresh_access_token, mocked_sleep):
+        """Verify that an action failing with a non retryable status raises an AsanaError"""
+        Context.asana = Asana('test', 'test', 'test', 'test', 'test')
+        Context.asana.client.batch_api = FakeBatchEndpoint({})
+
+        with self.assertRaises(asana.error.AsanaError) as err:
+            Stream().get_collections_in_batch(["/teams/1/users"])
+        self.assertEqual(err.exception.status, 404)
+
+    def test_teams_users_in_batch(self, mocked_refresh_access_token, mocked_sleep):
+        """Verify that the users of all teams are fetched through the batch API"""
+        Context.asana = Asana('test', 'test', 'test', 'test', 'test')
+        Context.asana.client.workspaces.find_all = mock.Mock(return_value=[{"gid": "w1", "is_organization": True}])
+        Context.asana.client.teams.find_by_organization = mock.Mock(return_value=[{"gid": str(i)} for i in range(12)])
+        Context.asana.client.teams.users = mock.Mock()
+        endpoint = FakeBatchEndpoint({"/teams/{}/users".format(i): [{"gid": "u" + str(i)}] for i in range(12)})
+        Context.asana.client.batch_api = endpoint
+
+        records = list(teams.Teams().get_objects())
+
+        self.assertEqual([rec["users"] for rec in records], [[{"gid": "u" + str(i)}] for i in range(12)])
+        self.assertEqual(len(endpoint.batches), 2)
+        self.assertFalse(Context.asana.client.teams.users.called)
+
+    @mock.patch("tap_asana.streams.base.Stream.call_api")
+    def test_subtasks_in_batch(self, mocked_call_api, mocked_refresh_access_token, mocked_sleep):
+        """Verify that subtask lookups are grouped into batch API requests"""
+        def mock_call_api(resource, **kwargs):
+            if resource == "workspaces":
+                return [{"gid": "w1"}]
+            if resource == "projects":
+                return [{"gid": "p1"}]
+            return [{"gid": "t" + str(i), "num_subtasks": 1} for i in range(5)]
+        mocked_call_api.side_effect = mock_call_api
+        Context.asana = Asana('test', 'test', 'test', 'test', 'test')
+        collections = {"/tasks/t{}/subtasks".format(i): [{"gid": "s" + str(i), "num_subtasks": 1,
+                                                          "modified_at": "2021-01-02T00:00:00Z"}]
+                       for i in range(5)}
+        collections.update({"/tasks/s{}/subtasks".format(i): [{"gid": "ss" + str(i), "num_subtasks": 0,
+                                                               "modified_at": "2021-01-02T00:00:00Z"}]
+                            for i in range(5)})
+        endpoint = FakeBatchEndpoint(collections)
+        Context.asana.client.batch_api = endpoint
+
+        records = list(subtasks.SubTasks().get_objects())
+
+        self.assertEqual(sorted(rec["gid"] for rec in records),
+                         sorted(["s" + str(i) for i in range(5)] + ["ss" + str(i) for i in range(5)]))
+        # 5 tasks in one batch, then their 5 subtasks in a second one
+        self.assertEqual(len(endpoint.batches), 2)
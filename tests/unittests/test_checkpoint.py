@@ -0,0 +1,185 @@
+import copy
+import unittest
+from unittest import mock
+from parameterized import parameterized
+from singer import utils
+import tap_asana
+import tap_asana.streams.tasks as tasks
+import tap_asana.streams.stories as stories
+import tap_asana.streams.subtasks as subtasks
+from tap_asana.context import Context
+from tap_asana.asana import Asana
+
+PROJECTS = [str(i) for i in range(6)]
+BOOKMARK = "2021-01-01T00:00:00.000000"
+
+
+# Mock 'call_api' function listing 3 tasks per project
+def mock_call_api(resource, **kwargs):
+    if resource == "workspaces":
+        return [{"gid": "w1"}]
+    if resource == "projects":
+        return [{"gid": project_id} for project_id in PROJECTS]
+    return [{"gid": "{}-{}".format(kwargs["project"], i), "num_subtasks": 1,
+             "modified_at": "2021-01-02T00:00:00Z"} for i in range(3)]
+
+
+def mock_get_subtasks_for_task(task_gid, **kwargs):
+    # a chain of 2 levels of subtasks below every task
+    depth = task_gid.count("s")
+    return [{"gid": task_gid + "s", "num_subtasks": 1 if depth < 1 else 0,
+             "modified_at": "2021-01-02T00:00:00Z"}]
+
+
+def mock_get_stories_for_task(task_gid, **kwargs):
+    return [{"gid": "{}-story{}".format(task_gid, i), "created_at": "2021-01-02T00:00:00Z"} for i in range(2)]
+
+
+def get_project(record):
+    return record["gid"].split("-")[0]
+
+
+class TestProjectCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        for patcher in [mock.patch("tap_asana.streams.base.Stream.call_api", side_effect=mock_call_api),
+                        mock.patch("tap_asana.asana.Asana.refresh_access_token")]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        Context.config = {"start_date": "2021-01-01T00:00:00Z", "max_workers": 3}
+        Context.state = {}
+        Context.directory = None
+        self.addCleanup(setattr, Context, "state", {})
+        self.events = []
+        writer = mock.Mock()
+        writer.update_state.side_effect = lambda state: self.events.append(("state", copy.deepcopy(state)))
+        patcher = mock.patch.object(Context, "writer", writer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_client(self):
+        Context.asana = Asana('test', 'test', 'test', 'test', 'test')
+        Context.asana.client.tasks.get_subtasks_for_task = mock.Mock(side_effect=mock_get_subtasks_for_task)
+        Context.asana.client.stories.get_stories_for_task = mock.Mock(side_effect=mock_get_stories_for_task)
+
+    @staticmethod
+    def get_listed_projects():
+        call_args_list = tap_asana.streams.base.Stream.call_api.call_args_list
+        return [kwargs["project"] for args, kwargs in call_args_list if args[0] == "tasks"]
+
+    def consume(self, stream, fail_at=None):
+        """Consume the stream's records like the sync loop, optionally failing at the `fail_at`th record"""
+        for record in stream.get_objects():
+            if len([event for event in self.events if event[0] == "record"]) == fail_at:
+                raise KeyboardInterrupt
+            self.events.append(("record", record))
+
+    @parameterized.expand([
+        ["tasks", tasks.Tasks, 3],
+        ["stories", stories.Stories, 6],
+        ["subtasks", subtasks.SubTasks, 6],
+    ])
+    def test_checkpoint_never_ahead_of_records(self, name, stream_class, records_per_project):
+        """Verify that a project is checkpointed only after all of its records were consumed"""
+        self.create_client()
+        self.consume(stream_class())
+
+        written = []
+        checkpointed = []
+        for kind, value in self.events:
+            if kind == "record":
+                written.append(get_project(value))
+            elif "checkpoint" in value["bookmarks"][name]:
+                completed = value["bookmarks"][name]["checkpoint"]["completed_projects"]
+                for project_id in completed:
+                    self.assertEqual(written.count(project_id), records_per_project)
+                checkpointed = completed
+        self.assertEqual(sorted(checkpointed), PROJECTS)
+        self.assertEqual(len(written), records_per_project * len(PROJECTS))
+        # Verify the checkpoint is dropped once the stream is synced
+        self.assertEqual(Context.state["bookmarks"][name], {"modified_at" if name != "stories" else "created_at":
+                                                            "2021-01-02T00:00:00.000000"})
+
+    @parameterized.expand([
+        ["tasks", tasks.Tasks],
+        ["stories", stories.Stories],
+        ["subtasks", subtasks.SubTasks],
+    ])
+    def test_interrupted_sync_resumed(self, name, stream_class):
+        """Verify that a restarted sync skips the projects completed by the interrupted one"""
+        Context.config["max_workers"] = 1
+        self.create_client()
+        with self.assertRaises(KeyboardInterrupt):
+            self.consume(stream_class(), fail_at=8)
+        saved_state = [value for kind, value in self.events if kind == "state"][-1]
+        completed = saved_state["bookmarks"][name]["checkpoint"]["completed_projects"]
+        self.assertEqual(completed, PROJECTS[:len(completed)])
+        self.assertGreater(len(completed), 0)
+
+        Context.state = saved_state
+        self.events = []
+        tap_asana.streams.base.Stream.call_api.reset_mock()
+        self.consume(stream_class())
+
+        self.assertEqual(self.get_listed_projects(), PROJECTS[len(completed):])
+        self.assertNotIn("checkpoint", Context.state["bookmarks"][name])
+
+    def test_resumed_bookmark_capped_at_interrupted_start(self):
+        """Verify that a resumed sync's bookmark does not pass the start of the interrupted sync"""
+        Context.config["max_workers"] = 1
+        self.addCleanup(setattr, Context, "tap_start", None)
+        Context.tap_start = utils.strptime_to_utc("2021-01-02T06:00:00Z")
+        self.create_client()
+        with self.assertRaises(KeyboardInterrupt):
+            self.consume(tasks.Tasks(), fail_at=5)
+        saved_state = [value for kind, value in self.events if kind == "state"][-1]
+        self.assertEqual(saved_state["bookmarks"]["tasks"]["checkpoint"]["completed_projects"], ["0"])
+
+        # A task of the skipped project "0" is modified after the interruption,
+        # and the remaining projects return later changes
+        def mock_call_api_after_interruption(resource, **kwargs):
+            return [dict(task, modified_at="2021-01-03T00:00:00Z") for task in mock_call_api(resource, **kwargs)]
+        tap_asana.streams.base.Stream.call_api.side_effect = mock_call_api_after_interruption
+        Context.state = saved_state
+        Context.tap_start = utils.strptime_to_utc("2021-01-04T00:00:00Z")
+        self.consume(tasks.Tasks())
+
+        self.assertEqual(Context.state["bookmarks"]["tasks"], {"modified_at": "2021-01-02T06:00:00.000000"})
+
+        # The next sync lists the skipped project again from the capped bookmark
+        tap_asana.streams.base.Stream.call_api.reset_mock()
+        self.consume(tasks.Tasks())
+        self.assertEqual(sorted(self.get_listed_projects()), PROJECTS)
+        self.assertEqual(Context.state["bookmarks"]["tasks"], {"modified_at": "2021-01-03T00:00:00.000000"})
+
+    def test_checkpoint_of_other_bookmark_ignored(self):
+        """Verify that a checkpoint saved from another bookmark does not skip any project"""
+        self.create_client()
+        Context.state = {"bookmarks": {"tasks": {"modified_at": BOOKMARK, "checkpoint": {
+            "bookmark": "2020-01-01T00:00:00.000000", "completed_projects": ["0", "1"]}}}}
+
+        self.consume(tasks.Tasks())
+
+        self.assertEqual(sorted(self.get_listed_projects()), PROJECTS)
+
+
+class TestResumeStream(unittest.TestCase):
+
+    @mock.patch("tap_asana.sync_stream")
+    def test_sync_resumes_from_currently_sync_stream(self, mocked_sync_stream):
+        """Verify that the sync starts from the stream that was syncing when it was interrupted"""
+        Context.config = {"start_date": "2021-01-01T00:00:00Z"}
+        Context.catalog = {"streams": [{"tap_stream_id": name, "schema": {}, "key_properties": ["gid"],
+                                        "metadata": [{"breadcrumb": [], "metadata": {"selected": True}}]}
+                                       for name in ["projects", "tasks", "stories"]]}
+        Context.stream_map = {}
+        Context.state = {"bookmarks": {"currently_sync_stream": "tasks"}}
+        self.addCleanup(setattr, Context, "state", {})
+        self.addCleanup(setattr, Context, "stream_map", {})
+
+        with mock.patch.object(Context, "writer"):
+            tap_asana.sync()
+
+        self.assertEqual([args[0]["tap_stream_id"] for args, kwargs in mocked_sync_stream.call_args_list],
+                         ["tasks", "stories", "projects"])
+        self.assertNotIn("currently_sync_stream", Context.state["bookmarks"])
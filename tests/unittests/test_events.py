@@ -0,0 +1,132 @@
+import unittest
+from unittest import mock
+import asana
+import tap_asana.streams.stories as stories
+import tap_asana.streams.subtasks as subtasks
+import tap_asana.streams.tasks as tasks
+from tap_asana.context import Context
+from tap_asana.asana import Asana
+
+
+class FakeEventsEndpoint():
+    """Fake `/events` endpoint keeping one list of pending events per project"""
+
+    def __init__(self, events):
+        # project gid -> events reported for the 'valid' sync token
+        self.events = events
+        self.requests = []
+
+    def get(self, path, params, **options):
+        self.requests.append(dict(params))
+        project_id = params["resource"]
+        if params.get("sync") != "valid-" + project_id:
+            # Missing or expired token, Asana answers 412 with a fresh token
+            response = mock.Mock()
+            response.json.return_value = {"sync": "fresh-" + project_id, "errors": []}
+            raise asana.error.InvalidTokenError(response)
+        return {"data": self.events.get(project_id, []), "sync": "next-" + project_id, "has_more": False}
+
+
+def task_event(task_gid):
+    return {"action": "changed", "resource": {"gid": task_gid, "resource_type": "task"}, "parent": None}
+
+
+def story_event(story_gid, task_gid):
+    return {"action": "added", "resource": {"gid": story_gid, "resource_type": "story"},
+            "parent": {"gid": task_gid, "resource_type": "task"}}
+
+
+# Mock 'call_api' function used for full project scans
+def mock_call_api(resource, **kwargs):
+    if resource == "workspaces":
+        return [{"gid": "w1"}]
+    if resource == "projects":
+        return [{"gid": "p1"}, {"gid": "p2"}]
+    return [{"gid": kwargs["project"] + "-scanned", "modified_at": "2021-01-02T00:00:00Z"}]
+
+
+@mock.patch("tap_asana.asana.Asana.refresh_access_token")
+@mock.patch("tap_asana.streams.base.Stream.call_api")
+class TestEventsSync(unittest.TestCase):
+
+    @mock.patch("tap_asana.asana.Asana.refresh_access_token")
+    def setUp(self, mocked_refresh_access_token):
+        Context.asana = Asana('test', 'test', 'test', 'test', 'test')
+        Context.asana.client.tasks.get_task = mock.Mock(
+            side_effect=lambda task_gid, **kwargs: {"gid": task_gid, "modified_at": "2021-01-03T00:00:00Z"})
+        self.addCleanup(setattr, Context, "state", {})
+
+    def test_tasks_without_sync_tokens_scan_projects(self, mocked_call_api, mocked_refresh_access_token):
+        """Verify that projects without a sync token are scanned and their fresh tokens saved"""
+        Context.config = {'start_date': '2021-01-01T00:00:00Z', 'use_events': 'true'}
+        Context.state = {}
+        mocked_call_api.side_effect = mock_call_api
+        Context.asana.client.get = FakeEventsEndpoint({}).get
+
+        records = list(tasks.Tasks().get_objects())
+
+        self.assertEqual(sorted(rec["gid"] for rec in records), ["p1-scanned", "p2-scanned"])
+        self.assertEqual(Context.state["bookmarks"]["tasks"]["sync_tokens"],
+                         {"p1": "fresh-p1", "p2": "fresh-p2"})
+
+    def test_tasks_with_sync_tokens_fetch_changed_tasks(self, mocked_call_api, mocked_refresh_access_token):
+        """Verify that only the tasks referenced by events are fetched and expired tokens fall back to a scan"""
+        Context.config = {'start_date': '2021-01-01T00:00:00Z', 'use_events': True}
+        Context.state = {"bookmarks": {"tasks": {"sync_tokens": {"p1": "valid-p1", "p2": "expired-p2"}}}}
+        mocked_call_api.side_effect = mock_call_api
+        endpoint = FakeEventsEndpoint({"p1": [task_event("t1"), story_event("s1", "t2"), task_event("t1")]})
+        Context.asana.client.get = endpoint.get
+
+        records = list(tasks.Tasks().get_objects())
+
+        self.assertEqual(sorted(rec["gid"] for rec in records), ["p2-scanned", "t1", "t2"])
+        # Verify 'p1' was not scanned
+        scanned = [kwargs["project"] for args, kwargs in mocked_call_api.call_args_list if args[0] == "tasks"]
+        self.assertEqual(scanned, ["p2"])
+        self.assertEqual(Context.state["bookmarks"]["tasks"]["sync_tokens"],
+                         {"p1": "next-p1", "p2": "fresh-p2"})
+
+    def test_stories_with_sync_tokens(self, mocked_call_api, mocked_refresh_access_token):
+        """Verify that stories are only fetched for the tasks referenced by events"""
+        Context.config = {'start_date': '2021-01-01T00:00:00Z', 'use_events': 'true'}
+        Context.state = {"bookmarks": {"stories": {"sync_tokens": {"p1": "valid-p1", "p2": "valid-p2"}}}}
+        mocked_call_api.side_effect = mock_call_api
+        Context.asana.client.get = FakeEventsEndpoint({"p1": [story_event("s1", "t1")]}).get
+        Context.asana.client.stories.get_stories_for_task = mock.Mock(
+            side_effect=lambda task_gid, **kwargs: [{"gid": "s1", "created_at": "2021-01-03T00:00:00Z"}])
+
+        records = list(stories.Stories().get_objects())
+
+        self.assertEqual(records, [{"gid": "s1", "created_at": "2021-01-03T00:00:00Z"}])
+        self.assertEqual(Context.asana.client.stories.get_stories_for_task.call_args[1]["task_gid"], "t1")
+        self.assertFalse(any(args[0] == "tasks" for args, kwargs in mocked_call_api.call_args_list))
+
+    def test_subtask_change_synced(self, mocked_call_api, mocked_refresh_access_token):
+        """Verify that a change to a subtask only, not reported by the project's events, is synced"""
+        Context.config = {'start_date': '2021-01-01T00:00:00Z', 'use_events': 'true'}
+        Context.state = {"bookmarks": {"subtasks": {"sync_tokens": {"p1": "valid-p1", "p2": "valid-p2"}}}}
+        mocked_call_api.side_effect = lambda resource, **kwargs: (
+            mock_call_api(resource, **kwargs) if resource != "tasks" else
+            [{"gid": kwargs["project"] + "-parent", "num_subtasks": 1}])
+        endpoint = FakeEventsEndpoint({})
+        Context.asana.client.get = endpoint.get
+        Context.asana.client.tasks.get_subtasks_for_task = mock.Mock(
+            side_effect=lambda task_gid, **kwargs: [{"gid": task_gid + "-subtask", "num_subtasks": 0,
+                                                     "modified_at": "2021-01-03T00:00:00Z"}])
+
+        records = list(subtasks.SubTasks().get_objects())
+
+        self.assertEqual(sorted(rec["gid"] for rec in records), ["p1-parent-subtask", "p2-parent-subtask"])
+        self.assertEqual(endpoint.requests, [])
+
+    def test_events_not_used_by_default(self, mocked_call_api, mocked_refresh_access_token):
+        """Verify that the Events API is not called unless `use_events` is set"""
+        Context.config = {'start_date': '2021-01-01T00:00:00Z'}
+        Context.state = {}
+        mocked_call_api.side_effect = mock_call_api
+        Context.asana.client.get = mock.Mock()
+
+        list(tasks.Tasks().get_objects())
+
+        self.assertFalse(Context.asana.client.get.called)
+        self.assertNotIn("sync_tokens", Context.state["bookmarks"]["tasks"])
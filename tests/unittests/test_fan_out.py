@@ -0,0 +1,166 @@
+import threading
+import time
+import unittest
+from unittest import mock
+import tap_asana.streams.stories as stories
+import tap_asana.streams.tasks as tasks
+from tap_asana.concurrency import fan_out
+from tap_asana.context import Context
+from tap_asana.asana import Asana
+from tap_asana.rate_limit import RateLimiter
+from tap_asana.streams.base import Stream
+
+
+# Dummy fetch function returning 3 records per item
+def fetch_records(item):
+    for i in range(3):
+        yield {"item": item, "index": i}
+
+
+def raise_error(item):
+    if item == 2:
+        raise ValueError("fetch failed")
+    yield {"item": item}
+
+
+class TestFanOut(unittest.TestCase):
+
+    def test_serial_fetch_keeps_item_order(self):
+        """Verify that a single worker fetches the items in order"""
+        records = list(fan_out(fetch_records, [1, 2, 3], 1))
+
+        self.assertEqual(records, [rec for item in [1, 2, 3] for rec in fetch_records(item)])
+
+    def test_concurrent_fetch_returns_all_records(self):
+        """Verify that all records are returned and records of one item keep their order"""
+        records = list(fan_out(fetch_records, range(20), 4))
+
+        self.assertEqual(len(records), 60)
+        for item in range(20):
+            self.assertEqual(
+                [rec["index"] for rec in records if rec["item"] == item], [0, 1, 2]
+            )
+
+    def test_max_workers_bounds_in_flight_fetches(self):
+        """Verify that no more than `max_workers` items are fetched at once"""
+        lock = threading.Lock()
+        in_flight = [0]
+        peak = [0]
+
+        def slow_fetch(item):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            yield item
+
+        records = list(fan_out(slow_fetch, range(12), 3))
+
+        self.assertEqual(sorted(records), list(range(12)))
+        self.assertLessEqual(peak[0], 3)
+
+    def test_worker_error_is_raised_to_the_caller(self):
+        """Verify that an exception in a worker is raised by the generator"""
+        with self.assertRaises(ValueError):
+            list(fan_out(raise_error, [1, 2, 3], 2))
+
+
+@mock.patch("tap_asana.asana.Asana.refresh_access_token")
+@mock.patch("tap_asana.streams.base.Stream.call_api")
+class TestConcurrentTasks(unittest.TestCase):
+
+    def test_tasks_of_all_projects_with_max_workers(self, mocked_call_api, mocked_refresh_access_token):
+        """Verify that 'tasks' returns the tasks of every project when fetched concurrently"""
+        Context.config = {'start_date': '2021-01-01T00:00:00Z', 'max_workers': '4'}
+        Context.state = {}
+        self.addCleanup(setattr, Context, "state", {})
+        Context.asana = Asana('test', 'test', 'test', 'test', 'test')
+
+        def mock_call_api(resource, **kwargs):
+            if resource == "workspaces":
+                return [{"gid": "1"}]
+            if resource == "projects":
+                return [{"gid": str(i)} for i in range(10)]
+            return [{"gid": kwargs["project"] + "-" + str(i), "modified_at": "2021-01-02T00:00:00Z"}
+                    for i in range(2)]
+        mocked_call_api.side_effect = mock_call_api
+
+        stream = tasks.Tasks()
+        records = list(stream.get_objects())
+
+        self.assertEqual(stream.max_workers, 4)
+        self.assertEqual(sorted(rec["gid"] for rec in records),
+                         sorted("{}-{}".format(p, i) for p in range(10) for i in range(2)))
+        self.assertEqual(Context.state["bookmarks"]["tasks"]["modified_at"], "2021-01-02T00:00:00.000000")
+
+    def test_stories_of_all_tasks_with_max_workers(self, mocked_call_api, mocked_refresh_access_token):
+        """Verify that 'stories' keeps each task's stories in order and bookmarks the latest one"""
+        Context.config = {'start_date': '2021-01-01T00:00:00Z', 'max_workers': 3}
+        Context.state = {}
+        self.addCleanup(setattr, Context, "state", {})
+        Context.asana = Asana('test', 'test', 'test', 'test', 'test')
+
+        def mock_call_api(resource, **kwargs):
+            if resource == "workspaces":
+                return [{"gid": "1"}]
+            if resource == "projects":
+                return [{"gid": str(i)} for i in range(3)]
+            return [{"gid": kwargs["project"] + "-" + str(i)} for i in range(4)]
+        mocked_call_api.side_effect = mock_call_api
+
+        def mock_stories_for_task(task_gid, **kwargs):
+            for day in range(1, 4):
+                yield {"gid": task_gid + "-" + str(day), "task": task_gid,
+                       "created_at": "2021-01-0{}T00:00:00Z".format(day + int(task_gid[0]))}
+        Context.asana.client.stories.get_stories_for_task = mock_stories_for_task
+
+        records = list(stories.Stories().get_objects())
+
+        self.assertEqual(len(records), 36)
+        for task_gid in set(rec["task"] for rec in records):
+            self.assertEqual([rec["gid"] for rec in records if rec["task"] == task_gid],
+                             [task_gid + "-" + str(day) for day in range(1, 4)])
+        self.assertEqual(Context.state["bookmarks"]["stories"]["created_at"], "2021-01-05T00:00:00.000000")
+        # Verify only tasks modified since the stories bookmark are listed
+        for call_args in mocked_call_api.call_args_list:
+            if call_args[0][0] == "tasks":
+                self.assertEqual(call_args[1]["modified_since"], "2021-01-01T00:00:00.000000")
+
+
+class TestAdaptiveWorkers(unittest.TestCase):
+
+    def test_workers_follow_concurrency_limit(self):
+        """Verify that without `max_workers` the fan-out runs as many workers as the adaptive limit allows"""
+        Context.config = {'start_date': '2021-01-01T00:00:00Z'}
+        Context.rate_limiter = RateLimiter(100000, 20)
+        self.addCleanup(setattr, Context, "rate_limiter", None)
+        concurrency = Context.rate_limiter.concurrency
+        lock = threading.Lock()
+        in_flight = [0]
+        started = {}
+
+        def fetch(item):
+            with lock:
+                in_flight[0] += 1
+                started[item] = in_flight[0]
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            yield item
+
+        stream = Stream()
+        records = []
+        for record in stream.fan_out(fetch, range(60)):
+            records.append(record)
+            if len(records) == 30:
+                # e.g. after a 429, the limit drops from 10 to 5
+                concurrency.decrease("a test")
+
+        self.assertEqual(sorted(records), list(range(60)))
+        self.assertEqual(stream.max_workers, 20)
+        self.assertEqual(max(started[item] for item in range(30)), 10)
+        # With 30 items done, at most the first 40 items were started at the cut,
+        # the later ones within the new limit
+        self.assertLessEqual(max(started[item] for item in range(40, 60)), 5)
@@ -0,0 +1,74 @@
+import unittest
+from unittest import mock
+import tap_asana
+import tap_asana.streams.tasks as tasks
+import tap_asana.streams.subtasks as subtasks
+import tap_asana.streams.teams as teams
+from tap_asana.context import Context
+from tap_asana.asana import Asana
+
+def get_catalog(stream_name, selected_fields):
+    """Return a catalog selecting only `selected_fields` of the stream"""
+    stream = Context.stream_objects[stream_name]()
+    schema = tap_asana.load_schema(stream_name)
+    mdata = tap_asana.get_discovery_metadata(stream, schema)
+    for entry in mdata:
+        if entry["breadcrumb"]:
+            entry["metadata"]["selected"] = entry["breadcrumb"][1] in selected_fields
+        else:
+            entry["metadata"]["selected"] = True
+    return {"streams": [{"tap_stream_id": stream_name, "schema": schema, "metadata": mdata}]}
+
+
+class TestOptFields(unittest.TestCase):
+
+    def setUp(self):
+        Context.config = {"start_date": "2021-01-01T00:00:00Z"}
+        Context.stream_map = {}
+        self.addCleanup(setattr, Context, "stream_map", {})
+        self.addCleanup(setattr, Context, "catalog", {})
+
+    def test_selected_fields_requested(self):
+        """Verify that only the selected, automatic, replication and required fields are requested"""
+        Context.catalog = get_catalog("tasks", ["name", "notes", "completed"])
+
+        self.assertEqual(tasks.Tasks().get_opt_fields(), "gid,name,completed,modified_at,notes,projects")
+
+    def test_subtasks_request_num_subtasks(self):
+        """Verify that subtasks always requests `num_subtasks` to walk the subtask trees"""
+        Context.catalog = get_catalog("subtasks", ["name"])
+
+        self.assertEqual(subtasks.SubTasks().get_opt_fields(), "gid,name,modified_at,num_subtasks")
+
+    def test_all_fields_without_catalog_entry(self):
+        """Verify that every field is requested when the stream is not in the catalog"""
+        Context.catalog = {"streams": []}
+
+        self.assertEqual(tasks.Tasks().get_opt_fields(), ",".join(tasks.Tasks.fields))
+
+    def test_unsupported_field_not_requested(self):
+        """Verify that a field the transformer drops as unsupported is not requested"""
+        Context.catalog = get_catalog("tasks", ["name", "notes"])
+        for entry in Context.catalog["streams"][0]["metadata"]:
+            if tuple(entry["breadcrumb"]) == ("properties", "notes"):
+                entry["metadata"]["inclusion"] = "unsupported"
+
+        self.assertNotIn("notes", tasks.Tasks().get_opt_fields().split(","))
+
+    @mock.patch("tap_asana.asana.Asana.refresh_access_token")
+    def test_team_users_fetched_only_when_selected(self, mocked_refresh_access_token):
+        """Verify that the users of the teams are not fetched when `users` is not selected"""
+        Context.catalog = get_catalog("teams", ["name"])
+        Context.directory = None
+        Context.asana = Asana('test', 'test', 'test', 'test', 'test')
+        Context.asana.client.workspaces.find_all = mock.Mock(return_value=[{"gid": "w1", "is_organization": True}])
+        Context.asana.client.teams.find_by_organization = mock.Mock(return_value=[{"gid": "t1"}])
+        Context.asana.client.teams.users = mock.Mock(return_value=[{"gid": "u1"}])
+
+        self.assertEqual(list(teams.Teams().get_objects()), [{"gid": "t1"}])
+        self.assertFalse(Context.asana.client.teams.users.called)
+        self.assertEqual(Context.asana.client.teams.find_by_organization.call_args[1]["opt_fields"], "gid,name")
+
+        Context.catalog = get_catalog("teams", ["name", "users"])
+        Context.stream_map = {}
+        self.assertEqual(list(teams.Teams().get_objects()), [{"gid": "t1", "users": [{"gid": "u1"}]}])
@@ -0,0 +1,118 @@
+import io
+import json
+import unittest
+from unittest import mock
+import tap_asana
+from tap_asana.context import Context
+from tap_asana.streams.base import Stream
+
+RECORDS_PER_STREAM = 30
+
+
+class FakeStream(Stream):
+    replication_method = "INCREMENTAL"
+    replication_key = "modified_at"
+
+    def get_objects(self):
+        session_bookmark = self.get_bookmark()
+        for i in range(RECORDS_PER_STREAM):
+            record = {"gid": "{}-{}".format(self.name, i),
+                      "modified_at": "2021-01-{:02d}T00:00:00Z".format(i % 28 + 1)}
+            session_bookmark = self.get_updated_session_bookmark(session_bookmark, record["modified_at"])
+            yield record
+        self.update_bookmark(session_bookmark)
+
+
+class FakeStreamA(FakeStream):
+    name = "fake_a"
+
+
+class FakeStreamB(FakeStream):
+    name = "fake_b"
+    uses_project_ids = True
+
+
+class FailingStream(Stream):
+    name = "fake_failing"
+
+    def get_objects(self):
+        raise ValueError("sync failed")
+
+
+def catalog_entry(stream_id):
+    return {
+        "tap_stream_id": stream_id,
+        "stream": stream_id,
+        "key_properties": ["gid"],
+        "schema": {"type": "object", "properties": {
+            "gid": {"type": ["null", "string"]},
+            "modified_at": {"type": ["null", "string"], "format": "date-time"}}},
+        "metadata": [{"breadcrumb": [], "metadata": {"selected": True}}],
+    }
+
+
+# Mock 'call_api' function for the resource directory
+def mock_call_api(resource, **kwargs):
+    if resource == "workspaces":
+        return [{"gid": "w1"}]
+    return [{"gid": "p1"}]
+
+
+@mock.patch("tap_asana.streams.base.Stream.call_api", side_effect=mock_call_api)
+@mock.patch("tap_asana.asana.Asana.refresh_access_token")
+class TestParallelStreams(unittest.TestCase):
+
+    def setUp(self):
+        Context.stream_objects.update({"fake_a": FakeStreamA, "fake_b": FakeStreamB,
+                                       "fake_failing": FailingStream})
+        self.addCleanup(Context.stream_objects.pop, "fake_a")
+        self.addCleanup(Context.stream_objects.pop, "fake_b")
+        self.addCleanup(Context.stream_objects.pop, "fake_failing")
+        Context.config = {"start_date": "2021-01-01T00:00:00Z", "parallel_streams": 2,
+                          "client_id": "test", "client_secret": "test",
+                          "redirect_uri": "test", "refresh_token": "test"}
+        Context.state = {}
+        Context.stream_map = {}
+        Context.counts = {}
+        Context.directory = None
+        self.addCleanup(setattr, Context, "state", {})
+        self.addCleanup(setattr, Context, "stream_map", {})
+
+    def run_sync(self):
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            tap_asana.sync()
+        return [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+    def test_streams_synced_in_processes(self, mocked_refresh_access_token, mocked_call_api):
+        """Verify that the records and merged bookmarks of all worker processes are written in Singer order"""
+        Context.catalog = {"streams": [catalog_entry("fake_a"), catalog_entry("fake_b")]}
+
+        messages = self.run_sync()
+
+        types = [message["type"] for message in messages]
+        # Verify every SCHEMA message is written before any RECORD
+        self.assertEqual(types[:2], ["SCHEMA", "SCHEMA"])
+        self.assertNotIn("SCHEMA", types[2:])
+        for stream_id in ["fake_a", "fake_b"]:
+            records = [i for i, message in enumerate(messages)
+                       if message["type"] == "RECORD" and message["stream"] == stream_id]
+            self.assertEqual(len(records), RECORDS_PER_STREAM)
+            self.assertEqual(Context.counts[stream_id], RECORDS_PER_STREAM)
+            # Verify the stream's bookmark is written after all of its records
+            first_bookmark = min(i for i, message in enumerate(messages)
+                                 if message["type"] == "STATE" and stream_id in message["value"]["bookmarks"])
+            self.assertGreater(first_bookmark, max(records))
+        self.assertEqual(messages[-1]["value"], {"bookmarks": {
+            "fake_a": {"modified_at": "2021-01-28T00:00:00.000000"},
+            "fake_b": {"modified_at": "2021-01-28T00:00:00.000000"}}})
+        # Verify the resource directory was listed once, in the parent process
+        self.assertEqual([args[0] for args, kwargs in mocked_call_api.call_args_list], ["workspaces", "projects"])
+
+    def test_worker_error_is_raised(self, mocked_refresh_access_token, mocked_call_api):
+        """Verify that an exception in a worker process fails the sync"""
+        Context.catalog = {"streams": [catalog_entry("fake_a"), catalog_entry("fake_failing")]}
+
+        with self.assertRaises(Exception) as err:
+            self.run_sync()
+        self.assertIn("fake_failing", str(err.exception))
+        self.assertIn("sync failed", str(err.exception))
@@ -0,0 +1,96 @@
+import threading
+import unittest
+from unittest import mock
+import requests
+import asana
+from tap_asana.concurrency import prefetch
+from tap_asana.context import Context
+from tap_asana.streams.base import CollectionPageIterator
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def test_values_in_order(self):
+        """Verify that every value is yielded in order"""
+        self.assertEqual(list(prefetch(iter(range(50)), 3)), list(range(50)))
+
+    def test_error_raised_in_order(self):
+        """Verify that an error of the iterable is raised after the values before it"""
+        def values():
+            yield 1
+            yield 2
+            raise ValueError("page failed")
+
+        values_seen = []
+        with self.assertRaises(ValueError):
+            for value in prefetch(values(), 2):
+                values_seen.append(value)
+        self.assertEqual(values_seen, [1, 2])
+
+    def test_depth_bounds_values_ahead(self):
+        """Verify that at most `depth` values are computed ahead of the one consumed"""
+        computed = []
+        lock = threading.Condition()
+
+        def values():
+            for i in range(10):
+                with lock:
+                    computed.append(i)
+                    lock.notify_all()
+                yield i
+
+        pages = prefetch(values(), 2)
+        self.assertEqual(next(pages), 0)
+        with lock:
+            lock.wait_for(lambda: len(computed) == 3, timeout=1)
+            # Verify the worker waits instead of computing more values
+            self.assertFalse(lock.wait_for(lambda: len(computed) > 3, timeout=0.2))
+        self.assertEqual(next(pages), 1)
+        with lock:
+            self.assertTrue(lock.wait_for(lambda: len(computed) == 4, timeout=1))
+        pages.close()
+
+
+def get_page(offset):
+    """Return the page of 2 items at `offset` of a collection of 7 items"""
+    data = [{"gid": str(i)} for i in range(offset, min(offset + 2, 7))]
+    next_page = {"offset": offset + 2} if offset + 2 < 7 else None
+    return {"data": data, "next_page": next_page}
+
+
+@mock.patch("time.sleep")
+@mock.patch("asana.client.Client.get")
+class TestPrefetchedCollection(unittest.TestCase):
+
+    def setUp(self):
+        Context.config = {"start_date": "2021-01-01T00:00:00Z", "prefetch_pages": "2"}
+        self.addCleanup(setattr, Context, "config", {})
+
+    def test_collection_items_prefetched(self, mocked_get, mocked_sleep):
+        """Verify that every item is returned and a timeout of a prefetched page is retried"""
+        timeouts = [requests.Timeout]
+
+        def get(path, query, **options):
+            if options.get("offset") == 4 and timeouts:
+                raise timeouts.pop()
+            return get_page(options.get("offset", 0))
+        mocked_get.side_effect = get
+        client = asana.client.Client({})
+
+        items = list(CollectionPageIterator(client, "/tasks", {}, {"page_size": 2}).items())
+
+        self.assertEqual(items, [{"gid": str(i)} for i in range(7)])
+        # 4 pages and a retry of the page that timed out
+        self.assertEqual(mocked_get.call_count, 5)
+        self.assertEqual(mocked_sleep.call_count, 1)
+
+    def test_collection_items_on_demand(self, mocked_get, mocked_sleep):
+        """Verify that pages are fetched on demand without `prefetch_pages`"""
+        Context.config = {"start_date": "2021-01-01T00:00:00Z"}
+        mocked_get.side_effect = lambda path, query, **options: get_page(options.get("offset", 0))
+        client = asana.client.Client({})
+
+        items = CollectionPageIterator(client, "/tasks", {}, {"page_size": 2}).items()
+
+        self.assertEqual(next(items), {"gid": "0"})
+        self.assertEqual(mocked_get.call_count, 1)
@@ -0,0 +1,101 @@
+import io
+import os
+import pstats
+import queue
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import tap_asana
+from tap_asana.context import Context
+from tap_asana.profiler import Profiler, REPORT_FILE
+from tap_asana.streams.base import Stream
+from tap_asana.writer import QueueWriter
+
+
+class FakeStream(Stream):
+    name = "fake_profiled"
+
+    def get_objects(self):
+        for i in range(10):
+            yield {"gid": str(i)}
+
+
+def hot_function():
+    return sum(range(10000))
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_threads_profiled_and_reported(self):
+        """Verify that the threads started while profiling are in the profile and its report"""
+        profiler = Profiler(self.directory, top=100)
+        profiler.stream = "tasks"
+        profiler.start()
+        thread = threading.Thread(target=profiler.timed("json_decode", hot_function))
+        thread.start()
+        thread.join()
+        path = profiler.stop()
+
+        functions = [function for _, _, function in pstats.Stats(path).stats]
+        self.assertIn("hot_function", functions)
+        self.assertGreater(profiler.phases["tasks"]["json_decode"], 0)
+        with self.assertLogs(level="INFO"):
+            profiler.report()
+        with open(os.path.join(self.directory, REPORT_FILE)) as report_file:
+            report = report_file.read()
+        self.assertIn("json_decode", report)
+        self.assertIn("hot_function", report)
+
+    def test_disabled_without_directory(self):
+        """Verify that the profiler is only used with `profile_dir`"""
+        self.assertIsNone(Profiler.from_config({}))
+        self.assertEqual(Profiler.from_config({"profile_dir": self.directory, "profile_top": "5"}).top, 5)
+
+    def test_stream_phases_timed(self):
+        """Verify that the transform and emit phases and the wall time of a stream are timed"""
+        Context.profiler = Profiler(self.directory)
+        self.addCleanup(setattr, Context, "profiler", None)
+        Context.stream_objects["fake_profiled"] = FakeStream
+        self.addCleanup(Context.stream_objects.pop, "fake_profiled")
+        Context.counts["fake_profiled"] = 0
+        self.addCleanup(Context.counts.pop, "fake_profiled")
+        catalog_entry = {"tap_stream_id": "fake_profiled", "schema": {
+            "type": "object", "properties": {"gid": {"type": ["null", "string"]}}},
+                         "metadata": [{"breadcrumb": [], "metadata": {"selected": True}}]}
+
+        with mock.patch("sys.stdout", new_callable=io.StringIO):
+            tap_asana.sync_stream(catalog_entry)
+
+        phases = Context.profiler.phases["fake_profiled"]
+        self.assertEqual(Context.counts["fake_profiled"], 10)
+        for phase in ["wall", "transform", "emit"]:
+            self.assertGreater(phases[phase], 0)
+
+    def test_worker_emit_timed_by_parent(self):
+        """Verify that a worker process does not time its records as emitted, the parent does"""
+        Context.profiler = Profiler(self.directory)
+        self.addCleanup(setattr, Context, "profiler", None)
+        Context.stream_objects["fake_profiled"] = FakeStream
+        self.addCleanup(Context.stream_objects.pop, "fake_profiled")
+        Context.counts["fake_profiled"] = 0
+        self.addCleanup(Context.counts.pop, "fake_profiled")
+        writer = Context.writer
+        self.addCleanup(setattr, Context, "writer", writer)
+        messages = queue.Queue()
+        Context.writer = QueueWriter(messages, "fake_profiled")
+        catalog_entry = {"tap_stream_id": "fake_profiled", "schema": {
+            "type": "object", "properties": {"gid": {"type": ["null", "string"]}}},
+                         "metadata": [{"breadcrumb": [], "metadata": {"selected": True}}]}
+
+        tap_asana.sync_stream(catalog_entry)
+
+        self.assertEqual(messages.qsize(), 10)
+        phases = Context.profiler.phases["fake_profiled"]
+        self.assertGreater(phases["transform"], 0)
+        self.assertNotIn("emit", phases)
@@ -133,3 +133,32 @@ class TestProjectIdCaching(unittest.TestCase):
 
         self.assertEquals(list_task, expected_data)
         self.assertEquals(len(list_task), 12)
+
+    # Verify that workspaces and projects are listed once and shared by all streams in a run
+    @mock.patch("tap_asana.streams.base.Stream.is_bookmark_old")
+    def test_project_ids_listed_once_per_run(self, mocked_is_bookmark_old, mocked_call_api, mocked_sleep, mocked_refresh_access_token):
+        # Set config file
+        Context.config = {'start_date': '2021-01-01T00:00:00Z'}
+        # Set asana client in Context before test
+        Context.asana = Asana('test', 'test', 'test', 'test', 'test')
+        # Mock 'call_api' function
+        mocked_call_api.side_effect = mock_call_api
+        Context.asana.client.sections.get_sections_for_project = sections_data
+        Context.asana.client.stories.get_stories_for_task = stories_data
+        mocked_is_bookmark_old.return_value = True
+
+        list(sections.Sections().get_objects())
+        list(tasks.Tasks().get_objects())
+        list(stories.Stories().get_objects())
+
+        # Verify 'workspaces' and 'projects' were each listed only once for all 3 streams
+        resources = [call_args[0][0] for call_args in mocked_call_api.call_args_list]
+        self.assertEqual(resources.count("workspaces"), 1)
+        self.assertEqual(resources.count("projects"), 1)
+
+        # Verify a new Asana client starts a new directory
+        Context.asana = Asana('test', 'test', 'test', 'test', 'test')
+        Context.asana.client.sections.get_sections_for_project = sections_data
+        list(sections.Sections().get_objects())
+        resources = [call_args[0][0] for call_args in mocked_call_api.call_args_list]
+        self.assertEqual(resources.count("workspaces"), 2)
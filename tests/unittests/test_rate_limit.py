@@ -0,0 +1,173 @@
+import threading
+import unittest
+from unittest import mock
+import requests
+from parameterized import parameterized
+from tap_asana.context import Context
+from tap_asana.asana import Asana
+from tap_asana.rate_limit import RateLimiter, RateLimitedAdapter, ConcurrencyController
+
+
+class FakeClock():
+    """Monotonic clock advanced only by the mocked `time.sleep`"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.multiple("tap_asana.rate_limit.time",
+                                      monotonic=self.clock.monotonic, sleep=self.clock.sleep)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_requests_stay_within_limit(self):
+        """Verify that no 60 second window holds more requests than the configured limit"""
+        limiter = RateLimiter(requests_per_minute=600, max_concurrent=5)
+        sent = []
+        for _ in range(2000):
+            limiter.acquire()
+            sent.append(self.clock.now)
+            limiter.release(self.clock.now, 200)
+
+        # The burst is sent at once, then requests follow at the refill rate
+        self.assertEqual(sent[:60], [1000.0] * 60)
+        start = 0
+        for end, sent_at in enumerate(sent):
+            while sent[start] <= sent_at - 60:
+                start += 1
+            self.assertLessEqual(end - start + 1, 600)
+
+    def test_pause_holds_back_requests(self):
+        """Verify that a pause delays every request until it is over"""
+        limiter = RateLimiter(requests_per_minute=600, max_concurrent=5)
+        limiter.pause(30)
+
+        limiter.acquire()
+
+        self.assertEqual(self.clock.now, 1030.0)
+
+    def test_from_config(self):
+        """Verify that the limits are read from the config and split between processes"""
+        limiter = RateLimiter.from_config({"requests_per_minute": "1200", "max_concurrent_requests": "10"}, share=2)
+
+        self.assertEqual(limiter.capacity, 60)
+        self.assertEqual(limiter.rate, 9)
+
+
+class TestConcurrencyController(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch("tap_asana.rate_limit.time.monotonic", side_effect=self.clock.monotonic)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send(self, controller, requests_count, latency=1.0, status_code=200):
+        """Send `requests_count` concurrent requests completing with the same outcome"""
+        sent_at = self.clock.now
+        for _ in range(requests_count):
+            controller.acquire()
+        self.clock.now += latency
+        for _ in range(requests_count):
+            controller.release(sent_at, latency, status_code)
+
+    def test_limit_raised_while_healthy(self):
+        """Verify that the limit grows by about one per round of healthy responses, up to the maximum"""
+        controller = ConcurrencyController(max_concurrent=20, initial=4)
+        for _ in range(3):
+            self.send(controller, int(controller.limit))
+
+        self.assertEqual(int(controller.limit), 6)
+        for _ in range(100):
+            self.send(controller, int(controller.limit))
+        self.assertEqual(controller.limit, 20)
+
+    @parameterized.expand([
+        ["rate_limited", 1.0, 429],
+        ["server_error", 1.0, 503],
+        ["failed_request", 1.0, None],
+        ["latency_spike", 10.0, 200],
+    ])
+    def test_limit_cut_once_per_burst(self, name, latency, status_code):
+        """Verify that a burst of unhealthy responses halves the limit once"""
+        controller = ConcurrencyController(max_concurrent=20, initial=16)
+        for _ in range(10):
+            self.send(controller, 1)
+
+        self.send(controller, 16, latency=latency, status_code=status_code)
+
+        self.assertEqual(int(controller.limit), 8)
+        # Requests sent after the cut can cut the limit again
+        self.send(controller, 8, latency=latency, status_code=status_code)
+        self.assertEqual(int(controller.limit), 4)
+
+    def test_in_flight_requests_bounded(self):
+        """Verify that a request waits while the limit is reached"""
+        controller = ConcurrencyController(max_concurrent=20, initial=1)
+        controller.acquire()
+        waiting = threading.Thread(target=controller.acquire)
+        waiting.start()
+
+        waiting.join(0.1)
+        self.assertTrue(waiting.is_alive())
+        controller.release(self.clock.now, 1.0, 200)
+        waiting.join(1)
+        self.assertFalse(waiting.is_alive())
+
+
+def get_response(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    return response
+
+
+@mock.patch("requests.adapters.HTTPAdapter.send")
+class TestRateLimitedAdapter(unittest.TestCase):
+
+    def test_429_pauses_limiter(self, mocked_send):
+        """Verify that a 429 response pauses the limiter for the `Retry-After` seconds"""
+        mocked_send.return_value = get_response(429, {"Retry-After": "12"})
+        limiter = mock.Mock()
+        adapter = RateLimitedAdapter(lambda: limiter)
+
+        response = adapter.send(requests.Request("GET", "https://app.asana.com/api/1.0/users").prepare())
+
+        self.assertEqual(response.status_code, 429)
+        limiter.acquire.assert_called_once_with()
+        limiter.release.assert_called_once_with(mock.ANY, 429)
+        limiter.pause.assert_called_once_with(12.0)
+
+    def test_slot_released_on_error(self, mocked_send):
+        """Verify that the request slot is released when sending fails"""
+        mocked_send.side_effect = requests.exceptions.ConnectionError
+        limiter = mock.Mock()
+        adapter = RateLimitedAdapter(lambda: limiter)
+
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            adapter.send(requests.Request("GET", "https://app.asana.com/api/1.0/users").prepare())
+        limiter.release.assert_called_once_with(mock.ANY, None)
+        self.assertFalse(limiter.pause.called)
+
+    @mock.patch("tap_asana.asana.Asana.refresh_access_token")
+    def test_adapter_mounted_on_client(self, mocked_refresh_access_token, mocked_send):
+        """Verify that the Asana client sends its requests through the shared rate limiter"""
+        mocked_send.return_value = get_response(200)
+        Context.rate_limiter = mock.Mock()
+        self.addCleanup(setattr, Context, "rate_limiter", None)
+
+        client = Asana('test', 'test', 'test', 'test', 'test').client
+        client.session.get("https://app.asana.com/api/1.0/users")
+
+        Context.rate_limiter.acquire.assert_called_once_with()
+        Context.rate_limiter.release.assert_called_once_with(mock.ANY, 200)
@@ -0,0 +1,175 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from asana.error import ServerError
+from tap_asana.asana import Asana
+from tap_asana.context import Context
+from tap_asana.request_metrics import RequestMetrics, get_endpoint
+from tap_asana.streams.base import Stream, asana_error_handling
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    """Answers with the status code ending the path, e.g. `/api/1.0/status/429`"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        status = int(self.path.split("?")[0].rsplit("/", 1)[1])
+        body = json.dumps({"data": []}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Answers the statuses queued in `server.statuses`, with a `Retry-After` on 429, then 200"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        body = json.dumps({"data": [{"gid": "1"}] if status == 200 else None}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class TestRequestMetrics(unittest.TestCase):
+
+    def test_endpoint_groups_gids(self):
+        """Verify that the requests of an endpoint are grouped whatever the gids in the path"""
+        self.assertEqual(get_endpoint("/api/1.0/tasks/1203/stories?limit=100"), "/tasks/{gid}/stories")
+        self.assertEqual(get_endpoint("/api/1.0/tasks"), "/tasks")
+
+    def test_percentiles(self):
+        """Verify the nearest-rank latency percentiles of an endpoint"""
+        metrics = RequestMetrics()
+        metrics.stream = "tasks"
+        for latency in range(1, 101):
+            metrics.add_request("/api/1.0/tasks", latency / 1000, 0, 200, 10)
+
+        summary = metrics.to_dict()["streams"]["tasks"]["/tasks"]
+        self.assertEqual(summary["latency_ms"], {"p50": 50.0, "p90": 90.0, "p99": 99.0, "max": 100.0})
+        self.assertEqual(summary["requests"], 100)
+        self.assertEqual(summary["bytes_received"], 1000)
+
+    @mock.patch("time.sleep")
+    def test_backoff_attributed_to_last_endpoint(self, mocked_sleep):
+        """Verify that the wait before a retry is counted for the endpoint of the thread's last request"""
+        Context.request_metrics = metrics = RequestMetrics()
+        self.addCleanup(setattr, Context, "request_metrics", RequestMetrics())
+        metrics.stream = "stories"
+        responses = [ServerError(mock.Mock(status=500)), "ok"]
+
+        @asana_error_handling
+        def get():
+            metrics.add_request("/api/1.0/tasks/1/stories", 0.1, 0, 500, 0)
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        self.assertEqual(get(), "ok")
+        summary = metrics.to_dict()["streams"]["stories"]["/tasks/{gid}/stories"]
+        self.assertEqual(summary["backoff_seconds"], round(mocked_sleep.call_args[0][0], 3))
+        self.assertEqual(summary["server_errors"], 2)
+
+    def test_merge_and_summary(self):
+        """Verify that the metrics of worker processes are merged, logged and written as JSON"""
+        metrics = RequestMetrics()
+        for stream in ["projects", "tasks"]:
+            worker = RequestMetrics()
+            worker.stream = stream
+            worker.add_request("/api/1.0/projects", 0.2, 0.5, 429, 0)
+            worker.add_request("/api/1.0/projects", 0.1, 0, None, 0)
+            metrics.merge(worker.endpoints)
+
+        with tempfile.TemporaryDirectory() as directory, self.assertLogs(level="INFO") as logs:
+            path = os.path.join(directory, "metrics.json")
+            metrics.write_summary(path)
+            metrics.log()
+            with open(path) as summary_file:
+                summary = json.load(summary_file)
+
+        self.assertEqual(set(summary["streams"]), {"projects", "tasks"})
+        projects = summary["streams"]["projects"]["/projects"]
+        self.assertEqual((projects["requests"], projects["rate_limited"], projects["failed"]), (2, 1, 1))
+        self.assertEqual(projects["queued_seconds"], 0.5)
+        points = [json.loads(line.split("METRIC: ", 1)[1]) for line in logs.output if "METRIC: " in line]
+        self.assertIn({"type": "counter", "metric": "http_request_count", "value": 2,
+                       "tags": {"stream": "tasks", "endpoint": "/projects"}}, points)
+
+
+@mock.patch("tap_asana.asana.Asana.refresh_access_token")
+class TestTransportRequestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StatusHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        Context.request_metrics = RequestMetrics()
+        self.addCleanup(setattr, Context, "request_metrics", RequestMetrics())
+        # The local server is plain HTTP
+        patcher = mock.patch.dict(os.environ, {"OAUTHLIB_INSECURE_TRANSPORT": "1"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_requests_counted_by_stream_and_endpoint(self, mocked_refresh_access_token):
+        """Verify that every request sent is counted for the stream being synced, by status"""
+        session = Asana('test', 'test', 'test', 'test', 'test').client.session
+        url = "http://127.0.0.1:{}/api/1.0/status/".format(self.server.server_port)
+
+        Context.request_metrics.stream = "tasks"
+        for status in [200, 200, 429, 503]:
+            session.get(url + str(status))
+        Context.request_metrics.stream = "stories"
+        session.get(url + "200")
+
+        summary = Context.request_metrics.to_dict()["streams"]
+        self.assertEqual(summary["tasks"]["/status/{gid}"]["requests"], 4)
+        self.assertEqual(summary["tasks"]["/status/{gid}"]["rate_limited"], 1)
+        self.assertEqual(summary["tasks"]["/status/{gid}"]["server_errors"], 1)
+        self.assertEqual(summary["tasks"]["/status/{gid}"]["bytes_received"], 4 * len(b'{"data": []}'))
+        self.assertEqual(summary["stories"]["/status/{gid}"]["requests"], 1)
+        self.assertGreater(summary["stories"]["/status/{gid}"]["latency_ms"]["max"], 0)
+
+    @mock.patch("time.sleep")
+    def test_retries_counted_as_backoff(self, mocked_sleep, mocked_refresh_access_token):
+        """Verify that the waits before retrying 429 and 5xx responses of the SDK are counted as backoff"""
+        server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+        server.daemon_threads = True
+        server.statuses = [429, 429, 503]
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        Context.config = {"start_date": "2021-01-01T00:00:00Z"}
+        Context.asana = Asana('test', 'test', 'test', 'test', 'test',
+                              base_url="http://127.0.0.1:{}/api/1.0".format(server.server_port))
+
+        Context.request_metrics.stream = "workspaces"
+        records = list(Stream().call_api("workspaces"))
+
+        self.assertEqual(records, [{"gid": "1"}])
+        summary = Context.request_metrics.to_dict()["streams"]["workspaces"]["/workspaces"]
+        self.assertEqual((summary["requests"], summary["rate_limited"], summary["server_errors"]), (4, 2, 1))
+        # Retried once per failure, after the Retry-After delay for a 429
+        waits = [args[0] for args, kwargs in mocked_sleep.call_args_list]
+        self.assertEqual(waits[:2], [1, 1])
+        self.assertEqual(len(waits), 3)
+        self.assertEqual(summary["backoff_seconds"], round(sum(waits), 3))
@@ -0,0 +1,116 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from tap_asana.asana import Asana
+from tap_asana.context import Context
+from tap_asana.response_cache import ResponseCache
+
+
+class ETagHandler(BaseHTTPRequestHandler):
+    """Serves a collection per path, tagged with the path's version, answering 304 when unchanged"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        path = self.path.split("?")[0]
+        version = self.server.versions.get(path, 1)
+        etag = '"{}"'.format(version)
+        self.server.statuses.append(304 if self.headers.get("If-None-Match") == etag else 200)
+        if self.server.statuses[-1] == 304:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        body = json.dumps({"data": [{"gid": "{}-{}".format(path, version)}], "next_page": None}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@mock.patch("tap_asana.asana.Asana.refresh_access_token")
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ETagHandler)
+        self.server.daemon_threads = True
+        self.server.versions = {}
+        self.server.statuses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        Context.response_cache = ResponseCache(self.directory, 1024 * 1024)
+        self.addCleanup(setattr, Context, "response_cache", None)
+        # The local server is plain HTTP
+        patcher = mock.patch.dict(os.environ, {"OAUTHLIB_INSECURE_TRANSPORT": "1"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_collection(self, path):
+        client = Asana('test', 'test', 'test', 'test', 'test').client
+        client.options["base_url"] = "http://127.0.0.1:{}/api/1.0".format(self.server.server_port)
+        return list(client.get_collection(path, {"opt_fields": "gid,name"}))
+
+    def test_unchanged_response_served_from_cache(self, mocked_refresh_access_token):
+        """Verify that a collection that did not change is served from the cache"""
+        first = self.get_collection("/workspaces")
+        # A new cache on the same directory, as in the next sync
+        Context.response_cache = ResponseCache(self.directory, 1024 * 1024)
+        second = self.get_collection("/workspaces")
+
+        self.assertEqual(second, first)
+        self.assertEqual(self.server.statuses, [200, 304])
+        self.assertEqual(Context.response_cache.hits, 1)
+
+    def test_changed_response_fetched(self, mocked_refresh_access_token):
+        """Verify that a collection that changed is fetched and cached again"""
+        self.get_collection("/organizations/1/teams")
+        self.server.versions["/api/1.0/organizations/1/teams"] = 2
+
+        self.assertEqual(self.get_collection("/organizations/1/teams"), [{"gid": "/api/1.0/organizations/1/teams-2"}])
+        self.assertEqual(self.get_collection("/organizations/1/teams"), [{"gid": "/api/1.0/organizations/1/teams-2"}])
+        self.assertEqual(self.server.statuses, [200, 200, 304])
+
+    def test_incremental_endpoint_not_cached(self, mocked_refresh_access_token):
+        """Verify that the endpoints of the incremental streams are not cached"""
+        self.get_collection("/tasks")
+        self.get_collection("/tasks")
+
+        self.assertEqual(self.server.statuses, [200, 200])
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_least_recently_used_evicted(self, mocked_refresh_access_token):
+        """Verify that the least recently used responses are evicted beyond the size limit"""
+        self.get_collection("/projects/1/sections")
+        size = os.path.getsize(os.path.join(self.directory, os.listdir(self.directory)[0]))
+        Context.response_cache = ResponseCache(self.directory, size * 2)
+        for project_id in ["2", "1", "3"]:
+            # Distinct modification times for the least recently used order
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                os.utime(path, (os.path.getmtime(path) - 10,) * 2)
+            self.get_collection("/projects/{}/sections".format(project_id))
+
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        self.server.statuses = []
+        self.get_collection("/projects/1/sections")
+        self.get_collection("/projects/2/sections")
+        # project 2 was the least recently used
+        self.assertEqual(self.server.statuses, [304, 200])
+
+    def test_disabled_without_directory(self, mocked_refresh_access_token):
+        """Verify that the cache is only used with `response_cache_dir`"""
+        self.assertIsNone(ResponseCache.from_config({}))
+        cache = ResponseCache.from_config({"response_cache_dir": self.directory, "response_cache_size_mb": "5"})
+        self.assertEqual(cache.max_bytes, 5 * 1024 * 1024)
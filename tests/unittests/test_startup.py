@@ -0,0 +1,47 @@
+import io
+import json
+import subprocess
+import sys
+import unittest
+from unittest import mock
+import tap_asana
+from tap_asana.context import Context
+from tap_asana.streams.tags import Tags
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_streams_imported_on_first_use(self):
+        """Verify that a stream's module is only imported when the stream is looked up"""
+        code = ("import sys, tap_asana; from tap_asana.context import Context; "
+                "before = 'tap_asana.streams.tags' in sys.modules; Context.stream_objects['tags']; "
+                "print(before, 'tap_asana.streams.tags' in sys.modules, 'tap_asana.streams.tasks' in sys.modules)")
+        output = subprocess.check_output([sys.executable, "-c", code], stderr=subprocess.DEVNULL)
+        self.assertEqual(output.decode().split(), ["False", "True", "False"])
+
+    def test_registry_lookups(self):
+        """Verify that the registry knows every stream of the tap and only those"""
+        streams = Context.stream_objects
+
+        self.assertIn("tags", streams)
+        self.assertIs(streams["tags"], Tags)
+        self.assertIs(streams.get("tags"), Tags)
+        self.assertNotIn("unknown", streams)
+        self.assertIsNone(streams.get("unknown"))
+        with self.assertRaises(KeyError):
+            streams["unknown"]  # pylint: disable=pointless-statement
+
+    @mock.patch("tap_asana.asana.Asana.__init__", side_effect=AssertionError("client created"))
+    @mock.patch("singer.utils.parse_args")
+    def test_discover_without_client(self, mocked_parse_args, mocked_asana_init):
+        """Verify that discovery creates no client, so makes no token refresh"""
+        mocked_parse_args.return_value = mock.Mock(config={"start_date": "2021-01-01T00:00:00Z"},
+                                                   state={}, discover=True)
+        self.addCleanup(setattr, Context, "config", {})
+
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            tap_asana.main()
+
+        catalog = json.loads(stdout.getvalue())
+        self.assertEqual(len(catalog["streams"]), 10)
+        mocked_asana_init.assert_not_called()
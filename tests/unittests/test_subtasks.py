@@ -0,0 +1,108 @@
+import unittest
+from unittest import mock
+import tap_asana.streams.subtasks as subtasks
+from tap_asana.concurrency import WorkItems, fan_out
+from tap_asana.context import Context
+from tap_asana.asana import Asana
+
+# Depth of the dummy subtask chain, well above the default recursion limit
+CHAIN_DEPTH = 2000
+
+
+# Mock 'call_api' function: 1 workspace, 2 projects with 2 tasks each
+def mock_call_api(resource, **kwargs):
+    if resource == "workspaces":
+        return [{"gid": "1"}]
+    if resource == "projects":
+        return [{"gid": "p1"}, {"gid": "p2"}]
+    return [{"gid": kwargs["project"] + "-t1"}, {"gid": kwargs["project"] + "-t2"}]
+
+
+# Dummy subtasks: every task has 2 children, down to 2 levels below the project's tasks
+def subtasks_for_task(task_gid, **kwargs):
+    if task_gid.count("-") > 2:
+        return []
+    return [{"gid": task_gid + "-" + str(i), "modified_at": "2021-01-02T00:00:00Z"} for i in range(2)]
+
+
+# Dummy subtasks: a single chain of CHAIN_DEPTH nested subtasks under 'p1-t1'
+def chained_subtasks_for_task(task_gid, **kwargs):
+    if task_gid.startswith("p1-t1") and task_gid.count("-") <= CHAIN_DEPTH:
+        return [{"gid": task_gid + "-s", "modified_at": "2021-01-02T00:00:00Z"}]
+    return []
+
+
+class TestFanOutExpand(unittest.TestCase):
+
+    def test_expand_walks_tree_breadth_first(self):
+        """Verify that items returned by `expand` are fetched level by level"""
+        tree = {"a": ["a1", "a2"], "a1": ["a11"], "a2": ["a21"]}
+
+        records = list(fan_out(lambda item: tree.get(item, []), WorkItems(["a"], expand=lambda record: [record]), 1))
+
+        self.assertEqual(records, ["a1", "a2", "a11", "a21"])
+
+
+@mock.patch("tap_asana.asana.Asana.refresh_access_token")
+@mock.patch("tap_asana.streams.base.Stream.call_api")
+class TestSubTasks(unittest.TestCase):
+
+    def setUp(self):
+        Context.state = {}
+        self.addCleanup(setattr, Context, "state", {})
+
+    def test_subtasks_tree_serial_and_concurrent(self, mocked_call_api, mocked_refresh_access_token):
+        """Verify that every level of the subtask tree is returned with and without concurrency"""
+        mocked_call_api.side_effect = mock_call_api
+        # 4 tasks with 2 children and 4 grandchildren each
+        expected = sorted(
+            "{}-{}-{}".format(project, task, i)
+            for project in ["p1", "p2"] for task in ["t1", "t2"] for i in range(2)
+        ) + sorted(
+            "{}-{}-{}-{}".format(project, task, i, j)
+            for project in ["p1", "p2"] for task in ["t1", "t2"] for i in range(2) for j in range(2)
+        )
+
+        for max_workers in [1, 4]:
+            Context.config = {'start_date': '2021-01-01T00:00:00Z', 'max_workers': max_workers}
+            Context.asana = Asana('test', 'test', 'test', 'test', 'test')
+            Context.asana.client.tasks.get_subtasks_for_task = subtasks_for_task
+
+            records = list(subtasks.SubTasks().get_objects())
+
+            self.assertEqual(sorted(rec["gid"] for rec in records), sorted(expected))
+
+    def test_deep_subtask_chain(self, mocked_call_api, mocked_refresh_access_token):
+        """Verify that a subtask chain deeper than the recursion limit is traversed"""
+        mocked_call_api.side_effect = mock_call_api
+        Context.config = {'start_date': '2021-01-01T00:00:00Z'}
+        Context.asana = Asana('test', 'test', 'test', 'test', 'test')
+        Context.asana.client.tasks.get_subtasks_for_task = chained_subtasks_for_task
+
+        records = list(subtasks.SubTasks().get_objects())
+
+        self.assertEqual(len(records), CHAIN_DEPTH)
+
+    def test_no_lookup_for_tasks_without_subtasks(self, mocked_call_api, mocked_refresh_access_token):
+        """Verify that subtasks are only requested for tasks whose `num_subtasks` is not 0"""
+        def mock_tasks_call_api(resource, **kwargs):
+            if resource == "tasks":
+                return [{"gid": "t1", "num_subtasks": 2}, {"gid": "t2", "num_subtasks": 0},
+                        {"gid": "t3"}]
+            return mock_call_api(resource, **kwargs)
+        mocked_call_api.side_effect = mock_tasks_call_api
+        Context.config = {'start_date': '2021-01-01T00:00:00Z'}
+        Context.asana = Asana('test', 'test', 'test', 'test', 'test')
+        Context.asana.client.tasks.get_subtasks_for_task = mock.Mock(side_effect=lambda task_gid, **kwargs: {
+            "t1": [{"gid": "t1-1", "num_subtasks": 1, "modified_at": "2021-01-02T00:00:00Z"},
+                   {"gid": "t1-2", "num_subtasks": 0, "modified_at": "2021-01-02T00:00:00Z"}],
+            "t1-1": [{"gid": "t1-1-1", "num_subtasks": 0, "modified_at": "2021-01-02T00:00:00Z"}],
+        }.get(task_gid, []))
+
+        records = list(subtasks.SubTasks().get_objects())
+
+        self.assertEqual(sorted(rec["gid"] for rec in records), sorted(["t1-1", "t1-1-1", "t1-2"] * 2))
+        # Each of the 2 projects: 't1', 't3' (no count returned) and 't1-1'
+        requested = [call_args[0][0] for call_args in
+                     Context.asana.client.tasks.get_subtasks_for_task.call_args_list]
+        self.assertEqual(sorted(requested), sorted(["t1", "t3", "t1-1"] * 2))
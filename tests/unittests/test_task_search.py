@@ -0,0 +1,121 @@
+import datetime
+import unittest
+from unittest import mock
+import asana
+from singer import utils
+import tap_asana.streams.tasks as tasks
+from tap_asana.context import Context
+from tap_asana.asana import Asana
+
+NOW = utils.strptime_to_utc("2021-01-03T00:00:00Z")
+
+
+class FakeSearchEndpoint():
+    """Fake `/workspaces/{gid}/tasks/search` endpoint over a list of tasks"""
+
+    def __init__(self, tasks_list, fail_windows_longer_than=None):
+        self.tasks = sorted(tasks_list, key=lambda task: task["modified_at"])
+        self.fail_windows_longer_than = fail_windows_longer_than
+        self.windows = []
+
+    def get(self, path, params, **options):
+        after = utils.strptime_to_utc(params["modified_at.after"])
+        before = utils.strptime_to_utc(params["modified_at.before"])
+        self.windows.append((after, before))
+        if self.fail_windows_longer_than and before - after > self.fail_windows_longer_than:
+            response = mock.Mock(status=500)
+            raise asana.error.ServerError(response)
+        matching = [task for task in self.tasks
+                    if after < utils.strptime_to_utc(task["modified_at"]) < before]
+        return matching[:params["limit"]]
+
+
+def build_tasks(count, start="2021-01-01T00:00:00Z", step_minutes=10):
+    start = utils.strptime_to_utc(start)
+    return [{"gid": str(i), "projects": [{"gid": "p1"}],
+             "modified_at": (start + datetime.timedelta(minutes=step_minutes * i)).strftime("%Y-%m-%dT%H:%M:%SZ")}
+            for i in range(count)]
+
+
+@mock.patch("singer.utils.now", return_value=NOW)
+@mock.patch("tap_asana.asana.Asana.refresh_access_token")
+class TestTaskSearch(unittest.TestCase):
+
+    def setUp(self):
+        Context.config = {'start_date': '2021-01-01T00:00:00Z', 'use_search': 'true'}
+        Context.state = {}
+        self.addCleanup(setattr, Context, "state", {})
+
+    def sync_tasks(self, endpoint):
+        Context.asana = Asana('test', 'test', 'test', 'test', 'test')
+        Context.asana.client.workspaces.find_all = mock.Mock(return_value=[{"gid": "w1"}])
+        Context.asana.client.get = mock.Mock(side_effect=endpoint.get)
+        return list(tasks.Tasks().get_objects())
+
+    def test_windows_shrink_on_result_cap(self, mocked_refresh_access_token, mocked_now):
+        """Verify that windows hitting the result cap are shrunk and every task is returned"""
+        # 250 tasks over ~42 hours, more than the cap in a 1 day window
+        endpoint = FakeSearchEndpoint(build_tasks(250))
+
+        records = self.sync_tasks(endpoint)
+
+        self.assertEqual(sorted(int(rec["gid"]) for rec in records), list(range(250)))
+        self.assertLess(min(before - after for after, before in endpoint.windows), datetime.timedelta(days=1))
+        self.assertEqual(Context.state["bookmarks"]["tasks"]["modified_at"],
+                         build_tasks(250)[-1]["modified_at"].replace("Z", ".000000"))
+
+    def test_tasks_in_window_overlap_synced_once(self, mocked_refresh_access_token, mocked_now):
+        """Verify that a task in the overlap of two windows, or after a capped search, is synced once"""
+        # Task '0' is in the last second of the first window, tasks '1' to '101'
+        # are half a second apart, more than the cap in the minimum window
+        start = utils.strptime_to_utc("2021-01-02T12:00:00Z")
+        tasks_list = [{"gid": "0", "projects": [{"gid": "p1"}], "modified_at": "2021-01-01T23:59:59.500Z"}]
+        tasks_list += [{"gid": str(i), "projects": [{"gid": "p1"}], "modified_at": tasks.Tasks.format_search_date(
+            start + datetime.timedelta(seconds=i / 2))} for i in range(1, tasks.SEARCH_RESULT_CAP + 2)]
+        endpoint = FakeSearchEndpoint(tasks_list)
+
+        records = self.sync_tasks(endpoint)
+
+        self.assertEqual(sorted(int(rec["gid"]) for rec in records), list(range(tasks.SEARCH_RESULT_CAP + 2)))
+
+    def test_windows_shrink_on_server_error(self, mocked_refresh_access_token, mocked_now):
+        """Verify that windows failing with a 500 are shrunk"""
+        endpoint = FakeSearchEndpoint(build_tasks(20), fail_windows_longer_than=datetime.timedelta(hours=6))
+
+        records = self.sync_tasks(endpoint)
+
+        self.assertEqual(sorted(int(rec["gid"]) for rec in records), list(range(20)))
+
+    def test_failure_at_minimum_window_raises(self, mocked_refresh_access_token, mocked_now):
+        """Verify that a search still failing at the minimum window size raises an AsanaError"""
+        endpoint = FakeSearchEndpoint(build_tasks(3), fail_windows_longer_than=datetime.timedelta(seconds=30))
+
+        with self.assertRaises(asana.error.AsanaError) as err:
+            self.sync_tasks(endpoint)
+        self.assertIn("minimum window size", str(err.exception))
+
+    def test_tasks_outside_projects_are_skipped(self, mocked_refresh_access_token, mocked_now):
+        """Verify that tasks without projects are not synced"""
+        tasks_list = build_tasks(3)
+        tasks_list[1]["projects"] = []
+
+        records = self.sync_tasks(FakeSearchEndpoint(tasks_list))
+
+        self.assertEqual(sorted(rec["gid"] for rec in records), ["0", "2"])
+
+    @mock.patch("tap_asana.streams.base.Stream.call_api")
+    def test_premium_only_workspace_falls_back_to_project_scan(self, mocked_call_api, mocked_refresh_access_token, mocked_now):
+        """Verify that a workspace without task search is scanned project by project"""
+        def mock_call_api(resource, **kwargs):
+            if resource == "workspaces":
+                return [{"gid": "w1"}]
+            if resource == "projects":
+                return [{"gid": "p1"}]
+            return [{"gid": "scanned", "modified_at": "2021-01-02T00:00:00Z"}]
+        mocked_call_api.side_effect = mock_call_api
+        Context.asana = Asana('test', 'test', 'test', 'test', 'test')
+        Context.asana.client.get = mock.Mock(side_effect=asana.error.PremiumOnlyError(mock.Mock()))
+
+        records = list(tasks.Tasks().get_objects())
+
+        self.assertEqual(records, [{"gid": "scanned", "modified_at": "2021-01-02T00:00:00Z"}])
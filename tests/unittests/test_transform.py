@@ -0,0 +1,132 @@
+import copy
+import random
+import unittest
+from unittest import mock
+from parameterized import parameterized
+from singer import metadata
+from singer.transform import Transformer, SchemaMismatch
+import tap_asana
+from tap_asana.context import Context
+from tap_asana.streams import STREAM_NAMES
+from tap_asana.transform import StreamTransformer, ExtractionClock, transform_datetime
+
+# Values of every kind, valid or not for the schema they end up in
+SAMPLE_VALUES = [
+    None, "", "text", "12", "1,234", "false", "True", 0, 1, 7.5, True, False,
+    "2021-01-01T12:30:45.123Z", "2021-01-01T12:30:45Z", "2021-02-30T00:00:00.000Z",
+    "2021-01-01", "2021-01-01T12:30:45+05:30", "not a date",
+    {"gid": "1", "name": "nested"}, [{"gid": "1"}, {"gid": 2}], [], {},
+]
+
+
+def generate_value(schema, rnd, depth=0):
+    """Generate a value mostly matching the schema, sometimes any sample value"""
+    if depth > 4 or rnd.random() < 0.03:
+        return rnd.choice(SAMPLE_VALUES)
+    if "anyOf" in schema:
+        return generate_value(rnd.choice(schema["anyOf"]), rnd, depth)
+    types = schema.get("type", [])
+    types = types if isinstance(types, list) else [types]
+    typ = rnd.choice(types) if types else "string"
+    if typ == "object":
+        record = {key: generate_value(sub_schema, rnd, depth + 1)
+                  for key, sub_schema in schema.get("properties", {}).items() if rnd.random() < 0.8}
+        if rnd.random() < 0.2:
+            record["unknown_field"] = "value"
+        return record
+    if typ == "array":
+        return [generate_value(schema.get("items", {}), rnd, depth + 1) for _ in range(rnd.randint(0, 3))]
+    if schema.get("format") == "date-time":
+        return rnd.choice(["2021-0{}-1{}T0{}:00:00.{}Z".format(rnd.randint(1, 9), rnd.randint(0, 9),
+                                                                rnd.randint(0, 9), rnd.randint(0, 999)),
+                           "2021-01-01T00:00:00Z", None])
+    return rnd.choice({"string": ["a", "", 5, None], "boolean": [True, False, "false", None],
+                       "integer": [1, "2,000"], "number": [1.5, "3"], "null": [None]}.get(typ, [None]))
+
+
+def get_metadata(stream_name, schema, rnd):
+    """Return the discovered metadata of the stream with random fields deselected"""
+    mdata = metadata.to_map(tap_asana.get_discovery_metadata(Context.stream_objects[stream_name](), schema))
+    for breadcrumb in list(mdata):
+        if breadcrumb and rnd.random() < 0.3:
+            mdata[breadcrumb]["selected"] = False
+    # Deselecting a field below an object field
+    mdata[("properties", "workspace", "properties", "name")] = {"selected": False}
+    return mdata
+
+
+def transform_with_singer(records, schema, mdata):
+    results = []
+    with Transformer() as transformer:
+        for record in records:
+            try:
+                results.append(transformer.transform(record, schema, mdata))
+            except SchemaMismatch:
+                results.append(SchemaMismatch)
+    return results, transformer
+
+
+def transform_compiled(records, schema, mdata):
+    results = []
+    with StreamTransformer(schema, mdata) as transformer:
+        for record in records:
+            try:
+                results.append(transformer.transform_record(record))
+            except SchemaMismatch:
+                results.append(SchemaMismatch)
+    return results, transformer
+
+
+class TestStreamTransformer(unittest.TestCase):
+
+    @parameterized.expand(sorted(STREAM_NAMES))
+    def test_same_output_as_singer_transformer(self, stream_name):
+        """Verify that the compiled transformer returns the same records as singer's Transformer"""
+        rnd = random.Random(stream_name)
+        schema = tap_asana.load_schema(stream_name)
+        mdata = get_metadata(stream_name, schema, rnd)
+        records = [generate_value({"type": "object", "properties": schema["properties"]}, rnd, depth=1)
+                   for _ in range(100)]
+
+        expected, singer_transformer = transform_with_singer(copy.deepcopy(records), copy.deepcopy(schema), mdata)
+        results, compiled_transformer = transform_compiled(copy.deepcopy(records), schema, mdata)
+
+        self.assertEqual(results, expected)
+        self.assertIn(SchemaMismatch, results)
+        self.assertEqual(compiled_transformer.removed, singer_transformer.removed)
+        self.assertEqual(compiled_transformer.filtered, singer_transformer.filtered)
+        self.assertEqual([(error.path, error.data) for error in compiled_transformer.errors],
+                         [(error.path, error.data) for error in singer_transformer.errors])
+
+    @parameterized.expand([
+        ["milliseconds", "2021-01-01T12:30:45.123Z", "2021-01-01T12:30:45.123000Z"],
+        ["seconds", "2021-01-01T12:30:45Z", "2021-01-01T12:30:45.000000Z"],
+        ["invalid_day", "2021-02-30T00:00:00.000Z", None],
+        ["offset", "2021-01-01T12:30:45+05:30", "2021-01-01T07:00:45.000000Z"],
+        ["empty", "", None],
+    ])
+    def test_transform_datetime(self, name, value, expected):
+        """Verify the date-time formatting of Asana's and other formats"""
+        self.assertEqual(transform_datetime(value), expected)
+
+    def test_automatic_field_not_filtered(self):
+        """Verify that the fields of an automatic field are kept even if deselected"""
+        schema = {"type": "object", "properties": {"gid": {"type": ["null", "object"], "properties": {
+            "name": {"type": ["null", "string"]}}}}}
+        mdata = {("properties", "gid"): {"inclusion": "automatic"},
+                 ("properties", "gid", "properties", "name"): {"selected": False}}
+
+        record = StreamTransformer(schema, mdata).transform_record({"gid": {"name": "kept"}})
+
+        self.assertEqual(record, {"gid": {"name": "kept"}})
+
+
+class TestExtractionClock(unittest.TestCase):
+
+    @mock.patch("tap_asana.transform.utils.now", side_effect=["first", "second"])
+    @mock.patch("tap_asana.transform.time.monotonic", side_effect=[10.0, 10.5, 11.0])
+    def test_time_read_once_per_second(self, mocked_monotonic, mocked_now):
+        """Verify that the extraction time is read again only after the resolution has passed"""
+        clock = ExtractionClock()
+
+        self.assertEqual([clock.now(), clock.now(), clock.now()], ["first", "first", "second"])
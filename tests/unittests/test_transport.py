@@ -0,0 +1,78 @@
+import gzip
+import json
+import os
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from tap_asana.asana import Asana
+from tap_asana.context import Context
+from tap_asana.rate_limit import RateLimiter
+
+BODY = json.dumps({"data": [{"gid": str(i), "name": "Task {}".format(i), "completed": False}
+                            for i in range(200)]}).encode()
+
+
+class GzipHandler(BaseHTTPRequestHandler):
+    """Keep-alive handler returning BODY, gzipped when the client accepts it"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        body = BODY
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@mock.patch("tap_asana.asana.Asana.refresh_access_token")
+class TestTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), GzipHandler)
+        self.server.daemon_threads = True
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = "http://127.0.0.1:{}/api/1.0/tasks".format(self.server.server_port)
+        self.addCleanup(setattr, Context, "rate_limiter", None)
+        # The local server is plain HTTP
+        patcher = mock.patch.dict(os.environ, {"OAUTHLIB_INSECURE_TRANSPORT": "1"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_gzip_responses_counted(self, mocked_refresh_access_token):
+        """Verify that responses are requested gzipped and both their sizes are counted"""
+        asana = Asana('test', 'test', 'test', 'test', 'test')
+
+        response = asana.client.session.get(self.url)
+
+        self.assertEqual(response.json(), json.loads(BODY))
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        stats = asana.transport.stats
+        self.assertEqual(stats.requests, 1)
+        self.assertEqual(stats.bytes_decoded, len(BODY))
+        self.assertEqual(stats.bytes_received, int(response.headers["Content-Length"]))
+        self.assertLess(stats.bytes_received * 5, stats.bytes_decoded)
+
+    def test_connections_reused(self, mocked_refresh_access_token):
+        """Verify that concurrent requests open no more connections than may be in flight"""
+        Context.rate_limiter = RateLimiter(max_concurrent=4)
+        asana = Asana('test', 'test', 'test', 'test', 'test')
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            responses = list(executor.map(lambda _: asana.client.session.get(self.url), range(80)))
+
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        self.assertEqual(asana.transport._pool_maxsize, 4)
+        self.assertEqual(asana.transport.stats.requests, 80)
+        self.assertLessEqual(asana.transport.get_connections_opened(), 4)
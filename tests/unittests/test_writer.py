@@ -0,0 +1,170 @@
+import datetime
+import decimal
+import io
+import json
+import queue
+import unittest
+from unittest import mock
+import pytz
+import singer
+from tap_asana.writer import Writer, QueueWriter, BUFFER_SIZE, STATE_INTERVAL_RECORDS
+
+RECORDS = [
+    {"gid": "1", "name": "Tâche ✓", "num": decimal.Decimal("1.10"), "done": False, "tags": [{"gid": "2"}],
+     "notes": "line\nbreak \"quoted\"", "empty": None, "float": 2.5},
+    {},
+]
+TIMES = [
+    None,
+    datetime.datetime(2021, 1, 1, 12, 30, 45, 123456, tzinfo=pytz.UTC),
+    datetime.datetime(2021, 1, 1, 12, 30, 45, tzinfo=datetime.timezone(datetime.timedelta(hours=5))),
+]
+
+
+def write_with_singer(fnc, *args, **kwargs):
+    with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+        fnc(*args, **kwargs)
+    return stdout.getvalue()
+
+
+@mock.patch("sys.stdout", new_callable=io.StringIO)
+class TestWriter(unittest.TestCase):
+
+    def test_same_bytes_as_singer(self, mocked_stdout):
+        """Verify that the messages are written exactly as singer writes them"""
+        writer = Writer()
+        expected = write_with_singer(singer.write_schema, "tasks", {"type": "object"}, ["gid"])
+        writer.write_schema("tasks", {"type": "object"}, ["gid"])
+        for record in RECORDS:
+            for time_extracted in TIMES:
+                for stream_id in ["tasks", "stream \"quoted\""]:
+                    expected += write_with_singer(singer.write_record, stream_id, record,
+                                                  time_extracted=time_extracted)
+                    writer.write_record(stream_id, record, time_extracted=time_extracted)
+        state = {"bookmarks": {"tasks": {"modified_at": "2021-01-01T00:00:00Z"}}}
+        expected += write_with_singer(singer.write_state, state)
+        writer.write_state(state)
+
+        self.assertEqual(mocked_stdout.getvalue(), expected)
+
+    def test_records_flushed_with_state(self, mocked_stdout):
+        """Verify that records are held in the buffer until a STATE message is written"""
+        writer = Writer()
+        writer.write_record("tasks", {"gid": "1"})
+
+        self.assertEqual(mocked_stdout.getvalue(), "")
+        writer.write_state({"bookmarks": {}})
+        self.assertEqual(mocked_stdout.getvalue().splitlines(), [
+            '{"type": "RECORD", "stream": "tasks", "record": {"gid": "1"}}',
+            '{"type": "STATE", "value": {"bookmarks": {}}}'])
+
+    def test_full_buffer_flushed(self, mocked_stdout):
+        """Verify that the buffer is written once it holds BUFFER_SIZE characters"""
+        writer = Writer()
+        record = {"notes": "x" * 1000}
+        while not mocked_stdout.getvalue():
+            writer.write_record("tasks", record)
+
+        self.assertGreaterEqual(len(mocked_stdout.getvalue()), BUFFER_SIZE)
+        self.assertLess(len(mocked_stdout.getvalue()), BUFFER_SIZE + 1100)
+        self.assertEqual(writer.buffer, [])
+
+    @mock.patch("tap_asana.writer.time.monotonic", side_effect=[100, 100, 100.5, 101, 101])
+    def test_buffer_flushed_on_timer(self, mocked_monotonic, mocked_stdout):
+        """Verify that buffered records are written once FLUSH_INTERVAL has passed since the last flush"""
+        writer = Writer()
+        writer.write_record("tasks", {"gid": "1"})
+        self.assertEqual(mocked_stdout.getvalue(), "")
+
+        writer.write_record("tasks", {"gid": "2"})
+
+        self.assertEqual(len(mocked_stdout.getvalue().splitlines()), 2)
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+
+@mock.patch("sys.stdout", new_callable=io.StringIO)
+class TestStateCoalescing(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch("tap_asana.writer.time.monotonic", side_effect=self.clock.monotonic)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def get_messages(stdout):
+        return [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+    def test_state_written_every_n_records(self, mocked_stdout):
+        """Verify that state updates are coalesced into one STATE message per `state_interval_records` records"""
+        writer = Writer(state_interval_records=3, state_interval_seconds=60)
+        state = {"bookmarks": {"tasks": {"modified_at": 0}}}
+        for i in range(1, 8):
+            writer.write_record("tasks", {"gid": i})
+            state["bookmarks"]["tasks"]["modified_at"] = i
+            writer.update_state(state)
+        writer.flush()
+
+        messages = self.get_messages(mocked_stdout)
+        self.assertEqual([(msg["type"], msg.get("record", msg.get("value"))) for msg in messages], [
+            ("RECORD", {"gid": 1}), ("RECORD", {"gid": 2}), ("RECORD", {"gid": 3}),
+            ("STATE", {"bookmarks": {"tasks": {"modified_at": 2}}}),
+            ("RECORD", {"gid": 4}), ("RECORD", {"gid": 5}), ("RECORD", {"gid": 6}),
+            ("STATE", {"bookmarks": {"tasks": {"modified_at": 5}}}),
+            ("RECORD", {"gid": 7})])
+
+    def test_state_written_after_interval(self, mocked_stdout):
+        """Verify that a pending state is written once `state_interval_seconds` have passed"""
+        writer = Writer(state_interval_records=1000, state_interval_seconds=30)
+        writer.update_state({"bookmarks": {"tasks": {"modified_at": 1}}})
+        self.clock.now += 10
+        writer.write_record("tasks", {"gid": 2})
+        writer.flush()
+        self.assertEqual([msg["type"] for msg in self.get_messages(mocked_stdout)], ["RECORD"])
+
+        self.clock.now += 20
+        writer.write_record("tasks", {"gid": 3})
+
+        self.assertEqual([msg["type"] for msg in self.get_messages(mocked_stdout)], ["RECORD", "RECORD", "STATE"])
+
+    def test_queue_writer_forwards_state_after_interval(self, mocked_stdout):
+        """Verify that a worker's pending state is forwarded once `state_interval_seconds` have passed"""
+        messages = queue.Queue()
+        writer = QueueWriter(messages, "tasks", state_interval_records=1000, state_interval_seconds=30)
+        writer.update_state({"bookmarks": {"tasks": {"modified_at": 1}}})
+        self.clock.now += 10
+        writer.write_record("tasks", {"gid": 2})
+        self.clock.now += 20
+        writer.write_record("tasks", {"gid": 3})
+
+        self.assertEqual([messages.get_nowait() for _ in range(messages.qsize())], [
+            ("record", "tasks", ({"gid": 2}, None)), ("record", "tasks", ({"gid": 3}, None)),
+            ("state", "tasks", {"modified_at": 1})])
+
+    def test_write_state_writes_pending_state(self, mocked_stdout):
+        """Verify that `write_state` at a stream boundary replaces the pending state"""
+        writer = Writer(state_interval_records=1000, state_interval_seconds=30)
+        writer.update_state({"bookmarks": {"tasks": {"modified_at": 1}}})
+        writer.write_state({"bookmarks": {"tasks": {"modified_at": 2}}})
+        writer.write_record("tasks", {"gid": 3})
+        self.clock.now += 60
+        writer.write_record("tasks", {"gid": 4})
+        writer.flush()
+
+        messages = self.get_messages(mocked_stdout)
+        self.assertEqual([msg["type"] for msg in messages], ["STATE", "RECORD", "RECORD"])
+        self.assertEqual(messages[0]["value"], {"bookmarks": {"tasks": {"modified_at": 2}}})
+
+    def test_from_config(self, mocked_stdout):
+        """Verify that the state intervals are read from the config"""
+        writer = Writer.from_config({"state_interval_records": "50", "state_interval_seconds": "5"})
+
+        self.assertEqual((writer.state_interval_records, writer.state_interval_seconds), (50, 5))
+        self.assertEqual(Writer.from_config({}).state_interval_records, STATE_INTERVAL_RECORDS)